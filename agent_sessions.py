@@ -0,0 +1,120 @@
+"""
+Bedrock Agent session reuse and trace timing.
+
+invoke_agent keeps conversation memory and warm state per sessionId. Instead of
+a new random session per call, AgentSessionPool maps each conversation
+(ChatHandler.session_id) to one agent session and keeps it while the
+conversation is active. A session idle for longer than `idle_seconds` (the
+agent's own idle TTL, 600 seconds by default) is dropped and the next turn
+starts a new one.
+
+AgentTrace collects the trace events invoke_agent emits with enableTrace=True
+(pre-processing, orchestration steps, knowledge base and action group calls,
+post-processing) with their arrival times, so the time spent in each step can
+be shown and recorded:
+
+    agent_sessions_created / agent_sessions_reused
+    agent_sessions_active                   gauge
+    agent_step_seconds{step}                time from the previous trace event to this one
+    agent_time_to_first_chunk_seconds
+"""
+
+import threading
+import time
+import uuid
+
+from metrics import metrics as default_metrics
+
+
+class AgentSessionPool:
+    """
+    Conversation id -> Bedrock Agent session id, with idle expiry.
+
+    Args:
+        idle_seconds (float): Idle time after which a session is not reused;
+            keep it at or below the agent's idleSessionTTLInSeconds
+    """
+
+    def __init__(self, idle_seconds=600.0, registry=None, clock=time.monotonic):
+        self.idle_seconds = idle_seconds
+        self.metrics = registry or default_metrics
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    def _expire(self, now):
+        for conversation_id, (_, last_used) in list(self._sessions.items()):
+            if now - last_used > self.idle_seconds:
+                del self._sessions[conversation_id]
+
+    def session_for(self, conversation_id):
+        """Agent session id for a conversation: the current one, or a new one if it expired."""
+        now = self.clock()
+        with self._lock:
+            self._expire(now)
+            entry = self._sessions.get(conversation_id)
+            if entry is None:
+                session_id = 'session-' + str(uuid.uuid4())
+                self.metrics.increment("agent_sessions_created")
+            else:
+                session_id = entry[0]
+                self.metrics.increment("agent_sessions_reused")
+            self._sessions[conversation_id] = (session_id, now)
+            self.metrics.set_gauge("agent_sessions_active", len(self._sessions))
+        return session_id
+
+    def end(self, conversation_id):
+        """Forget a conversation's session (e.g. when the user clears the chat)."""
+        with self._lock:
+            self._sessions.pop(conversation_id, None)
+            self.metrics.set_gauge("agent_sessions_active", len(self._sessions))
+
+
+def trace_step_name(trace_event):
+    """Step name of an invoke_agent trace event, e.g. "orchestrationTrace.invocationInput:KNOWLEDGE_BASE"."""
+    trace = trace_event.get("trace", {})
+    if not trace:
+        return "unknown"
+    kind = next(iter(trace))
+    detail = trace[kind]
+    if not isinstance(detail, dict) or not detail:
+        return kind
+    part = next(iter(detail))
+    step = f"{kind}.{part}"
+    invocation_type = detail[part].get("invocationType") if isinstance(detail[part], dict) else None
+    return f"{step}:{invocation_type}" if invocation_type else step
+
+
+class AgentTrace:
+    """
+    Trace events of one invoke_agent call with their arrival times.
+    Pass it as on_trace to stream_agent_response.
+    """
+
+    def __init__(self, registry=None, clock=time.monotonic):
+        self.metrics = registry or default_metrics
+        self.clock = clock
+        self.started_at = clock()
+        self.first_chunk_at = None
+        self.events = []
+
+    def __call__(self, trace_event):
+        now = self.clock() - self.started_at
+        step = trace_step_name(trace_event)
+        previous = self.events[-1][0] if self.events else 0.0
+        self.events.append((now, step, trace_event))
+        self.metrics.observe("agent_step_seconds", now - previous, step=step)
+
+    def chunk_received(self):
+        if self.first_chunk_at is None:
+            self.first_chunk_at = self.clock() - self.started_at
+            self.metrics.observe("agent_time_to_first_chunk_seconds", self.first_chunk_at)
+
+    def timings(self):
+        """One row per trace event: step, seconds since the call started, seconds since the previous event."""
+        rows = []
+        previous = 0.0
+        for at, step, _ in self.events:
+            rows.append({"step": step, "at_seconds": round(at, 3), "seconds": round(at - previous, 3)})
+            previous = at
+        return rows
@@ -0,0 +1,285 @@
+"""
+Evaluation analytics over response and judge records.
+
+Loads the JSON records written by answer_query (report mode) and the LLM judge
+runs into a pandas DataFrame with numeric columns, then computes per-model /
+per-mode score means, latency percentiles, bootstrap confidence intervals and
+pairwise model comparisons with NumPy, and renders a compact Markdown or HTML
+report.
+"""
+
+import io
+import json
+import math
+import re
+from concurrent.futures import ThreadPoolExecutor
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+from utils import list_json_files_in_s3_folder
+
+SCORE_FIELDS = ["helpfulness", "accuracy", "clarity", "tone", "conciseness"]
+FRAME_COLUMNS = ["model", "mode", "cohort_tag", "latency_s", *SCORE_FIELDS, "overall_score", "total_urls", "valid_urls"]
+
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$", re.IGNORECASE)
+_SCORE_LINE_RE = re.compile(
+    r"\b(" + "|".join(SCORE_FIELDS) + r")\b[\"']?\s*[:=]\s*\"?(\d+(?:\.\d+)?)",
+    re.IGNORECASE
+)
+
+
+def parse_judge_scores(judge_output):
+    """
+    Extract the 1-5 criteria scores from a judge output.
+
+    Handles the parsed JSON object stored by build_json_string, a JSON string
+    (optionally wrapped in ``` fences) and the plain "Helpfulness: 4" report format.
+
+    Args:
+        judge_output (dict | str | None): Judge output
+
+    Returns:
+        dict: Mapping of score field to float (missing fields are NaN)
+    """
+    scores = {field: np.nan for field in SCORE_FIELDS}
+    if judge_output is None:
+        return scores
+
+    data = judge_output
+    if isinstance(data, str):
+        try:
+            data = json.loads(_FENCE_RE.sub("", data.strip()))
+        except json.JSONDecodeError:
+            pass
+
+    if isinstance(data, dict):
+        source = data.get("scores", data)
+        if isinstance(source, dict):
+            lowered = {str(k).lower(): v for k, v in source.items()}
+            for field in SCORE_FIELDS:
+                try:
+                    scores[field] = float(lowered[field])
+                except (KeyError, TypeError, ValueError):
+                    pass
+        return scores
+
+    for field, value in _SCORE_LINE_RE.findall(str(data)):
+        scores[field.lower()] = float(value)
+    return scores
+
+
+def parse_latency_seconds(values):
+    """
+    Vectorized parse of "Elapsed time: 3.2145 seconds" strings to float seconds.
+
+    Args:
+        values (pd.Series): Raw timetorun / runttime values
+
+    Returns:
+        pd.Series: Latency in seconds (NaN where unparseable)
+    """
+    extracted = values.astype("string").str.extract(r"(\d+(?:\.\d+)?)", expand=False)
+    return pd.to_numeric(extracted, errors="coerce")
+
+
+def load_records_from_s3(s3_client, bucket_name, prefix, max_threads=30):
+    """Download every JSON record under an S3 prefix."""
+    keys = list_json_files_in_s3_folder(s3_client, bucket_name, prefix)
+
+    def fetch(key):
+        obj = s3_client.get_object(Bucket=bucket_name, Key=key)
+        try:
+            return json.loads(obj['Body'].read().decode('utf-8'))
+        except json.JSONDecodeError:
+            print(f"Error decoding JSON in file: {key}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=max_threads) as executor:
+        return [record for record in executor.map(fetch, keys) if record is not None]
+
+
+def records_to_frame(records):
+    """
+    Normalize response and judge records into one analysis DataFrame.
+
+    Judge records (bot_type "assess") are keyed by the assessed model/mode; plain
+    response records by their own model/bot_type.
+
+    Returns:
+        pd.DataFrame: Columns model, mode, cohort_tag, latency_s, one column per
+        score field, overall_score, total_urls and valid_urls (empty if there are no records)
+    """
+    if not records:
+        return pd.DataFrame(columns=FRAME_COLUMNS)
+    df = pd.DataFrame.from_records(records)
+    for column in ("model", "bot_type", "cohort_tag", "response_model", "response_mode",
+                   "timetorun", "runttime", "response"):
+        if column not in df.columns:
+            df[column] = None
+
+    is_judge = df["bot_type"].eq("assess") | df["response_model"].notna()
+    frame = pd.DataFrame({
+        "model": df["response_model"].where(is_judge, df["model"]),
+        "mode": df["response_mode"].where(is_judge, df["bot_type"]),
+        "cohort_tag": df["cohort_tag"],
+        "latency_s": parse_latency_seconds(df["runttime"].where(is_judge, df["timetorun"])),
+    })
+
+    judge_outputs = df["response"].where(is_judge, None)
+    scores = pd.DataFrame.from_records(
+        [parse_judge_scores(value) for value in judge_outputs],
+        index=df.index, columns=SCORE_FIELDS
+    )
+    frame = pd.concat([frame, scores], axis=1)
+    frame["overall_score"] = scores.mean(axis=1)
+
+    urls = pd.json_normalize([value if isinstance(value, dict) else {} for value in judge_outputs])
+    for column, path in (("total_urls", "urls.totalURLs"), ("valid_urls", "urls.validURLs")):
+        frame[column] = pd.to_numeric(urls[path], errors="coerce").to_numpy() if path in urls else np.nan
+    return frame
+
+
+def summarize(frame, by=("model", "mode")):
+    """
+    Per-group score means and latency percentiles.
+
+    Returns:
+        pd.DataFrame: One row per group with n, mean scores, latency mean/p50/p95/p99
+    """
+    by = list(by)
+    grouped = frame.groupby(by, dropna=False)
+    summary = grouped[SCORE_FIELDS + ["overall_score"]].mean()
+    summary.insert(0, "n", grouped.size())
+    latency = grouped["latency_s"]
+    summary["latency_mean"] = latency.mean()
+    for q in (0.50, 0.95, 0.99):
+        summary[f"latency_p{int(q * 100)}"] = latency.quantile(q)
+    return summary
+
+
+def _bootstrap_means(values, n_boot, rng, max_cells=5_000_000):
+    """Bootstrap sample means of a 1-D array, resampling in chunks to bound memory."""
+    n = len(values)
+    chunk = max(1, min(n_boot, max_cells // max(n, 1)))
+    means = np.empty(n_boot)
+    for start in range(0, n_boot, chunk):
+        size = min(chunk, n_boot - start)
+        idx = rng.integers(0, n, size=(size, n))
+        means[start:start + size] = values[idx].mean(axis=1)
+    return means
+
+
+def bootstrap_ci(frame, value_col="overall_score", by=("model", "mode"), n_boot=1000, alpha=0.05, seed=0):
+    """
+    Percentile bootstrap confidence interval of the mean per group.
+
+    Returns:
+        pd.DataFrame: One row per group with n, mean, ci_low, ci_high
+    """
+    rng = np.random.default_rng(seed)
+    rows = []
+    for group, values in frame.groupby(list(by), dropna=False)[value_col]:
+        values = values.dropna().to_numpy(dtype=float)
+        if len(values) == 0:
+            continue
+        means = _bootstrap_means(values, n_boot, rng)
+        low, high = np.quantile(means, [alpha / 2, 1 - alpha / 2])
+        rows.append((*group, len(values), values.mean(), low, high))
+    return pd.DataFrame(rows, columns=[*by, "n", "mean", "ci_low", "ci_high"]).set_index(list(by))
+
+
+def compare_models(frame, value_col="overall_score", n_boot=1000, alpha=0.05, seed=0):
+    """
+    Pairwise model comparison on a metric.
+
+    For every pair of models reports the difference in means, a bootstrap CI of
+    the difference and a Welch t-test p-value (normal approximation).
+
+    Returns:
+        pd.DataFrame: One row per (model_a, model_b) pair
+    """
+    rng = np.random.default_rng(seed)
+    samples = {
+        model: values.dropna().to_numpy(dtype=float)
+        for model, values in frame.groupby("model")[value_col]
+    }
+    boot = {model: _bootstrap_means(values, n_boot, rng) for model, values in samples.items() if len(values)}
+
+    rows = []
+    for a, b in combinations(sorted(boot), 2):
+        x, y = samples[a], samples[b]
+        diff = x.mean() - y.mean()
+        low, high = np.quantile(boot[a] - boot[b], [alpha / 2, 1 - alpha / 2])
+        se = math.sqrt(x.var(ddof=1) / len(x) + y.var(ddof=1) / len(y)) if len(x) > 1 and len(y) > 1 else float("nan")
+        p_value = math.erfc(abs(diff / se) / math.sqrt(2)) if se and not math.isnan(se) else float("nan")
+        rows.append((a, b, len(x), len(y), diff, low, high, p_value))
+    return pd.DataFrame(rows, columns=["model_a", "model_b", "n_a", "n_b", "diff", "ci_low", "ci_high", "p_value"])
+
+
+def _markdown_table(df):
+    if not isinstance(df.index, pd.RangeIndex):
+        df = df.reset_index()
+    cells = [[f"{v:.3f}" if isinstance(v, float) else str(v) for v in row] for row in df.itertuples(index=False)]
+    lines = ["| " + " | ".join(map(str, df.columns)) + " |", "|" + "---|" * len(df.columns)]
+    lines += ["| " + " | ".join(row) + " |" for row in cells]
+    return "\n".join(lines)
+
+
+def render_report(frame, fmt="markdown", n_boot=1000, seed=0):
+    """
+    Render the quality vs. latency report.
+
+    Args:
+        frame (pd.DataFrame): Output of records_to_frame
+        fmt (str): "markdown" or "html"
+
+    Returns:
+        str: Report text; without records, a report that says so
+    """
+    if frame.empty:
+        message = "No records found; nothing to report."
+        if fmt == "html":
+            return f"<html><body><h1>Evaluation report</h1>\n<p>{message}</p>\n</body></html>\n"
+        return f"# Evaluation report\n\nRecords: 0\n\n{message}\n"
+
+    sections = [
+        ("Scores and latency by model and mode", summarize(frame)),
+        ("Overall score 95% bootstrap CI", bootstrap_ci(frame, n_boot=n_boot, seed=seed)),
+        ("Latency 95% bootstrap CI (seconds)", bootstrap_ci(frame, value_col="latency_s", n_boot=n_boot, seed=seed)),
+        ("Pairwise model comparison (overall score)", compare_models(frame, n_boot=n_boot, seed=seed)),
+    ]
+    if fmt == "html":
+        buffer = io.StringIO()
+        buffer.write("<html><body><h1>Evaluation report</h1>\n")
+        for title, table in sections:
+            html = table.to_html(index=not isinstance(table.index, pd.RangeIndex), float_format=lambda v: f"{v:.3f}")
+            buffer.write(f"<h2>{title}</h2>\n{html}\n")
+        buffer.write("</body></html>\n")
+        return buffer.getvalue()
+
+    parts = ["# Evaluation report", f"Records: {len(frame)}"]
+    for title, table in sections:
+        parts.append(f"## {title}\n\n{_markdown_table(table)}")
+    return "\n\n".join(parts) + "\n"
+
+
+def build_evaluation_report(s3_client, bucket_name, prefix, s3_output_uri=None, fmt="markdown"):
+    """
+    Load records under an S3 prefix, render the report and optionally upload it.
+
+    Returns:
+        str: Report text
+    """
+    frame = records_to_frame(load_records_from_s3(s3_client, bucket_name, prefix))
+    report = render_report(frame, fmt=fmt)
+
+    if s3_output_uri:
+        output_match = re.match(r's3://([^/]+)/(.+)', s3_output_uri)
+        if not output_match:
+            raise ValueError("Invalid output S3 URI format. Expected format: s3://bucket-name/path/to/report.md")
+        output_bucket, output_key = output_match.groups()
+        s3_client.put_object(Bucket=output_bucket, Key=output_key, Body=report.encode('utf-8'))
+        print(f"Report has been uploaded to s3://{output_bucket}/{output_key}")
+    return report
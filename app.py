@@ -6,13 +6,36 @@ that integrates with various AWS services and OpenAI.
 
 import streamlit as st
 import boto3
-from utils import ChatHandler, answer_query, assess_answer_query
+import traceback
+import uuid
+from utils import ChatHandler, answer_query, answer_query_agent_stream, assess_answer_query, compare_models, end_agent_session
+from agent_sessions import AgentTrace
+from circuit_breaker import model_provider_name
+from progress import STAGE_QUEUED, AnswerProgress, submit_with_progress
+from background_judge import judge_in_background
+from deadline import AGENT_READ_TIMEOUT_SECONDS, Deadline, OPENAI_TIMEOUT_SECONDS, bedrock_client_config
+from hedging import get_default_hedge_policy
+from cascade import AUTO_MODEL_ID
+from region_pool import get_shared_pool
+from language import get_language_detector
 import toml
 from pathlib import Path
 import os
 import openai
 
 
+# LLM Model choice -> secret holding its model id
+MODEL_SECRETS = {
+    "Nova Pro": "model_id_1",
+    "Nova Micro": "model_id_2",
+    "claude-3-5-haiku": "model_id_3",
+    "claude-3-5-sonnet": "model_id_4",
+    "gpt-4-turbo": "model_id_5",
+    "gpt-4o": "model_id_6",
+    "Agent": "agent_id_1"
+}
+
+
 def process_streamlit_cloud_secrets():
     """Process secrets when running on Streamlit Cloud."""
     for key, value in st.secrets.items():
@@ -80,6 +103,10 @@ def load_environment_secrets():
 def initialize_aws_clients():
     """
     Initialize AWS service clients using credentials from Streamlit secrets.
+
+    bedrock is a RegionalClientPool over AWS_DEFAULT_REGION plus any regions in the
+    optional BEDROCK_REGIONS secret (list or comma-separated); BEDROCK_ENDPOINT_OVERRIDES
+    maps regions to endpoint URLs, e.g. local stubs.
     
     Returns:
         tuple: (bedrock_client, bedrock_agent_runtime_client, s3_client)
@@ -97,19 +124,27 @@ def initialize_aws_clients():
         region_name=region_name
     )
 
-    bedrock = session.client(
-        'bedrock-runtime',
-        region_name,
-        endpoint_url=endpoint_url
+    extra_regions = st.secrets.get("BEDROCK_REGIONS", [])
+    if isinstance(extra_regions, str):
+        extra_regions = [region.strip() for region in extra_regions.split(",") if region.strip()]
+    regions = [region_name] + [region for region in extra_regions if region != region_name]
+    endpoint_overrides = {region_name: endpoint_url, **dict(st.secrets.get("BEDROCK_ENDPOINT_OVERRIDES", {}))}
+
+    bedrock = get_shared_pool(
+        regions,
+        session=session,
+        endpoint_overrides=endpoint_overrides,
+        config=bedrock_client_config()
     )
     
-    bedrock_agent_runtime = boto3.client('bedrock-agent-runtime')
+    bedrock_agent_runtime = boto3.client('bedrock-agent-runtime', config=bedrock_client_config(read_timeout=AGENT_READ_TIMEOUT_SECONDS))
     
     s3 = boto3.client(
         's3',
         region_name=region_name,
         aws_access_key_id=aws_access_key_id,
-        aws_secret_access_key=aws_secret_access_key
+        aws_secret_access_key=aws_secret_access_key,
+        config=bedrock_client_config(read_timeout=10)
     )
 
     return bedrock, bedrock_agent_runtime, s3
@@ -123,13 +158,14 @@ def initialize_openai_client():
         OpenAI: Initialized OpenAI client
     """
     openai_api_key = st.secrets["OPENAI_API_KEY"]
-    return openai.OpenAI(api_key=openai_api_key)
+    return openai.OpenAI(api_key=openai_api_key, timeout=OPENAI_TIMEOUT_SECONDS, max_retries=1)
 
 def initialize_session_state():
     """Initialize the session state and chat handler."""
     if 'initialized' not in st.session_state:
         st.session_state.initialized = True
-        st.session_state.chat_handler = ChatHandler()
+        st.session_state.conversation_id = str(uuid.uuid4())
+        st.session_state.chat_handler = ChatHandler(session_id=st.session_state.conversation_id)
         st.rerun()
         st.cache_data.clear()
         st.cache_resource.clear()
@@ -146,6 +182,10 @@ def setup_sidebar():
         st.image("WashSymbol.jpg", width=300, use_container_width=True)
         st.title("Hello! I'm Wa-Bot - v0.9")
         report_mode = st.checkbox("Report Mode", key="report_mode", value=True)
+        st.checkbox("Hedge slow responses", key="hedging", value=False,
+                    help="If the model is slower than usual, also ask a backup model and use whichever answers first")
+        st.checkbox("Judge answers in background", key="auto_judge", value=False,
+                    help="After each answer, score it with the LLM judge without waiting for it; the score appears under the answer")
 
         selected_mode = st.radio(
             "Wa-Bot mode",
@@ -154,16 +194,27 @@ def setup_sidebar():
             help="Select the ENA focus area"
         )
 
+        # The default is "Auto" (the Nova Micro -> Sonnet cascade), not Nova Pro as before.
         selected_model = st.radio(
             "LLM Model",
-            ("Nova Pro", "Nova Micro", "claude-3-5-haiku",
-             "claude-3-5-sonnet", "gpt-4-turbo", "gpt-4o"),
+            ("Auto", "Nova Pro", "Nova Micro", "claude-3-5-haiku",
+             "claude-3-5-sonnet", "gpt-4-turbo", "gpt-4o", "Agent"),
             index=0,
-            help="Select the LLM model"
+            help="Select the LLM model. Auto answers with Nova Micro and escalates to Claude 3.5 Sonnet when the answer looks unreliable"
+        )
+
+        st.multiselect(
+            "Compare models",
+            list(MODEL_SECRETS),
+            key="compare_models",
+            help="Pick two or more models to ask each question to all of them side by side (one shared retrieval)"
         )
 
         if st.button("🧹", help="Clear conversation"):
-            st.session_state.chat_handler = ChatHandler()
+            end_agent_session(st.session_state.chat_handler)
+            st.session_state.pop("judgements", None)
+            st.session_state.conversation_id = str(uuid.uuid4())
+            st.session_state.chat_handler = ChatHandler(session_id=st.session_state.conversation_id)
             st.rerun()
             st.cache_data.clear()
             st.cache_resource.clear()
@@ -210,18 +261,10 @@ def handle_model_selection(model):
     Args:
         model (str): Selected model name
     """
-    model_mapping = {
-        "claude-3-5-haiku": "model_id_3",
-        "Nova Pro": "model_id_1",
-        "Nova Micro": "model_id_2",
-        "claude-3-5-sonnet": "model_id_4",
-        "gpt-4-turbo": "model_id_5",
-        "gpt-4o": "model_id_6",
-        "Agent": "agent_id_1"
-    }
-    
-    if model in model_mapping:
-        st.session_state["model_id"] = st.secrets[model_mapping[model]]
+    if model == "Auto":
+        st.session_state["model_id"] = AUTO_MODEL_ID
+    elif model in MODEL_SECRETS:
+        st.session_state["model_id"] = st.secrets[MODEL_SECRETS[model]]
 
 
 def setup_custom_styling():
@@ -248,10 +291,65 @@ def setup_custom_styling():
     
 
 def display_chat_history():
-    """Display the existing chat history."""
+    """Display the existing chat history, with the judge score under judged answers."""
     for message in st.session_state.chat_handler.get_chat_history():
         with st.chat_message(message.type):
             st.write(message.content)
+            if message.type == "ai" and message.id:
+                render_judgement(message.id)
+
+
+def start_background_judge(answer_id, prompt, response, clients, report_mode):
+    """
+    Judge the answer off the script thread when "Judge answers in background" is on.
+    Judgements are keyed by answer id, so asking the same question twice keeps both.
+    """
+    if not st.session_state.get("auto_judge") or not response:
+        return
+    bedrock, bedrock_agent_runtime, s3, openai_client = clients
+    st.session_state.setdefault("judgements", {})[answer_id] = judge_in_background(
+        prompt,
+        response,
+        st.session_state["model_id"],
+        st.session_state["mode"],
+        bedrock,
+        bedrock_agent_runtime,
+        s3,
+        openai_client,
+        report_mode=report_mode
+    )
+
+
+def show_judgement(judgement):
+    if judgement is None:
+        st.caption("Judge score unavailable")
+        return
+    score = judgement["score"]
+    label = f"Judge score: {score:.1f}/5" if score is not None else "Judge score: n/a"
+    with st.expander(label):
+        if judgement["scores"]:
+            st.table({field.capitalize(): [value] for field, value in judgement["scores"].items()})
+        st.write(judgement["output"])
+        st.caption(f"Judge model: {judgement['judge_model']}")
+
+
+@st.fragment(run_every=1.0)
+def poll_judgement(answer_id):
+    future = st.session_state.get("judgements", {}).get(answer_id)
+    if future is not None and future.done():
+        st.rerun()
+    st.caption("Judging...")
+
+
+def render_judgement(answer_id):
+    """Judge score for the answer: when ready, otherwise a placeholder that polls for it."""
+    future = st.session_state.get("judgements", {}).get(answer_id)
+    if future is None:
+        return
+    if not future.done():
+        poll_judgement(answer_id)
+        return
+    show_judgement(future.result())
 
 
 def process_evaluation_request(clients):
@@ -262,7 +360,12 @@ def process_evaluation_request(clients):
         clients (tuple): Tuple containing necessary client objects
     """
     bedrock, bedrock_agent_runtime, s3, openai_client = clients
-    if "prompt_hold" in st.session_state:
+    judgement = st.session_state.get("judgements", {}).get(st.session_state.get("answer_id_hold"))
+    if judgement is not None:
+        # Already being judged in the background; use that instead of a second judge call.
+        with st.spinner("Waiting for the background judge..."):
+            show_judgement(judgement.result())
+    elif "prompt_hold" in st.session_state:
         output = assess_answer_query(
             st.session_state["prompt_hold"],
             st.session_state["response_hold"],
@@ -280,7 +383,7 @@ def process_evaluation_request(clients):
 
 def generate_ai_response(prompt, clients, report_mode):
     """
-    Generate and display AI response to user input.
+    Start answering the user input in the background (agent answers are streamed inline).
     
     Args:
         prompt (str): User input
@@ -288,30 +391,189 @@ def generate_ai_response(prompt, clients, report_mode):
         report_mode (bool): Whether report mode is enabled
     """
     bedrock, bedrock_agent_runtime, s3, openai_client = clients
+
+    if st.session_state["model_id"] != AUTO_MODEL_ID and model_provider_name(st.session_state["model_id"]) == "bedrock-agent":
+        generate_agent_response(prompt, clients, report_mode)
+        return
     
+    st.session_state.chat_handler = ChatHandler(session_id=st.session_state.conversation_id)
+    st.cache_data.clear()
+    st.cache_resource.clear()
+
+    # Runs on the shared answer executor; the page polls the progress (render_pending_answer),
+    # so this session's script thread is free and other sessions are not held up.
+    st.session_state["pending_answer"] = {
+        "prompt": prompt,
+        "progress": submit_with_progress(
+            answer_query,
+            prompt,
+            st.session_state.chat_handler,
+            bedrock,
+            bedrock_agent_runtime,
+            s3,
+            openai_client,
+            st.session_state["model_id"],
+            st.session_state["kb_id"],
+            st.session_state["mode"],
+            report_mode,
+            cohort='user',
+            batch_mode=False,
+            deadline=Deadline(),
+            hedge_policy=get_default_hedge_policy() if st.session_state.get("hedging") else None
+        ),
+    }
+
+
+@st.fragment(run_every=0.25)
+def poll_pending_answer(clients, report_mode):
+    """Show the pending answer's stage and output so far; on completion rerun the page with it."""
+    pending = st.session_state.get("pending_answer")
+    if pending is None:
+        return
+    state = pending["progress"].snapshot()
+    if not state["done"]:
+        st.caption(f"{state['stage'].capitalize()}... ({state['elapsed_seconds']:.1f}s)")
+        if state["partial"]:
+            st.write(state["partial"])
+        elif state["stage"] == STAGE_QUEUED:
+            st.write("Waiting for a free worker...")
+        return
+
+    del st.session_state["pending_answer"]
+    if state["error"] is not None:
+        st.session_state["answer_error"] = f"Sorry, something went wrong: {state['error']}"
+    else:
+        answer_id = store_interaction(pending["prompt"], state["result"])
+        start_background_judge(answer_id, pending["prompt"], state["result"], clients, report_mode)
+    st.rerun()
+
+
+def render_pending_answer(clients, report_mode):
+    """Render the question being answered in the background, with its live progress."""
+    pending = st.session_state.get("pending_answer")
+    if pending is None:
+        error = st.session_state.pop("answer_error", None)
+        if error:
+            st.error(error)
+        return
+    with st.chat_message("human"):
+        st.write(pending["prompt"])
     with st.chat_message("ai"):
-        with st.spinner("Thinking..."):
-            st.session_state.chat_handler = ChatHandler()
-            st.cache_data.clear()
-            st.cache_resource.clear()
-            
-            response = answer_query(
+        poll_pending_answer(clients, report_mode)
+
+
+def generate_comparison(prompt, clients, report_mode, model_names):
+    """Start asking every selected model the question at once; render_comparison shows the columns."""
+    bedrock, bedrock_agent_runtime, s3, openai_client = clients
+    models = [(name, st.secrets[MODEL_SECRETS[name]]) for name in model_names]
+    model_progress = {model_id: AnswerProgress() for _, model_id in models}
+    st.session_state.chat_handler = ChatHandler(session_id=st.session_state.conversation_id)
+
+    st.session_state["comparison"] = {
+        "prompt": prompt,
+        "models": models,
+        "model_progress": model_progress,
+        "finished": False,
+        "progress": submit_with_progress(
+            compare_models,
+            prompt,
+            [model_id for _, model_id in models],
+            st.session_state.chat_handler,
+            bedrock,
+            bedrock_agent_runtime,
+            s3,
+            openai_client,
+            st.session_state["kb_id"],
+            st.session_state["mode"],
+            report_mode,
+            cohort='user',
+            model_progress=model_progress
+        ),
+    }
+
+
+def render_comparison_columns(comparison):
+    """One column per model: its answer so far, then latency and token counts."""
+    for column, (name, model_id) in zip(st.columns(len(comparison["models"])), comparison["models"]):
+        state = comparison["model_progress"][model_id].snapshot()
+        with column:
+            st.markdown(f"**{name}**")
+            result = state["result"]
+            if result is None:
+                st.caption(f"{state['stage'].capitalize()}... ({state['elapsed_seconds']:.1f}s)")
+                st.write(state["partial"])
+            elif result["error"]:
+                st.error(result["error"])
+            else:
+                st.write(result["output_text"])
+                first_chunk = f"{result['first_chunk_seconds']:.2f}s to first token, " if result["first_chunk_seconds"] is not None else ""
+                tokens = f", {result['input_tokens']} in / {result['output_tokens']} out tokens" if result["output_tokens"] is not None else ""
+                st.caption(f"{first_chunk}{result['latency_seconds']:.2f}s total{tokens}")
+
+
+@st.fragment(run_every=0.25)
+def poll_comparison():
+    comparison = st.session_state.get("comparison")
+    if comparison is None:
+        return
+    render_comparison_columns(comparison)
+    if comparison["progress"].done:
+        comparison["finished"] = True
+        st.rerun()
+
+
+def render_comparison():
+    """Render the current comparison, polling while models are still answering."""
+    comparison = st.session_state.get("comparison")
+    if comparison is None:
+        return
+    with st.chat_message("human"):
+        st.write(comparison["prompt"])
+    with st.chat_message("ai"):
+        if not comparison["finished"]:
+            poll_comparison()
+            return
+        state = comparison["progress"].snapshot()
+        if state["error"] is not None:
+            st.error(f"Sorry, something went wrong: {state['error']}")
+        render_comparison_columns(comparison)
+
+
+def generate_agent_response(prompt, clients, report_mode):
+    """
+    Stream the Bedrock Agent's answer as it arrives, continuing the conversation's
+    agent session, and show how long each agent step took.
+    """
+    bedrock, bedrock_agent_runtime, s3, openai_client = clients
+    trace = AgentTrace()
+    with st.chat_message("human"):
+        st.write(prompt)
+    with st.chat_message("ai"):
+        st.session_state.chat_handler = ChatHandler(session_id=st.session_state.conversation_id)
+        try:
+            response = st.write_stream(answer_query_agent_stream(
                 prompt,
                 st.session_state.chat_handler,
-                bedrock,
                 bedrock_agent_runtime,
                 s3,
-                openai_client,
                 st.session_state["model_id"],
-                st.session_state["kb_id"],
                 st.session_state["mode"],
                 report_mode,
                 cohort='user',
-                batch_mode=False
-            )
-            
-            st.write(response)
-            store_interaction(prompt, response)
+                trace=trace
+            ))
+        except Exception as e:
+            # E.g. a read timeout while the agent orchestrates; the failed turn is not stored or reported.
+            print(f"Agent error: {str(e)}")
+            traceback.print_exc()
+            st.error("Sorry, the agent could not answer right now. Please try again in a moment.")
+            return
+        if trace.events:
+            with st.expander("Agent steps"):
+                st.table(trace.timings())
+        answer_id = store_interaction(prompt, response)
+        start_background_judge(answer_id, prompt, response, clients, report_mode)
+        render_judgement(answer_id)
 
 
 def store_interaction(prompt, response):
@@ -321,10 +583,17 @@ def store_interaction(prompt, response):
     Args:
         prompt (str): User input
         response (str): AI response
+
+    Returns:
+        str: Id of the answer, also set on its chat message
     """
+    answer_id = str(uuid.uuid4())
+    st.session_state.chat_handler.tag_last_answer(answer_id)
+    st.session_state["answer_id_hold"] = answer_id
     st.session_state["prompt_hold"] = prompt
     st.session_state["response_hold"] = response
     st.session_state["model_id_hold"] = st.session_state["model_id"]
+    return answer_id
 
 
 def main():
@@ -335,6 +604,8 @@ def main():
 
     # Load environment variables and initialize clients
     load_environment_secrets()
+    # Load the language profiles now rather than on the first question (no-op after the first run).
+    get_language_detector()
     clients = (
         *initialize_aws_clients(),
         initialize_openai_client()
@@ -354,16 +625,23 @@ def main():
     display_chat_history()
     
     # Handle chat interactions
-    prompt = st.chat_input("")
+    comparing = len(st.session_state.get("compare_models", [])) > 1
+    busy = "pending_answer" in st.session_state or not st.session_state.get("comparison", {}).get("finished", True)
+    prompt = st.chat_input("", disabled=busy)
     if prompt:
-        with st.chat_message("human"):
-            st.write(prompt)
-            
+        st.session_state.pop("comparison", None)
         if prompt == "e":
+            with st.chat_message("human"):
+                st.write(prompt)
             process_evaluation_request(clients)
+        elif comparing:
+            generate_comparison(prompt, clients, report_mode, st.session_state["compare_models"])
         else:
             generate_ai_response(prompt, clients, report_mode)
 
+    render_pending_answer(clients, report_mode)
+    render_comparison()
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,97 @@
+"""
+Background LLM judging of chat answers.
+
+The 'e' command judges the last answer synchronously, so the session waits on
+a large judge model. judge_in_background submits the same assessment
+(assess_answer_query, JSON style) to a small process-wide judge pool right
+after an answer is shown and returns a Future; the page shows the score beside
+the message once it is ready. Results go through the judge cache, keyed by
+(prompt, response, judge model, prompt version), so re-asked questions and
+batch runs share assessments, and with report_mode each assessment is written
+to the report sink in the layout batch judge runs use.
+
+    judge_background_seconds
+    judge_background_failures
+    judge_score{model}          mean 1-5 score of the judged model's answers
+"""
+
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from analytics import parse_judge_scores
+from judge_cache import get_judge_cache
+from metrics import metrics as default_metrics
+from utils import assess_answer_query, build_json_string, generate_json_filename
+
+JUDGE_MODEL_ID = "us.anthropic.claude-3-5-sonnet-20241022-v2:0"
+
+# Judging is telemetry, not on the answer path; a few workers keep it from competing with answers.
+_judge_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="judge")
+
+
+def judge_answer(user_query, response, response_model, mode, bedrock, bedrock_agent_runtime_client, s3_client,
+                 openai_client, judge_model_id=JUDGE_MODEL_ID, judge_cache=None, report_mode=False,
+                 tag="wabotpoc", bucket_name="watech-rppilot-silver",
+                 object_key_path="evaluation_data/assessments/users/", cohort="user_assess", registry=None):
+    """
+    Judge one answer and record the result.
+
+    Returns:
+        dict: score (mean of the criteria scores, None if none parsed), scores
+              (criterion -> score), output (raw judge output), judge_model
+    """
+    registry = registry or default_metrics
+    judge_cache = judge_cache or get_judge_cache()
+    start_time = time.monotonic()
+
+    output = assess_answer_query(
+        user_query, response, response_model,
+        bedrock, bedrock_agent_runtime_client, s3_client, openai_client,
+        judge_model_id, batch_mode=True, judge_cache=judge_cache
+    )
+    run_time = time.monotonic() - start_time
+    registry.observe("judge_background_seconds", run_time)
+
+    scores = {field: value for field, value in parse_judge_scores(output).items() if not math.isnan(value)}
+    score = sum(scores.values()) / len(scores) if scores else None
+    if score is not None:
+        registry.observe("judge_score", score, model=response_model)
+
+    if report_mode:
+        filename = generate_json_filename(tag)
+        object_key = f"{object_key_path}{cohort}_{filename}"
+        content = build_json_string(
+            question=user_query,
+            response=output,
+            assessed_response=response,
+            response_model=response_model,
+            response_mode=mode,
+            assess_model=judge_model_id,
+            runttime=f"Elapsed time: {run_time:.4f} seconds",
+            bot_type="assess",
+            cohort_tag=cohort
+        )
+        s3_client.put_object(Bucket=bucket_name, Key=object_key, Body=content)
+
+    return {"score": score, "scores": scores, "output": output, "judge_model": judge_model_id}
+
+
+def judge_in_background(*args, registry=None, **kwargs):
+    """
+    Run judge_answer on the judge pool.
+
+    Returns:
+        concurrent.futures.Future: Resolves to judge_answer's result, or None if judging failed
+    """
+    registry = registry or default_metrics
+
+    def run():
+        try:
+            return judge_answer(*args, registry=registry, **kwargs)
+        except Exception as e:
+            registry.increment("judge_background_failures")
+            print(f"Background judge failed: {str(e)}")
+            return None
+
+    return _judge_pool.submit(run)
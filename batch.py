@@ -3,10 +3,24 @@ import streamlit as st
 import boto3
 from urllib.parse import urlparse
 from app import load_environment_secrets, initialize_aws_clients, initialize_openai_client
-from utils import ChatHandler, answer_query, assess_answer_query,build_csv_from_json_s3_folder, generate_json_filename, build_json_string
+from utils import ChatHandler, answer_query, assess_answer_query,build_csv_from_json_s3_folder, generate_json_filename, build_json_string, list_json_files_in_s3_folder
+from utils import assemble_answer_prompt, get_answer_context, get_model_response
 from datetime import datetime
+import argparse
+import hashlib
+import io
 import json
+import math
+import os
+import random
+import threading
+import time
 from concurrent.futures import ThreadPoolExecutor
+from judge_cache import SQLiteJudgeCache
+from analytics import build_evaluation_report, parse_judge_scores
+from bulk_inference import run_bulk_sweep
+from hybrid_executor import HybridExecutor, build_record_stage
+from language import detect_languages
 
 # def do_batch_prompts_threads_k(max_threads=30, **kwargs):
 #     # Default values for kwargs
@@ -130,7 +144,46 @@ from concurrent.futures import ThreadPoolExecutor
 #         return
 
 
-def do_batch_prompts_threads(bedrock, bedrock_agent_runtime_client, s3_client, openai_client,chat_handler, kb_id, max_threads=30):
+def decode_prompt_line(raw_line):
+    try:
+        return raw_line.decode("utf-8")
+    except UnicodeDecodeError:
+        return raw_line.decode("ISO-8859-1")
+
+def iter_prompt_list(s3_client, s3_uri):
+    """Stream a newline-separated prompt list from S3, decoding one line at a time."""
+    parsed = urlparse(s3_uri)
+    response = s3_client.get_object(Bucket=parsed.netloc, Key=parsed.path.lstrip("/"))
+    for raw_line in response["Body"].iter_lines():
+        item = decode_prompt_line(raw_line).strip()
+        if item:
+            yield item
+
+def read_prompt_list(s3_client, s3_uri):
+    """Read a newline-separated prompt list from S3. Returns None if it cannot be read."""
+    if not s3_uri.startswith("s3://"):
+        print("Please enter a valid S3 URI starting with s3://")
+        return None
+    try:
+        return list(iter_prompt_list(s3_client, s3_uri))
+    except Exception as e:
+        print(f"Error reading file: {e}")
+        return None
+
+def prompt_shard(item, shard_count):
+    """Stable shard for a prompt: every process and machine maps the same prompt to the same shard."""
+    digest = hashlib.sha1(item.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % shard_count
+
+def iter_shard(items, shard_index, shard_count):
+    for item in items:
+        if shard_count == 1 or prompt_shard(item, shard_count) == shard_index:
+            yield item
+
+def shard_name(shard_index, shard_count):
+    return f"shard-{shard_index:04d}-of-{shard_count:04d}"
+
+def do_batch_prompts_threads(bedrock, bedrock_agent_runtime_client, s3_client, openai_client,chat_handler, kb_id, max_threads=30, shard_index=0, shard_count=1):
    # ********* INPUTS *********"
    
     report_mode = True
@@ -145,29 +198,15 @@ def do_batch_prompts_threads(bedrock, bedrock_agent_runtime_client, s3_client, o
     kb_id='4BFLETNCSZ'#website
     #kb_id='4BFLETNCSZ'#legalaid
 
-    if s3_uri.startswith("s3://"):
-        try:
-            parsed = urlparse(s3_uri)
-            bucket = parsed.netloc
-            key = parsed.path.lstrip("/")
-
-            s3 = boto3.client("s3")
-            response = s3.get_object(Bucket=bucket, Key=key)
-            raw_bytes = response["Body"].read()
-
-            try:
-                content = raw_bytes.decode("utf-8")
-            except UnicodeDecodeError:
-                content = raw_bytes.decode("ISO-8859-1")
-
-            data_list = [item.strip() for item in content.splitlines() if item.strip()]
-
-        except Exception as e:
-            print(f"Error reading file: {e}")
-            return
-    else:
+    if not s3_uri.startswith("s3://"):
         print("Please enter a valid S3 URI starting with s3://")
         return
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f"shard_index must be in [0, {shard_count}), got {shard_index}")
+
+    bucket = urlparse(s3_uri).netloc
+    shard_prefix = f"{s3_out_batch}shards/{cohort_tag}/"
+    started_at = datetime.now().isoformat()
 
     def process_item(item, model_id, mode,kb_id, s3_path = "evaluation_data/batch/"):
         return answer_query(
@@ -185,13 +224,506 @@ def do_batch_prompts_threads(bedrock, bedrock_agent_runtime_client, s3_client, o
             batch_mode=True,
             object_key_path="evaluation_data/batch/demo/"
         )
-    for model_id in model_ids:
-        for mode in mode_names:
-            print(f"Processing {model_id} in {mode} using {promptlist} with up to {max_threads} threads")
-            with ThreadPoolExecutor(max_workers=max_threads) as executor:
-                executor.map(lambda item: process_item(item, model_id, mode,kb_id, s3_out_batch), data_list)
 
-def LLM_Judge_threads(bedrock, bedrock_agent_runtime_client, s3_client, openai_client, max_threads=30):
+    output = io.StringIO()
+    output_lock = threading.Lock()
+    counts = {"records": 0, "errors": 0}
+
+    def run_item(item, model_id, mode):
+        record = {"question": item, "model": model_id, "bot_type": mode, "cohort_tag": cohort_tag}
+        try:
+            record["response"] = process_item(item, model_id, mode, kb_id, s3_out_batch)
+        except Exception as e:
+            print(f"Error processing {model_id} - {mode} - {item}: {e}")
+            record["error"] = str(e)
+        with output_lock:
+            output.write(json.dumps(record) + "\n")
+            counts["records"] += 1
+            counts["errors"] += "error" in record
+
+    # Prompts are streamed and submitted as they arrive; the semaphore caps how many are queued at once.
+    in_flight = threading.BoundedSemaphore(max_threads * 2)
+    prompt_count = 0
+    read_error = None
+    name = shard_name(shard_index, shard_count)
+    print(f"Processing {name} of {promptlist} with up to {max_threads} threads")
+    with ThreadPoolExecutor(max_workers=max_threads) as executor:
+        try:
+            for item in iter_shard(iter_prompt_list(s3_client, s3_uri), shard_index, shard_count):
+                prompt_count += 1
+                for model_id in model_ids:
+                    for mode in mode_names:
+                        in_flight.acquire()
+                        future = executor.submit(run_item, item, model_id, mode)
+                        future.add_done_callback(lambda _: in_flight.release())
+        except Exception as e:
+            # Keep the records already generated: the executor drains and the partial
+            # shard is written, marked incomplete in its manifest.
+            print(f"Error reading file: {e}")
+            read_error = str(e)
+
+    output_key = f"{shard_prefix}{name}.jsonl"
+    s3_client.put_object(Bucket=bucket, Key=output_key, Body=output.getvalue().encode("utf-8"))
+    manifest = {
+        "cohort_tag": cohort_tag,
+        "promptlist": s3_uri,
+        "shard_index": shard_index,
+        "shard_count": shard_count,
+        "prompt_count": prompt_count,
+        "record_count": counts["records"],
+        "error_count": counts["errors"],
+        "model_ids": model_ids,
+        "mode_names": mode_names,
+        "output_key": output_key,
+        "complete": read_error is None,
+        "error": read_error,
+        "started_at": started_at,
+        "finished_at": datetime.now().isoformat()
+    }
+    s3_client.put_object(Bucket=bucket, Key=f"{shard_prefix}{name}.manifest.json", Body=json.dumps(manifest, indent=2))
+    print(f"Shard output saved to s3://{bucket}/{output_key}" + ("" if read_error is None else " (incomplete)"))
+    return manifest
+
+def do_batch_prompts_hybrid(bedrock, bedrock_agent_runtime_client, s3_client, openai_client, kb_id, max_threads=30, cpu_workers=None, chunksize=16, shard_index=0, shard_count=1):
+    """
+    Same sweep as do_batch_prompts_threads, split into I/O and CPU stages.
+
+    Retrieval, model calls and S3 writes run on threads; language detection, prompt
+    assembly and report-record building run in a process pool, a chunk of prompts at
+    a time, so they no longer compete with the I/O threads for the GIL.
+    """
+   # ********* INPUTS *********"
+
+    promptlist = "simple_prompts_small.csv"
+    s3_uri = f"s3://watech-rppilot-bronze/evaluation_data/prompt_lists/{promptlist}"
+    cohort_tag = f"{promptlist}_demo_hybrid_01"
+    model_ids = ["us.amazon.nova-pro-v1:0", "us.amazon.nova-micro-v1:0", "us.anthropic.claude-3-5-haiku-20241022-v1:0", "us.anthropic.claude-3-5-sonnet-20241022-v2:0","gpt-4-turbo","gpt-4o"]
+    mode_names = ["KB-Website"]
+    bucket_name = "watech-rppilot-bronze"
+    object_key_path = "evaluation_data/batch/demo/"
+    tag = "wabotpoc"
+    cohort_name = str(cohort_tag).strip().lower()
+
+    def retrieve(item, model_id, mode):
+        start_time = time.time()
+        context = get_answer_context(item, bedrock_agent_runtime_client, model_id, kb_id, mode)
+        return context, time.time() - start_time
+
+    def generate(item, prompt_data, model_id):
+        start_time = time.time()
+        try:
+            output_text = get_model_response(bedrock, bedrock_agent_runtime_client, openai_client, model_id, prompt_data, item)
+        except Exception as e:
+            print(f"Error generating {model_id} - {item}: {e}")
+            output_text = None
+        return output_text, time.time() - start_time
+
+    def write(content):
+        object_key = f"{object_key_path}{cohort_name}_{generate_json_filename(tag)}"
+        s3_client.put_object(Bucket=bucket_name, Key=object_key, Body=content)
+
+    def process_chunk(chunk, languages, model_id, mode, executor):
+        try:
+            retrieved = executor.map_io(lambda item: retrieve(item, model_id, mode), chunk)
+            contexts = [context for context, _ in retrieved]
+            prompts = executor.map_cpu(assemble_answer_prompt, chunk, contexts, ["NONE"] * len(chunk), [mode] * len(chunk), languages)
+            generated = executor.map_io(lambda args: generate(args[0], args[1], model_id), zip(chunk, prompts))
+
+            done = [(item, text, f"Elapsed time: {r_time + g_time:.4f} seconds")
+                    for item, (text, g_time), (_, r_time) in zip(chunk, generated, retrieved) if text is not None]
+            if not done:
+                return
+            items, texts, run_times = zip(*done)
+            n = len(done)
+            records = executor.map_cpu(build_record_stage, items, texts, run_times, [model_id] * n, [mode] * n, [cohort_name] * n)
+            executor.map_io(write, [content for _, content in records])
+        except Exception as e:
+            print(f"Error processing chunk for {model_id} - {mode}: {e}")
+
+    def iter_chunks(items):
+        chunk = []
+        for item in items:
+            chunk.append(item)
+            if len(chunk) == chunksize:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    # A handful of coordinator threads drive chunks through the stages; the real work runs in the executor's pools.
+    coordinators = max(2, (max_threads // chunksize) * 2)
+    in_flight = threading.BoundedSemaphore(coordinators * 2)
+    print(f"Processing {shard_name(shard_index, shard_count)} of {promptlist} with {max_threads} I/O threads and {cpu_workers or os.cpu_count()} CPU processes")
+    with HybridExecutor(io_workers=max_threads, cpu_workers=cpu_workers, chunksize=chunksize) as executor:
+        with ThreadPoolExecutor(max_workers=coordinators) as coordinator:
+            try:
+                for chunk in iter_chunks(iter_shard(iter_prompt_list(s3_client, s3_uri), shard_index, shard_count)):
+                    # Detect each prompt's language once per chunk rather than once per model and mode.
+                    languages = executor.cpu_pool.submit(detect_languages, chunk).result()
+                    for model_id in model_ids:
+                        for mode in mode_names:
+                            in_flight.acquire()
+                            future = coordinator.submit(process_chunk, chunk, languages, model_id, mode, executor)
+                            future.add_done_callback(lambda _: in_flight.release())
+            except Exception as e:
+                print(f"Error reading file: {e}")
+
+def merge_shard_outputs(s3_client, bucket_name, shard_prefix, allow_partial=False):
+    """
+    Combine the per-shard outputs and manifests written by do_batch_prompts_threads.
+
+    Checks that every shard of the run reported in and finished reading its prompts,
+    then writes merged.jsonl and merged.manifest.json under the same prefix.
+
+    Raises:
+        ValueError: If shards are missing or incomplete, unless allow_partial is set
+    """
+    manifest_keys = [key for key in list_json_files_in_s3_folder(s3_client, bucket_name, shard_prefix)
+                     if key.endswith(".manifest.json") and not key.endswith("merged.manifest.json")]
+    manifests = [json.loads(s3_client.get_object(Bucket=bucket_name, Key=key)["Body"].read()) for key in manifest_keys]
+    if not manifests:
+        print(f"No shard manifests found under s3://{bucket_name}/{shard_prefix}")
+        return None
+
+    shard_counts = {m["shard_count"] for m in manifests}
+    if len(shard_counts) != 1:
+        raise ValueError(f"Shards were run with different shard counts: {sorted(shard_counts)}")
+    shard_count = shard_counts.pop()
+    missing = sorted(set(range(shard_count)) - {m["shard_index"] for m in manifests})
+    incomplete = sorted(m["shard_index"] for m in manifests if not m.get("complete", True))
+    if missing or incomplete:
+        problem = f"missing shards {missing}, incomplete shards {incomplete} of {shard_count}"
+        if not allow_partial:
+            raise ValueError(f"Cannot merge {shard_prefix}: {problem} (pass allow_partial=True to merge anyway)")
+        print(f"Warning: {problem}; merging the shards present")
+    manifests.sort(key=lambda m: m["shard_index"])
+
+    merged = io.BytesIO()
+    for manifest in manifests:
+        body = s3_client.get_object(Bucket=bucket_name, Key=manifest["output_key"])["Body"]
+        for line in body.iter_lines():
+            if line:
+                merged.write(line + b"\n")
+    merged_key = f"{shard_prefix}merged.jsonl"
+    s3_client.put_object(Bucket=bucket_name, Key=merged_key, Body=merged.getvalue())
+
+    merged_manifest = {
+        "cohort_tag": manifests[0]["cohort_tag"],
+        "promptlist": manifests[0]["promptlist"],
+        "shard_count": shard_count,
+        "missing_shards": missing,
+        "incomplete_shards": incomplete,
+        "complete": not missing and not incomplete,
+        "prompt_count": sum(m["prompt_count"] for m in manifests),
+        "record_count": sum(m["record_count"] for m in manifests),
+        "error_count": sum(m["error_count"] for m in manifests),
+        "output_key": merged_key,
+        "shards": manifests
+    }
+    s3_client.put_object(Bucket=bucket_name, Key=f"{shard_prefix}merged.manifest.json", Body=json.dumps(merged_manifest, indent=2))
+    print(f"Merged {len(manifests)} shards into s3://{bucket_name}/{merged_key}")
+    return merged_manifest
+
+def do_batch_prompts_bulk(bedrock_batch_client, bedrock_agent_runtime_client, s3_client, openai_client, chat_handler, kb_id, role_arn=None):
+    """
+    Offline sweep through the providers' bulk APIs (Bedrock batch inference, OpenAI Batch).
+
+    Writes the same report records as do_batch_prompts_threads without using
+    on-demand quota.
+    """
+   # ********* INPUTS *********"
+
+    promptlist = "simple_prompts_small.csv"
+    s3_uri = f"s3://watech-rppilot-bronze/evaluation_data/prompt_lists/{promptlist}"
+    cohort_tag = f"{promptlist}_demo_bulk_01"
+    model_ids = ["us.amazon.nova-pro-v1:0", "us.amazon.nova-micro-v1:0", "us.anthropic.claude-3-5-haiku-20241022-v1:0", "us.anthropic.claude-3-5-sonnet-20241022-v2:0","gpt-4-turbo","gpt-4o"]
+    mode_names = ["KB-Website"]
+    role_arn = role_arn or os.environ.get("BEDROCK_BATCH_ROLE_ARN")
+
+    data_list = read_prompt_list(s3_client, s3_uri)
+    if data_list is None:
+        return
+
+    for mode in mode_names:
+        print(f"Submitting {promptlist} in {mode} as bulk jobs")
+        run_bulk_sweep(
+            data_list, model_ids, mode, kb_id, cohort_tag,
+            bedrock_batch_client, bedrock_agent_runtime_client, s3_client, openai_client, chat_handler,
+            role_arn, object_key_path="evaluation_data/batch/demo/"
+        )
+
+def do_batch_generate_and_judge(bedrock, bedrock_agent_runtime_client, s3_client, openai_client, chat_handler, kb_id, max_gen_threads=30, max_judge_threads=10, judge_cache=None):
+    """
+    Fused generate-and-judge pipeline.
+
+    Each generated answer is handed straight to a judge pool in-process instead of
+    being written to S3 and listed/downloaded again by LLM_Judge_threads. Generation
+    and judging run concurrently with independent thread limits, and only the final
+    combined record (question + answer + assessment) is written.
+    """
+    if judge_cache is None:
+        judge_cache = SQLiteJudgeCache()
+   # ********* INPUTS *********"
+
+    promptlist = "simple_prompts_small.csv"
+    s3_uri = f"s3://watech-rppilot-bronze/evaluation_data/prompt_lists/{promptlist}"
+    cohort_tag = f"{promptlist}_demo_fused_01"
+    model_ids = ["us.amazon.nova-pro-v1:0", "us.amazon.nova-micro-v1:0", "us.anthropic.claude-3-5-haiku-20241022-v1:0", "us.anthropic.claude-3-5-sonnet-20241022-v2:0","gpt-4-turbo","gpt-4o"]
+    mode_names = ["KB-Website"]
+
+    judge_model_id = "us.anthropic.claude-3-5-sonnet-20241022-v2:0"
+    tag = "wabotpoc"
+    bucket_name_out = "watech-rppilot-silver"
+    object_key_path_out = "evaluation_data/assessments/fused/"
+    cohort_tag_assess = f"{cohort_tag}_assess"
+
+    data_list = read_prompt_list(s3_client, s3_uri)
+    if data_list is None:
+        return
+
+    def judge_item(item, answer, run_time, model_id, mode):
+        try:
+            output = assess_answer_query(
+                item, answer, model_id,
+                bedrock, bedrock_agent_runtime_client, s3_client, openai_client,
+                judge_model_id, batch_mode=True, judge_cache=judge_cache
+            )
+            filename = generate_json_filename(tag)
+            object_key = f"{object_key_path_out}{cohort_tag}_{filename}"
+            content = build_json_string(
+                question=item,
+                response=output,
+                assessed_response=answer,
+                response_model=model_id,
+                response_mode=mode,
+                assess_model=judge_model_id,
+                runttime=run_time,
+                bot_type="assess",
+                cohort_tag=cohort_tag_assess
+            )
+            s3_client.put_object(Bucket=bucket_name_out, Key=object_key, Body=content)
+        except Exception as e:
+            print(f"Error judging {model_id} - {mode} - {item}: {e}")
+
+    def generate_item(item, model_id, mode, judge_executor):
+        try:
+            start_time = time.time()
+            answer = answer_query(
+                item,
+                chat_handler,
+                bedrock,
+                bedrock_agent_runtime_client,
+                s3_client,
+                openai_client,
+                model_id,
+                kb_id,
+                mode,
+                report_mode=False,
+                cohort=cohort_tag,
+                batch_mode=True
+            )
+            run_time = f"Elapsed time: {time.time() - start_time:.4f} seconds"
+        except Exception as e:
+            print(f"Error generating {model_id} - {mode} - {item}: {e}")
+            return
+        judge_executor.submit(judge_item, item, answer, run_time, model_id, mode)
+
+    print(f"Generating and judging {promptlist} with up to {max_gen_threads} generation and {max_judge_threads} judge threads")
+    # The generation pool is shut down first; by then every answer has been queued on the judge pool.
+    with ThreadPoolExecutor(max_workers=max_judge_threads) as judge_executor:
+        with ThreadPoolExecutor(max_workers=max_gen_threads) as gen_executor:
+            for model_id in model_ids:
+                for mode in mode_names:
+                    for item in data_list:
+                        gen_executor.submit(generate_item, item, model_id, mode, judge_executor)
+
+def confidence_radius(values, n_models, round_index, value_range, delta):
+    """
+    Empirical-Bernstein confidence radius for the mean of values bounded in a range of width value_range.
+
+    The log term spends delta across models and rounds so the eliminations stay valid
+    even though the test is repeated after every round. Using the sample variance keeps
+    the interval much tighter than Hoeffding when judge scores cluster.
+    """
+    n = len(values)
+    if n < 2:
+        return float("inf")
+    mean = sum(values) / n
+    variance = sum((v - mean) ** 2 for v in values) / (n - 1)
+    log_term = math.log(3 * n_models * round_index ** 2 / delta)
+    return math.sqrt(2 * variance * log_term / n) + 3 * value_range * log_term / n
+
+def do_adaptive_model_sweep(bedrock, bedrock_agent_runtime_client, s3_client, openai_client, chat_handler, kb_id,
+                            batch_size=25, min_samples=50, max_calls=None, delta=0.05, tolerance=0.2,
+                            latency_weight=0.0, max_latency_seconds=30.0, max_threads=30, judge_cache=None, seed=0):
+    """
+    Adaptive model comparison with sequential early stopping.
+
+    Prompts are drawn in rounds of batch_size per model. Every model sees the same
+    prompts in the same order. Each answer is judged immediately and scored as
+    utility = mean judge score - latency_weight * latency seconds, with latency clipped
+    to max_latency_seconds so utilities stay in the bounded range the confidence
+    intervals assume. After each round
+    a successive-elimination test drops every model whose upper confidence bound falls
+    below the best lower bound, so the remaining budget goes to the close contenders.
+    Sampling stops once one model is left or the leader is, with confidence, within
+    tolerance of every remaining model, i.e. the rest are practically tied.
+
+    Args:
+        batch_size (int): Prompts per active model per round
+        min_samples (int): Samples a model needs before it can be eliminated
+        max_calls (int): Optional cap on generation + judge LLM calls
+        delta (float): Overall error probability of the elimination decisions
+        tolerance (float): Utility gap to the best model that still counts as a tie
+        latency_weight (float): Utility points subtracted per second of latency
+        max_latency_seconds (float): Latency above this counts as this much in the utility
+
+    Returns:
+        dict: Per-model n, mean utility, mean score, mean latency and elimination round
+    """
+    if judge_cache is None:
+        judge_cache = SQLiteJudgeCache()
+   # ********* INPUTS *********"
+
+    promptlist = "simple_prompts_big.csv"
+    s3_uri = f"s3://watech-rppilot-bronze/evaluation_data/prompt_lists/{promptlist}"
+    cohort_tag = f"{promptlist}_adaptive_01"
+    model_ids = ["us.amazon.nova-pro-v1:0", "us.amazon.nova-micro-v1:0", "us.anthropic.claude-3-5-haiku-20241022-v1:0", "us.anthropic.claude-3-5-sonnet-20241022-v2:0","gpt-4-turbo","gpt-4o"]
+    mode = "KB-Website"
+
+    judge_model_id = "us.anthropic.claude-3-5-sonnet-20241022-v2:0"
+    tag = "wabotpoc"
+    bucket_name_out = "watech-rppilot-silver"
+    object_key_path_out = "evaluation_data/assessments/adaptive/"
+    cohort_tag_assess = f"{cohort_tag}_assess"
+
+    data_list = read_prompt_list(s3_client, s3_uri)
+    if data_list is None:
+        return
+    random.Random(seed).shuffle(data_list)
+
+    # Judge scores are 1-5, so the utility range widens by whatever latency can subtract.
+    # Latency itself is unbounded; clipping it keeps the empirical-Bernstein bound valid.
+    value_range = 4.0 + latency_weight * max_latency_seconds
+
+    def utility(score, latency):
+        return score - latency_weight * min(latency, max_latency_seconds)
+
+    def evaluate_sample(item, model_id):
+        try:
+            start_time = time.time()
+            answer = answer_query(
+                item, chat_handler, bedrock, bedrock_agent_runtime_client, s3_client, openai_client,
+                model_id, kb_id, mode, report_mode=False, cohort=cohort_tag, batch_mode=True
+            )
+            latency = time.time() - start_time
+            output = assess_answer_query(
+                item, answer, model_id,
+                bedrock, bedrock_agent_runtime_client, s3_client, openai_client,
+                judge_model_id, batch_mode=True, judge_cache=judge_cache
+            )
+            filename = generate_json_filename(tag)
+            content = build_json_string(
+                question=item,
+                response=output,
+                assessed_response=answer,
+                response_model=model_id,
+                response_mode=mode,
+                assess_model=judge_model_id,
+                runttime=f"Elapsed time: {latency:.4f} seconds",
+                bot_type="assess",
+                cohort_tag=cohort_tag_assess
+            )
+            s3_client.put_object(Bucket=bucket_name_out, Key=f"{object_key_path_out}{cohort_tag}_{filename}", Body=content)
+        except Exception as e:
+            print(f"Error evaluating {model_id} - {item}: {e}")
+            return None
+
+        scores = [v for v in parse_judge_scores(output).values() if not math.isnan(v)]
+        if not scores:
+            return None
+        score = sum(scores) / len(scores)
+        return score, latency
+
+    active = list(model_ids)
+    results = {model_id: {"scores": [], "latencies": [], "eliminated_round": None} for model_id in model_ids}
+    calls = 0
+    cursor = 0
+    round_index = 0
+
+    with ThreadPoolExecutor(max_workers=max_threads) as executor:
+        while len(active) > 1 and cursor < len(data_list):
+            if max_calls is not None and calls + 2 * len(active) > max_calls:
+                break
+            round_index += 1
+            take = batch_size
+            if max_calls is not None:
+                take = min(take, (max_calls - calls) // (2 * len(active)))
+            batch = data_list[cursor:cursor + take]
+            cursor += len(batch)
+
+            futures = {
+                (model_id, i): executor.submit(evaluate_sample, item, model_id)
+                for model_id in active
+                for i, item in enumerate(batch)
+            }
+            calls += 2 * len(futures)
+            for (model_id, _), future in futures.items():
+                sample = future.result()
+                if sample is not None:
+                    results[model_id]["scores"].append(sample[0])
+                    results[model_id]["latencies"].append(sample[1])
+
+            bounds = {}
+            for model_id in active:
+                utilities = [utility(s, l) for s, l in zip(results[model_id]["scores"], results[model_id]["latencies"])]
+                mean = sum(utilities) / len(utilities) if utilities else float("nan")
+                radius = confidence_radius(utilities, len(model_ids), round_index, value_range, delta)
+                bounds[model_id] = (mean - radius, mean + radius, len(utilities))
+
+            eligible = [m for m in active if bounds[m][2] >= min_samples]
+            if eligible:
+                best_lower = max(bounds[m][0] for m in eligible)
+                for model_id in eligible:
+                    if bounds[model_id][1] < best_lower:
+                        active.remove(model_id)
+                        results[model_id]["eliminated_round"] = round_index
+                        print(f"Round {round_index}: stopped sampling {model_id} after {bounds[model_id][2]} samples")
+
+            print(f"Round {round_index}: {len(active)} models active, {calls} LLM calls so far")
+            # Only models past min_samples can lead; with fewer than 2 samples the bounds are
+            # infinite and the midpoint is NaN, which would make max() pick arbitrarily.
+            candidates = [m for m in active if bounds[m][2] >= max(min_samples, 2)]
+            if not candidates:
+                continue
+            leader = max(candidates, key=lambda m: (bounds[m][0] + bounds[m][1]) / 2)
+            if all(bounds[leader][0] >= bounds[m][1] - tolerance for m in active if m != leader):
+                print(f"Round {round_index}: {leader} is within {tolerance} of the best remaining model, stopping")
+                break
+
+    summary = {}
+    for model_id, result in results.items():
+        n = len(result["scores"])
+        mean_score = sum(result["scores"]) / n if n else float("nan")
+        mean_latency = sum(result["latencies"]) / n if n else float("nan")
+        summary[model_id] = {
+            "n": n,
+            "mean_utility": sum(utility(s, l) for s, l in zip(result["scores"], result["latencies"])) / n if n else float("nan"),
+            "mean_score": mean_score,
+            "mean_latency": mean_latency,
+            "eliminated_round": result["eliminated_round"],
+        }
+    full_calls = 2 * len(model_ids) * len(data_list)
+    print(f"Adaptive sweep used {calls} of {full_calls} LLM calls for a full sweep")
+    for model_id, stats in sorted(summary.items(), key=lambda kv: -kv[1]["mean_utility"] if kv[1]["n"] else float("inf")):
+        print(f"{model_id}: {stats}")
+    return summary
+
+def LLM_Judge_threads(bedrock, bedrock_agent_runtime_client, s3_client, openai_client, max_threads=30, judge_cache=None):
+    # Judge results are memoized so a restarted or repeated run skips responses that were already assessed
+    if judge_cache is None:
+        judge_cache = SQLiteJudgeCache()
+
     # AWS S3 configuration
     
     prefix = "evaluation_data/batch/demo/"  
@@ -226,7 +758,7 @@ def LLM_Judge_threads(bedrock, bedrock_agent_runtime_client, s3_client, openai_c
                 output = assess_answer_query(
                     user_query, response, response_model,
                     bedrock, bedrock_agent_runtime_client, s3_client,openai_client,
-                    model_id, batch_mode=True
+                    model_id, batch_mode=True, judge_cache=judge_cache
                 )
                 filename = generate_json_filename(tag)
                 object_key = f"{object_key_path_out}{cohort_tag}_{filename}"
@@ -273,7 +805,23 @@ def create_analysis_csv(s3_client):
     ]
     build_csv_from_json_s3_folder(s3_client, bucket_name, prefix, s3_input_uri, field_paths, s3_output_uri)
 
+def create_analysis_report(s3_client):
+    s3_output_uri = "s3://watech-rppilot-silver/evaluation_data/reports/legalhelper_prompts_big.csv_bedgpt_threads02.md"
+    bucket_name = "watech-rppilot-silver"
+    prefix = "evaluation_data/assessments/big/legalhelper/"
+    report = build_evaluation_report(s3_client, bucket_name, prefix, s3_output_uri, fmt="markdown")
+    print(report)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Wa-Bot batch evaluation")
+    parser.add_argument("--shard-index", type=int, default=0, help="Shard of the prompt list this process handles")
+    parser.add_argument("--shard-count", type=int, default=1, help="Total number of shards the prompt list is split into")
+    parser.add_argument("--merge", metavar="SHARD_PREFIX", help="Merge the shard outputs under this S3 prefix and exit")
+    parser.add_argument("--allow-partial", action="store_true", help="With --merge, merge even if shards are missing or incomplete")
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
     
     # Load environment variables and initialize clients
     load_environment_secrets()
@@ -311,10 +859,19 @@ def main():
     kb_id='4BFLETNCSZ'#website
     #kb_id='4BFLETNCSZ'#legalaid
 
-    do_batch_prompts_threads(bedrock,bedrock_agent_runtime, s3,openai_client, ChatHandler(), kb_id)
+    if args.merge:
+        merge_shard_outputs(s3, "watech-rppilot-bronze", args.merge, allow_partial=args.allow_partial)
+        return
+
+    do_batch_prompts_threads(bedrock,bedrock_agent_runtime, s3,openai_client, ChatHandler(), kb_id, shard_index=args.shard_index, shard_count=args.shard_count)
+    #do_batch_prompts_hybrid(bedrock, bedrock_agent_runtime, s3, openai_client, kb_id, shard_index=args.shard_index, shard_count=args.shard_count)
+    #do_batch_generate_and_judge(bedrock, bedrock_agent_runtime, s3, openai_client, ChatHandler(), kb_id)
+    #do_adaptive_model_sweep(bedrock, bedrock_agent_runtime, s3, openai_client, ChatHandler(), kb_id)
+    #do_batch_prompts_bulk(boto3.client('bedrock'), bedrock_agent_runtime, s3, openai_client, ChatHandler(), kb_id)
     
     #LLM_Judge_threads(bedrock, bedrock_agent_runtime,s3,openai_client)
     #create_analysis_csv(s3)
+    #create_analysis_report(s3)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
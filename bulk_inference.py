@@ -0,0 +1,251 @@
+"""
+Provider-native bulk inference for offline batch sweeps.
+
+Instead of calling the real-time APIs one prompt at a time, fully assembled prompts
+are written as JSONL and submitted as Bedrock batch inference jobs
+(CreateModelInvocationJob) for Nova/Claude models and as OpenAI Batch API jobs for
+gpt models. Jobs are polled to completion and their outputs are mapped back into the
+same report records answer_query writes in report mode.
+
+All provider clients (Bedrock control plane, S3, OpenAI) and the sleep function are
+passed in, so a local fake can drive the whole flow.
+"""
+
+import io
+import json
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from utils import (
+    build_answer_prompt, build_answer_record, build_claude_request_body, build_nova_request_body,
+    build_openai_request_body, format_answer_output, generate_json_filename, parse_claude_response_body,
+    parse_nova_response_body
+)
+
+BEDROCK_TERMINAL_STATUSES = {"Completed", "PartiallyCompleted", "Failed", "Stopped", "Expired"}
+OPENAI_TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+# Bedrock rejects batch jobs with fewer records than this (per-model service quota).
+BEDROCK_MIN_RECORDS = 100
+
+
+def model_provider(model_id):
+    """Return "nova", "claude" or "gpt" for models with a bulk API, else None."""
+    for provider in ("nova", "claude", "gpt"):
+        if model_id.find(provider) != -1:
+            return provider
+    return None
+
+
+def build_bulk_requests(items, model_id, mode, kb_id, bedrock_agent_runtime_client, chat_handler, max_threads=30):
+    """
+    Assemble the full prompt for every item (retrieval runs here, concurrently).
+
+    Returns:
+        list: Dicts with record_id, question and prompt
+    """
+    def build(item):
+        prompt = build_answer_prompt(item, chat_handler, bedrock_agent_runtime_client, model_id, kb_id, mode, batch_mode=True)
+        return {"record_id": uuid.uuid4().hex, "question": item, "prompt": prompt}
+
+    with ThreadPoolExecutor(max_workers=max_threads) as executor:
+        return list(executor.map(build, items))
+
+
+def to_jsonl(requests, model_id):
+    """Serialize requests in the provider's batch input format."""
+    provider = model_provider(model_id)
+    lines = []
+    for request in requests:
+        if provider == "nova":
+            line = {"recordId": request["record_id"], "modelInput": build_nova_request_body(request["prompt"])}
+        elif provider == "claude":
+            line = {"recordId": request["record_id"], "modelInput": build_claude_request_body(request["prompt"])}
+        elif provider == "gpt":
+            line = {
+                "custom_id": request["record_id"],
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": build_openai_request_body(model_id, request["prompt"])
+            }
+        else:
+            raise ValueError(f"No bulk inference API for model {model_id}")
+        lines.append(json.dumps(line))
+    return "\n".join(lines) + "\n"
+
+
+def submit_bedrock_job(bedrock_batch_client, s3_client, jsonl, model_id, role_arn, bucket_name, prefix, job_name):
+    """
+    Upload the JSONL input and create a Bedrock model invocation job.
+
+    Returns:
+        dict: job_arn and the S3 output URI
+    """
+    input_key = f"{prefix}input/{job_name}.jsonl"
+    s3_client.put_object(Bucket=bucket_name, Key=input_key, Body=jsonl.encode('utf-8'))
+    output_uri = f"s3://{bucket_name}/{prefix}output/"
+
+    response = bedrock_batch_client.create_model_invocation_job(
+        jobName=job_name,
+        roleArn=role_arn,
+        modelId=model_id,
+        inputDataConfig={"s3InputDataConfig": {"s3Uri": f"s3://{bucket_name}/{input_key}", "s3InputFormat": "JSONL"}},
+        outputDataConfig={"s3OutputDataConfig": {"s3Uri": output_uri}}
+    )
+    return {"job_arn": response["jobArn"], "output_uri": output_uri, "input_file": f"{job_name}.jsonl"}
+
+
+def wait_for_bedrock_job(bedrock_batch_client, job_arn, poll_seconds=60, timeout_seconds=24 * 3600, sleep=time.sleep):
+    """Poll a Bedrock batch job until it reaches a terminal status. Returns the status."""
+    deadline = time.time() + timeout_seconds
+    while True:
+        status = bedrock_batch_client.get_model_invocation_job(jobIdentifier=job_arn)["status"]
+        if status in BEDROCK_TERMINAL_STATUSES or time.time() > deadline:
+            return status
+        sleep(poll_seconds)
+
+
+def read_bedrock_results(s3_client, job, model_id):
+    """
+    Read a Bedrock batch job's .jsonl.out file.
+
+    Returns:
+        dict: recordId -> output text (None for records the job failed)
+    """
+    parsed = urlparse(job["output_uri"])
+    job_id = job["job_arn"].rsplit("/", 1)[-1]
+    key = f"{parsed.path.lstrip('/')}{job_id}/{job['input_file']}.out"
+    body = s3_client.get_object(Bucket=parsed.netloc, Key=key)["Body"]
+
+    parse = parse_nova_response_body if model_provider(model_id) == "nova" else parse_claude_response_body
+    results = {}
+    for line in body.iter_lines():
+        if not line:
+            continue
+        record = json.loads(line)
+        try:
+            results[record["recordId"]] = parse(record["modelOutput"])
+        except (KeyError, IndexError, TypeError):
+            print(f"Bulk record {record.get('recordId')} failed: {record.get('error')}")
+            results[record["recordId"]] = None
+    return results
+
+
+def submit_openai_batch(openai_client, jsonl, job_name):
+    """Upload the JSONL input and create an OpenAI batch. Returns the batch id."""
+    input_file = openai_client.files.create(
+        file=(f"{job_name}.jsonl", io.BytesIO(jsonl.encode('utf-8'))),
+        purpose="batch"
+    )
+    batch = openai_client.batches.create(
+        input_file_id=input_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+        metadata={"job_name": job_name}
+    )
+    return batch.id
+
+
+def wait_for_openai_batch(openai_client, batch_id, poll_seconds=60, timeout_seconds=24 * 3600, sleep=time.sleep):
+    """Poll an OpenAI batch until it reaches a terminal status. Returns the batch object."""
+    deadline = time.time() + timeout_seconds
+    while True:
+        batch = openai_client.batches.retrieve(batch_id)
+        if batch.status in OPENAI_TERMINAL_STATUSES or time.time() > deadline:
+            return batch
+        sleep(poll_seconds)
+
+
+def read_openai_results(openai_client, batch):
+    """
+    Read an OpenAI batch's output file.
+
+    Returns:
+        dict: custom_id -> output text (None for failed requests)
+    """
+    results = {}
+    if not batch.output_file_id:
+        return results
+    content = openai_client.files.content(batch.output_file_id).text
+    for line in content.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        try:
+            results[record["custom_id"]] = record["response"]["body"]["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError):
+            print(f"Bulk record {record.get('custom_id')} failed: {record.get('error')}")
+            results[record["custom_id"]] = None
+    return results
+
+
+def write_bulk_records(s3_client, requests, results, model_id, mode, cohort_tag, bucket_name, object_key_path, tag="wabotpoc"):
+    """Write one report record per answered request, in the same layout answer_query uses."""
+    cohort_name = str(cohort_tag).strip().lower()
+    written = 0
+    for request in requests:
+        output_text = results.get(request["record_id"])
+        if output_text is None:
+            continue
+        # Batch jobs have no per-request latency, so timetorun is left out rather than
+        # written as a value analytics cannot parse.
+        output_text = format_answer_output(output_text, model_id, mode, None)
+        object_key = f"{object_key_path}{cohort_name}_{generate_json_filename(tag)}"
+        content = build_answer_record(request["question"], output_text, None, model_id, mode, cohort_name, inference="bulk")
+        s3_client.put_object(Bucket=bucket_name, Key=object_key, Body=content)
+        written += 1
+    return written
+
+
+def run_bulk_sweep(items, model_ids, mode, kb_id, cohort_tag, bedrock_batch_client, bedrock_agent_runtime_client,
+                   s3_client, openai_client, chat_handler, role_arn, bucket_name="watech-rppilot-bronze",
+                   staging_prefix="evaluation_data/bulk/", object_key_path="evaluation_data/batch/demo/",
+                   poll_seconds=60, sleep=time.sleep):
+    """
+    Run one sweep of items x model_ids through the providers' bulk APIs.
+
+    All jobs are submitted before any is polled, so they run side by side.
+
+    Returns:
+        dict: model_id -> number of report records written
+    """
+    jobs = []
+    for model_id in model_ids:
+        provider = model_provider(model_id)
+        if provider is None:
+            print(f"Skipping {model_id}: no bulk inference API")
+            continue
+        requests = build_bulk_requests(items, model_id, mode, kb_id, bedrock_agent_runtime_client, chat_handler)
+        jsonl = to_jsonl(requests, model_id)
+        job_name = f"{cohort_tag}-{model_id}-{uuid.uuid4().hex[:8]}".replace(":", "-").replace(".", "-").replace("_", "-")[:63]
+
+        if provider == "gpt":
+            batch_id = submit_openai_batch(openai_client, jsonl, job_name)
+            print(f"Submitted OpenAI batch {batch_id} for {model_id} ({len(requests)} prompts)")
+            jobs.append((model_id, requests, {"batch_id": batch_id}))
+        else:
+            if len(requests) < BEDROCK_MIN_RECORDS:
+                print(f"Warning: {model_id} job has {len(requests)} records; Bedrock requires at least {BEDROCK_MIN_RECORDS}")
+            job = submit_bedrock_job(bedrock_batch_client, s3_client, jsonl, model_id, role_arn, bucket_name, staging_prefix, job_name)
+            print(f"Submitted Bedrock job {job['job_arn']} for {model_id} ({len(requests)} prompts)")
+            jobs.append((model_id, requests, job))
+
+    written = {}
+    for model_id, requests, job in jobs:
+        if "batch_id" in job:
+            batch = wait_for_openai_batch(openai_client, job["batch_id"], poll_seconds=poll_seconds, sleep=sleep)
+            if batch.status != "completed":
+                print(f"OpenAI batch {job['batch_id']} for {model_id} ended with status {batch.status}")
+            results = read_openai_results(openai_client, batch)
+        else:
+            status = wait_for_bedrock_job(bedrock_batch_client, job["job_arn"], poll_seconds=poll_seconds, sleep=sleep)
+            if status not in ("Completed", "PartiallyCompleted"):
+                print(f"Bedrock job {job['job_arn']} for {model_id} ended with status {status}")
+                written[model_id] = 0
+                continue
+            results = read_bedrock_results(s3_client, job, model_id)
+        written[model_id] = write_bulk_records(s3_client, requests, results, model_id, mode, cohort_tag, bucket_name, object_key_path)
+        print(f"Wrote {written[model_id]} bulk records for {model_id}")
+    return written
@@ -0,0 +1,177 @@
+"""
+Model cascade for the "Auto" model option.
+
+Every question is answered by a small model first (Nova Micro). The answer gets a
+cheap confidence score from signals that need no extra model call:
+
+- the knowledge-base retrieval scores (top score and top-1/top-2 margin)
+- an "I don't know"-style reply
+- a very short answer
+- no URLs in a KB-Website answer, or URLs whose hosts never appear in the retrieved sources
+
+If the confidence is below the threshold, the question is escalated to the large
+model (Claude 3.5 Sonnet). If the escalation fails or overruns its time budget,
+the small model's answer is used after all. Requests, escalations, reasons and
+confidences are recorded in the metrics registry.
+"""
+
+import re
+from urllib.parse import urlparse
+
+from metrics import metrics as default_metrics
+
+AUTO_MODEL_ID = "auto"
+
+DEFAULT_CASCADE_MODELS = (
+    "us.amazon.nova-micro-v1:0",
+    "us.anthropic.claude-3-5-sonnet-20241022-v2:0",
+)
+
+UNCERTAIN_PHRASES = (
+    "i don't know", "i do not know", "i'm not sure", "i am not sure", "unable to find",
+    "could not find", "couldn't find", "no information", "not able to provide", "cannot provide",
+)
+
+# How much each warning sign lowers the confidence (which starts at 1.0).
+PENALTIES = {
+    "uncertain": 0.6,
+    "weak_retrieval": 0.4,
+    "ambiguous_retrieval": 0.2,
+    "short": 0.3,
+    "no_urls": 0.3,
+    "unsupported_urls": 0.3,
+}
+
+_URL_RE = re.compile(r"https?://[^\s)\]>\"'`]+")
+
+
+def retrieval_stats(retrieval_results):
+    """
+    Top score and top-1/top-2 margin of the knowledge-base results.
+
+    Returns:
+        tuple | None: (top_score, margin), or None if there are no scored results
+    """
+    if not isinstance(retrieval_results, list):
+        return None
+    scores = sorted((r.get("score", 0.0) for r in retrieval_results if isinstance(r, dict)), reverse=True)
+    if not scores:
+        return None
+    margin = scores[0] - scores[1] if len(scores) > 1 else scores[0]
+    return scores[0], margin
+
+
+def _retrieved_hosts(retrieval_results):
+    hosts = set()
+    for result in retrieval_results if isinstance(retrieval_results, list) else ():
+        url = ((result.get("location") or {}).get("webLocation") or {}).get("url") if isinstance(result, dict) else None
+        if url:
+            hosts.add(urlparse(url).netloc.lower())
+    return hosts
+
+
+def score_answer_confidence(output_text, retrieval_results=None, mode=None, min_retrieval_score=0.4,
+                            min_margin=0.01, min_answer_chars=200):
+    """
+    Cheap confidence score for an answer.
+
+    Args:
+        output_text (str): Model answer
+        retrieval_results (list | None): Raw get_context results the prompt was built from
+        mode (str): Bot mode; URL checks apply to "KB-Website"
+
+    Returns:
+        tuple: (confidence between 0 and 1, list of warning signs)
+    """
+    text = (output_text or "").strip()
+    if not text:
+        return 0.0, ["empty"]
+
+    reasons = []
+    lowered = text.lower()
+    if any(phrase in lowered for phrase in UNCERTAIN_PHRASES):
+        reasons.append("uncertain")
+    if len(text) < min_answer_chars:
+        reasons.append("short")
+
+    stats = retrieval_stats(retrieval_results)
+    if stats is not None:
+        top_score, margin = stats
+        if top_score < min_retrieval_score:
+            reasons.append("weak_retrieval")
+        elif margin < min_margin and top_score < 2 * min_retrieval_score:
+            reasons.append("ambiguous_retrieval")
+
+    if mode == "KB-Website":
+        urls = _URL_RE.findall(text)
+        hosts = _retrieved_hosts(retrieval_results)
+        if not urls:
+            reasons.append("no_urls")
+        elif hosts and not any(urlparse(url).netloc.lower() in hosts for url in urls):
+            reasons.append("unsupported_urls")
+
+    confidence = max(0.0, 1.0 - sum(PENALTIES[reason] for reason in reasons))
+    return confidence, reasons
+
+
+class CascadeRouter:
+    """
+    Answer with the first model and escalate down the list while confidence is low.
+
+    Args:
+        models (tuple): Model ids from cheapest to most capable
+        threshold (float): Confidence below which the next model is tried
+        registry (MetricsRegistry): Where cascade counters are kept
+    """
+
+    def __init__(self, models=DEFAULT_CASCADE_MODELS, threshold=0.6, registry=None, **score_kwargs):
+        self.models = tuple(models)
+        self.threshold = threshold
+        self.metrics = registry or default_metrics
+        self.score_kwargs = score_kwargs
+
+    def run(self, answer, retrieval_results=None, mode=None):
+        """
+        Args:
+            answer (callable): Takes a model id, returns (model id used, output text).
+                Errors on the first model propagate; an escalated step that raises
+                (e.g. a StageTimeout) falls back to the previous answer.
+
+        Returns:
+            tuple: (model id used, output text)
+        """
+        first = self.models[0]
+        self.metrics.increment("cascade_requests", model=first)
+        previous = None
+        for index, model_id in enumerate(self.models):
+            if previous is None:
+                used_model, output_text = answer(model_id)
+            else:
+                try:
+                    used_model, output_text = answer(model_id)
+                except Exception as e:
+                    self.metrics.increment("cascade_escalation_failures", model=model_id)
+                    print(f"Cascade: {model_id} failed ({e}); keeping the {previous[0]} answer")
+                    self.metrics.increment("cascade_answers", model=previous[0])
+                    return previous
+            confidence, reasons = score_answer_confidence(output_text, retrieval_results, mode, **self.score_kwargs)
+            self.metrics.observe("cascade_confidence", confidence, model=model_id)
+            if confidence >= self.threshold or index == len(self.models) - 1:
+                self.metrics.increment("cascade_answers", model=used_model)
+                return used_model, output_text
+
+            previous = (used_model, output_text)
+            next_model = self.models[index + 1]
+            self.metrics.increment("cascade_escalations", model=model_id, escalate_to=next_model)
+            for reason in reasons:
+                self.metrics.increment("cascade_escalation_reasons", reason=reason)
+            print(f"Cascade: escalating {model_id} -> {next_model} (confidence {confidence:.2f}, {', '.join(reasons)}); "
+                  f"escalation rate {self.escalation_rate():.1%}")
+
+    def escalation_rate(self):
+        """Share of cascaded requests that left the first model."""
+        requests = self.metrics.counter("cascade_requests", model=self.models[0])
+        if not requests or len(self.models) < 2:
+            return 0.0
+        escalations = self.metrics.counter("cascade_escalations", model=self.models[0], escalate_to=self.models[1])
+        return escalations / requests
@@ -0,0 +1,206 @@
+"""
+Circuit breakers per (provider, model) around the model calls.
+
+A breaker watches the last `window` calls to one model. When enough of them fail,
+or are slower than `slow_call_seconds`, it opens: calls to that model fail
+immediately (CircuitOpenError) instead of waiting for the SDK timeout, or are
+rerouted to a configured fallback model. After `open_seconds` it lets a probe
+call through (half-open); a successful probe closes it again, a failed one
+reopens it.
+
+Breaker state is published to the metrics registry:
+
+    circuit_state{provider, model}        gauge: 0 closed, 1 half-open, 2 open
+    circuit_transitions{provider, model, state}
+    circuit_rejected{provider, model}     calls failed fast while open
+    circuit_fallbacks{model, fallback}    calls rerouted to the fallback model
+"""
+
+import threading
+import time
+from collections import deque
+
+from metrics import metrics as default_metrics
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# Fallbacks go to another provider where possible, so one provider's outage does not take both down.
+DEFAULT_FALLBACK_MODELS = {
+    "us.amazon.nova-pro-v1:0": "gpt-4o",
+    "us.amazon.nova-micro-v1:0": "us.anthropic.claude-3-5-haiku-20241022-v1:0",
+    "us.anthropic.claude-3-5-haiku-20241022-v1:0": "us.amazon.nova-pro-v1:0",
+    "us.anthropic.claude-3-5-sonnet-20241022-v2:0": "gpt-4o",
+    "gpt-4-turbo": "us.amazon.nova-pro-v1:0",
+    "gpt-4o": "us.anthropic.claude-3-5-sonnet-20241022-v2:0",
+}
+
+
+def model_provider_name(model_id):
+    """Provider serving a model id, as get_model_response dispatches it."""
+    if model_id.find("nova")!=-1 or model_id.find("claude")!=-1:
+        return "bedrock"
+    if model_id.find("gpt")!=-1:
+        return "openai"
+    return "bedrock-agent"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a model whose breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Error-rate and slow-call-rate breaker for one (provider, model).
+
+    Args:
+        window (int): Number of recent calls the rates are computed over
+        min_calls (int): Calls needed in the window before the breaker can trip
+        failure_rate_threshold (float): Failure share that opens the breaker
+        slow_call_seconds (float): Calls slower than this count as slow
+        slow_call_rate_threshold (float): Slow-call share that opens the breaker
+        open_seconds (float): How long to fail fast before probing
+        half_open_max_calls (int): Probe calls allowed at once while half-open
+    """
+
+    def __init__(self, provider, model_id, window=20, min_calls=5, failure_rate_threshold=0.5,
+                 slow_call_seconds=30.0, slow_call_rate_threshold=0.8, open_seconds=30.0,
+                 half_open_max_calls=1, clock=time.monotonic, registry=None):
+        self.provider = provider
+        self.model_id = model_id
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self.clock = clock
+        self.metrics = registry or default_metrics
+
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = None
+        self._probes = 0
+        self.state = CLOSED
+        self._publish()
+
+    def _labels(self):
+        return {"provider": self.provider, "model": self.model_id}
+
+    def _publish(self):
+        self.metrics.set_gauge("circuit_state", STATE_VALUES[self.state], **self._labels())
+
+    def _transition(self, state):
+        if state == self.state:
+            return
+        print(f"Circuit {self.provider}/{self.model_id}: {self.state} -> {state}")
+        self.state = state
+        if state == OPEN:
+            self._opened_at = self.clock()
+        if state in (CLOSED, OPEN):
+            self._outcomes.clear()
+        self._probes = 0
+        self.metrics.increment("circuit_transitions", state=state, **self._labels())
+        self._publish()
+
+    def allow_request(self):
+        """True if a call may go through now (reserves a probe slot when half-open)."""
+        with self._lock:
+            if self.state == OPEN and self.clock() - self._opened_at >= self.open_seconds:
+                self._transition(HALF_OPEN)
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and self._probes < self.half_open_max_calls:
+                self._probes += 1
+                return True
+        self.metrics.increment("circuit_rejected", **self._labels())
+        return False
+
+    def record(self, success, latency):
+        with self._lock:
+            slow = latency > self.slow_call_seconds
+            if self.state == HALF_OPEN:
+                self._transition(CLOSED if success and not slow else OPEN)
+                return
+            self._outcomes.append((success, slow))
+            if self.state != CLOSED or len(self._outcomes) < self.min_calls:
+                return
+            failures = sum(1 for ok, _ in self._outcomes if not ok)
+            slow_calls = sum(1 for _, is_slow in self._outcomes if is_slow)
+            if (failures / len(self._outcomes) >= self.failure_rate_threshold
+                    or slow_calls / len(self._outcomes) >= self.slow_call_rate_threshold):
+                self._transition(OPEN)
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Run fn through the breaker. A None result counts as a failure but is still returned
+        (send_prompt_to_agent reports errors that way).
+
+        Raises:
+            CircuitOpenError: If the breaker is open
+        """
+        if not self.allow_request():
+            raise CircuitOpenError(f"Circuit open for {self.provider}/{self.model_id}")
+        start_time = time.time()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.record(False, time.time() - start_time)
+            raise
+        self.record(result is not None, time.time() - start_time)
+        return result
+
+
+class CircuitBreakerRegistry:
+    """
+    One CircuitBreaker per (provider, model), plus fallback routing.
+
+    Args:
+        fallback_models (dict): Model id -> model id to reroute to when it is unavailable
+        **breaker_kwargs: Passed to every CircuitBreaker
+    """
+
+    def __init__(self, fallback_models=None, registry=None, **breaker_kwargs):
+        self.fallback_models = dict(DEFAULT_FALLBACK_MODELS if fallback_models is None else fallback_models)
+        self.metrics = registry or default_metrics
+        self.breaker_kwargs = breaker_kwargs
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, model_id):
+        provider = model_provider_name(model_id)
+        with self._lock:
+            breaker = self._breakers.get((provider, model_id))
+            if breaker is None:
+                breaker = self._breakers[(provider, model_id)] = CircuitBreaker(
+                    provider, model_id, registry=self.metrics, **self.breaker_kwargs
+                )
+        return breaker
+
+    def states(self):
+        with self._lock:
+            return {f"{provider}/{model_id}": breaker.state for (provider, model_id), breaker in self._breakers.items()}
+
+    def call(self, model_id, call, allow_fallback=True):
+        """
+        Call `call(model_id)` through its breaker, rerouting to the fallback model if
+        the breaker is open or this call's failure just opened it. Other failures are
+        raised as before.
+
+        Returns:
+            tuple: (model id that answered, result)
+        """
+        try:
+            return model_id, self.get(model_id).call(call, model_id)
+        except Exception as e:
+            fallback_id = self.fallback_models.get(model_id) if allow_fallback else None
+            unavailable = isinstance(e, CircuitOpenError) or self.get(model_id).state != CLOSED
+            if not fallback_id or not unavailable:
+                raise
+            print(f"Circuit: rerouting {model_id} -> {fallback_id} ({e})")
+            self.metrics.increment("circuit_fallbacks", model=model_id, fallback=fallback_id)
+            return fallback_id, self.get(fallback_id).call(call, fallback_id)
@@ -0,0 +1,140 @@
+"""
+Per-request deadlines for the answer pipeline.
+
+A Deadline is created when a resident's question arrives and is passed through
+retrieval, generation and the report write. Each stage runs under the smaller of
+its own budget and the time left on the request; when a stage overruns, the
+request degrades instead of waiting:
+
+- retrieval overruns: answer without knowledge-base context
+- retrieval used most of its budget, or less than the generation and report
+  budgets are left: switch to a faster model
+- generation overruns: return a short apology instead of an answer
+- report write overruns (or no time left): drop the write
+
+Stages run on a shared worker pool so the caller can stop waiting. An abandoned
+call keeps running until the client-level timeouts below end it, so clients used
+with a Deadline should be built with bedrock_client_config / OPENAI_TIMEOUT_SECONDS.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from botocore.config import Config
+
+DEFAULT_REQUEST_SECONDS = 45.0
+
+DEFAULT_STAGE_BUDGETS = {
+    "retrieval": 6.0,
+    "generation": 35.0,
+    "report": 3.0,
+}
+
+# Generation moves to FAST_MODEL_ID when retrieval used more than this share of its
+# budget, or when the time left no longer covers the generation and report budgets.
+FAST_MODEL_ID = "us.amazon.nova-micro-v1:0"
+SLOW_STAGE_FRACTION = 0.75
+
+# Socket timeout for the bedrock-agent-runtime client. It serves both retrieve, which
+# answer_query bounds with the retrieval budget, and invoke_agent, whose orchestration
+# can run well past 10 s before the first chunk arrives.
+AGENT_READ_TIMEOUT_SECONDS = 60
+
+OPENAI_TIMEOUT_SECONDS = 40.0
+
+TIMEOUT_MESSAGE = (
+    "Sorry, this is taking longer than expected. Please try again in a moment, "
+    "or visit https://wa.gov for help finding Washington State services."
+)
+
+_stage_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="deadline-stage")
+
+
+def bedrock_client_config(read_timeout=40, connect_timeout=3, max_attempts=2):
+    """botocore Config that bounds every Bedrock/S3 call, so no request waits on a socket forever."""
+    return Config(
+        connect_timeout=connect_timeout,
+        read_timeout=read_timeout,
+        retries={"max_attempts": max_attempts, "mode": "standard"}
+    )
+
+
+class StageTimeout(Exception):
+    """Raised by Deadline.run when a stage does not finish within its budget."""
+
+
+class Deadline:
+    """Time budget for one request, shared by all of its stages."""
+
+    def __init__(self, total_seconds=DEFAULT_REQUEST_SECONDS, stage_budgets=None, clock=time.monotonic):
+        self.total_seconds = total_seconds
+        self.stage_budgets = dict(DEFAULT_STAGE_BUDGETS, **(stage_budgets or {}))
+        self.clock = clock
+        self.started = clock()
+        self.degraded = []
+        self.stage_seconds = {}
+
+    def elapsed(self):
+        return self.clock() - self.started
+
+    def remaining(self):
+        return max(0.0, self.total_seconds - self.elapsed())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def budget(self, stage):
+        """Seconds the stage may use: its own budget, capped by what is left on the request."""
+        return min(self.stage_budgets.get(stage, self.total_seconds), self.remaining())
+
+    def short_of(self, *stages):
+        """True when the time left does not cover the full budgets of the given stages."""
+        return self.remaining() < sum(self.stage_budgets.get(stage, self.total_seconds) for stage in stages)
+
+    def ran_slow(self, stage, fraction=SLOW_STAGE_FRACTION):
+        """True when the stage has run and used more than fraction of its budget."""
+        seconds = self.stage_seconds.get(stage)
+        return seconds is not None and seconds > fraction * self.stage_budgets.get(stage, self.total_seconds)
+
+    def prefer_fast_model(self):
+        """
+        True when generation should move to FAST_MODEL_ID: retrieval was slow (the
+        backends are likely slow too), or the generation and report budgets no longer fit.
+        """
+        return self.ran_slow("retrieval") or self.short_of("generation", "report")
+
+    def mark_degraded(self, reason):
+        self.degraded.append(reason)
+
+    def run(self, stage, fn, *args, **kwargs):
+        """
+        Run fn under the stage budget.
+
+        Returns:
+            The result of fn
+
+        Raises:
+            StageTimeout: If the budget runs out first (fn keeps running in the background)
+        """
+        budget = self.budget(stage)
+        if budget <= 0:
+            raise StageTimeout(f"No time left for {stage}")
+        started = self.clock()
+        future = _stage_pool.submit(fn, *args, **kwargs)
+        try:
+            return future.result(timeout=budget)
+        except FutureTimeoutError:
+            raise StageTimeout(f"{stage} exceeded {budget:.1f}s") from None
+        finally:
+            self.stage_seconds[stage] = self.clock() - started
+
+    def run_or_fallback(self, stage, fallback, fn, *args, **kwargs):
+        """Run fn under the stage budget; on timeout or error record the degradation and return fallback."""
+        try:
+            return self.run(stage, fn, *args, **kwargs)
+        except StageTimeout as e:
+            print(f"Deadline: {e}; degrading")
+        except Exception as e:
+            print(f"Deadline: {stage} failed ({e}); degrading")
+        self.mark_degraded(stage)
+        return fallback
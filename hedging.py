@@ -0,0 +1,121 @@
+"""
+Hedged LLM requests for tail-latency control.
+
+If the primary model has not answered within its observed p95 latency, the same
+prompt is sent to a configured secondary model and whichever finishes first is
+used. The slower call cannot be interrupted mid-request, so it is left to finish
+in the background and its result is ignored (its latency is still recorded).
+
+Latencies, hedge rate and wins are recorded in the metrics registry:
+
+    llm_latency_seconds{model}        every completed call
+    hedge_requests{model}             calls made through the policy
+    hedge_fired{model, secondary}     primary passed its p95 and the secondary was sent
+    hedge_wins{model, secondary}      the secondary's answer was used
+"""
+
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from metrics import metrics as default_metrics
+
+DEFAULT_SECONDARY_MODELS = {
+    "us.amazon.nova-pro-v1:0": "us.anthropic.claude-3-5-haiku-20241022-v1:0",
+    "us.amazon.nova-micro-v1:0": "us.anthropic.claude-3-5-haiku-20241022-v1:0",
+    "us.anthropic.claude-3-5-haiku-20241022-v1:0": "us.amazon.nova-pro-v1:0",
+    "us.anthropic.claude-3-5-sonnet-20241022-v2:0": "us.anthropic.claude-3-5-haiku-20241022-v1:0",
+    "gpt-4-turbo": "gpt-4o",
+    "gpt-4o": "us.amazon.nova-pro-v1:0",
+}
+
+
+class HedgePolicy:
+    """
+    Send a backup request to a secondary model when the primary is slower than its p95.
+
+    Args:
+        secondary_models (dict): Primary model id -> secondary model id
+        quantile (float): Latency quantile of the primary to wait before hedging
+        min_samples (int): Observations needed before the quantile is trusted
+        default_delay (float): Hedge delay (seconds) until min_samples is reached
+        min_delay (float): Lower bound on the hedge delay
+        registry (MetricsRegistry): Where latencies and hedge counters are kept
+    """
+
+    def __init__(self, secondary_models=None, quantile=0.95, min_samples=20, default_delay=10.0,
+                 min_delay=1.0, max_workers=32, registry=None):
+        self.secondary_models = dict(DEFAULT_SECONDARY_MODELS if secondary_models is None else secondary_models)
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.metrics = registry or default_metrics
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+
+    def hedge_delay(self, model_id):
+        """Seconds to wait on the primary before sending the secondary."""
+        if self.metrics.sample_count("llm_latency_seconds", model=model_id) < self.min_samples:
+            return self.default_delay
+        return max(self.min_delay, self.metrics.percentile("llm_latency_seconds", self.quantile, model=model_id))
+
+    def _timed(self, call, model_id):
+        start_time = time.time()
+        result = call(model_id)
+        self.metrics.observe("llm_latency_seconds", time.time() - start_time, model=model_id)
+        return result
+
+    def run(self, call, model_id):
+        """
+        Call `call(model_id)`, hedging to the secondary model if it is slow.
+
+        Args:
+            call (callable): Takes a model id and returns the output text
+            model_id (str): Primary model id
+
+        Returns:
+            tuple: (model id whose answer was used, output text)
+        """
+        self.metrics.increment("hedge_requests", model=model_id)
+        primary = self._pool.submit(self._timed, call, model_id)
+        secondary_id = self.secondary_models.get(model_id)
+        if not secondary_id:
+            return model_id, primary.result()
+
+        done, _ = wait([primary], timeout=self.hedge_delay(model_id))
+        if done:
+            return model_id, primary.result()
+
+        self.metrics.increment("hedge_fired", model=model_id, secondary=secondary_id)
+        secondary = self._pool.submit(self._timed, call, secondary_id)
+        futures = {primary: model_id, secondary: secondary_id}
+
+        pending = set(futures)
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                winner = futures[future]
+                if winner == secondary_id:
+                    self.metrics.increment("hedge_wins", model=model_id, secondary=secondary_id)
+                for loser in pending:
+                    loser.cancel()
+                return winner, future.result()
+        raise error
+
+
+_default_policy = None
+_default_policy_lock = threading.Lock()
+
+
+def get_default_hedge_policy():
+    """Process-wide HedgePolicy, so latency history outlives Streamlit reruns."""
+    global _default_policy
+    if _default_policy is None:
+        with _default_policy_lock:
+            if _default_policy is None:
+                _default_policy = HedgePolicy()
+    return _default_policy
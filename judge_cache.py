@@ -0,0 +1,140 @@
+"""
+Content-addressed cache for LLM judge results.
+
+Judge outputs are keyed by a hash of (user query, response, judge model id,
+judge prompt version), so re-judging an unchanged cohort or restarting a judge
+run returns stored assessments instead of calling the model again.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+
+def judge_cache_key(user_query, response, model_id, prompt_version):
+    """
+    Build the content address for a judge result.
+
+    Args:
+        user_query (str): Question the assessed response answered
+        response (str): Response being judged
+        model_id (str): Judge model id
+        prompt_version (str): Version tag of the judge prompt
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    payload = json.dumps([user_query, response, model_id, prompt_version], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SQLiteJudgeCache:
+    """Local judge cache stored in a single SQLite file. Safe to share across threads."""
+
+    def __init__(self, db_path="judge_cache.sqlite3"):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS judge_results (
+                    key TEXT PRIMARY KEY,
+                    judge_model TEXT,
+                    prompt_version TEXT,
+                    output TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )"""
+            )
+            self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT output FROM judge_results WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, key, output, judge_model=None, prompt_version=None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO judge_results VALUES (?, ?, ?, ?, ?)",
+                (key, judge_model, prompt_version, output, time.time())
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class S3JudgeCache:
+    """Shared judge cache stored as one JSON object per key under an S3 prefix."""
+
+    def __init__(self, s3_client, bucket_name="watech-rppilot-silver", prefix="evaluation_data/judge_cache/"):
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.prefix = prefix if prefix.endswith('/') else prefix + '/'
+
+    def _object_key(self, key):
+        return f"{self.prefix}{key}.json"
+
+    def get(self, key):
+        try:
+            obj = self.s3_client.get_object(Bucket=self.bucket_name, Key=self._object_key(key))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                return None
+            raise
+        data = json.loads(obj['Body'].read().decode('utf-8'))
+        return data.get("output")
+
+    def put(self, key, output, judge_model=None, prompt_version=None):
+        body = json.dumps({
+            "output": output,
+            "judge_model": judge_model,
+            "prompt_version": prompt_version,
+            "created_at": time.time()
+        })
+        self.s3_client.put_object(Bucket=self.bucket_name, Key=self._object_key(key), Body=body)
+
+
+class LayeredJudgeCache:
+    """
+    Check several caches in order (e.g. local SQLite, then S3).
+
+    A hit in a later layer is copied into the earlier ones; writes go to every layer.
+    """
+
+    def __init__(self, *caches):
+        self.caches = caches
+
+    def get(self, key):
+        for i, cache in enumerate(self.caches):
+            output = cache.get(key)
+            if output is not None:
+                for earlier in self.caches[:i]:
+                    earlier.put(key, output)
+                return output
+        return None
+
+    def put(self, key, output, judge_model=None, prompt_version=None):
+        for cache in self.caches:
+            cache.put(key, output, judge_model=judge_model, prompt_version=prompt_version)
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_judge_cache():
+    """Process-wide SQLiteJudgeCache, so Streamlit reruns and sessions share one connection."""
+    global _default_cache
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = SQLiteJudgeCache()
+    return _default_cache
@@ -0,0 +1,222 @@
+"""
+Fast, deterministic language detection for user queries.
+
+langdetect loads its language profiles lazily on first use, is slow on short
+strings and is random unless DetectorFactory.seed is fixed, so the same query can
+come back as different languages and miss the prompt and judge caches. The
+LanguageDetector here loads the profiles once, seeds the factory, answers short
+plain-ASCII queries without running langdetect at all, and memoizes results in
+an LRU cache. langdetect's n-gram profiles have too little to go on in a word or
+two ("hello" comes back as Finnish), so ASCII queries of at most a few words are
+decided from a small word list instead, defaulting to English.
+
+Run this module directly to benchmark it against calling langdetect.detect per query:
+
+    python language.py --items 5000
+"""
+
+import argparse
+import re
+import threading
+import time
+from functools import lru_cache
+
+from langdetect import DetectorFactory, detect
+from langdetect.detector_factory import init_factory
+from langdetect.lang_detect_exception import LangDetectException
+
+UNKNOWN_LANGUAGE = "unknown"
+
+# Common English function words. A short ASCII query made up largely of these is English.
+ENGLISH_STOPWORDS = frozenset("""
+    a about am an and any are as at be can could did do does for from get got had has have how i if in is it
+    its me my need no not of on or our should so that the their there this to was we what when where which
+    who why will with would you your
+""".split())
+
+# Greetings, one-word requests and function words of the languages the prompts support,
+# for queries too short for langdetect. ASCII spellings only; accented text goes to langdetect.
+SHORT_QUERY_WORDS = {
+    **dict.fromkeys("hello hi hey thanks thank yes ok okay help please bye goodbye".split(), "en"),
+    **dict.fromkeys("""hola gracias ayuda adios buenos buenas dias tardes noches favor de la el los las que
+                       como donde mi para por con una""".split(), "es"),
+    **dict.fromkeys("czesc dziekuje pomoc tak dzien dobry prosze jak gdzie czy nie dla".split(), "pl"),
+}
+
+DEFAULT_LANGUAGE = "en"
+
+_WORD_RE = re.compile(r"[a-z']+")
+
+
+class LanguageDetector:
+    """
+    Language detection with an English fast path and an LRU memo.
+
+    Safe to share across threads. Every process builds its own instance the first
+    time get_language_detector is called there.
+    """
+
+    def __init__(self, cache_size=4096, short_input_words=12, min_stopword_ratio=0.25, short_query_words=3, seed=0):
+        self.short_input_words = short_input_words
+        self.short_query_words = short_query_words
+        self.min_stopword_ratio = min_stopword_ratio
+        # Every Detector seeds its RNG from the factory, so a fixed seed makes results reproducible.
+        DetectorFactory.seed = seed
+        init_factory()
+        self._detect_cached = lru_cache(maxsize=cache_size)(self._detect_uncached)
+
+    def _short_query_language(self, text):
+        """Language of an ASCII query of at most short_query_words words, by word-list vote; None otherwise."""
+        if not text.isascii():
+            return None
+        words = _WORD_RE.findall(text.lower())
+        if not words or len(words) > self.short_query_words:
+            return None
+        votes = {}
+        for word in words:
+            language = SHORT_QUERY_WORDS.get(word)
+            if language:
+                votes[language] = votes.get(language, 0) + 1
+        return max(votes, key=votes.get) if votes else DEFAULT_LANGUAGE
+
+    def _is_short_english(self, text):
+        if not text.isascii():
+            return False
+        words = _WORD_RE.findall(text.lower())
+        if not words or len(words) > self.short_input_words:
+            return False
+        stopwords = sum(1 for word in words if word in ENGLISH_STOPWORDS)
+        return stopwords / len(words) >= self.min_stopword_ratio
+
+    def _detect_uncached(self, text):
+        short_query_language = self._short_query_language(text)
+        if short_query_language:
+            return short_query_language
+        if self._is_short_english(text):
+            return "en"
+        try:
+            return detect(text)
+        except LangDetectException:
+            return UNKNOWN_LANGUAGE
+
+    def detect(self, text):
+        """
+        Detect the language of a text.
+
+        Args:
+            text (str): Input text
+
+        Returns:
+            str: ISO 639-1 code such as "en", or "unknown" if it cannot be detected
+        """
+        if not isinstance(text, str):
+            return UNKNOWN_LANGUAGE
+        text = text.strip()
+        if not text:
+            return UNKNOWN_LANGUAGE
+        return self._detect_cached(text)
+
+    def detect_many(self, texts):
+        """
+        Detect the language of each text, running each distinct text only once.
+
+        Returns:
+            list: Language codes in input order
+        """
+        results = {}
+        for text in texts:
+            if text not in results:
+                results[text] = self.detect(text)
+        return [results[text] for text in texts]
+
+    def cache_info(self):
+        return self._detect_cached.cache_info()
+
+    def clear_cache(self):
+        self._detect_cached.cache_clear()
+
+
+_detector = None
+_detector_lock = threading.Lock()
+
+
+def get_language_detector():
+    """Return the process-wide LanguageDetector, creating it on first use."""
+    global _detector
+    if _detector is None:
+        with _detector_lock:
+            if _detector is None:
+                _detector = LanguageDetector()
+    return _detector
+
+
+def clear_language_cache():
+    """
+    Empty the shared detector's memo. Forked worker processes inherit it, so
+    benchmarks clear it to time cold detection in every run.
+    """
+    get_language_detector().clear_cache()
+
+
+def detect_language(text):
+    """Detect a single text with the shared detector."""
+    return get_language_detector().detect(text)
+
+
+def detect_languages(texts):
+    """Detect a batch of texts with the shared detector. Top-level so it can run in a process pool."""
+    return get_language_detector().detect_many(list(texts))
+
+
+def benchmark_language_detection(n_items=5000, distinct=500):
+    """
+    Compare per-call langdetect.detect with the shared LanguageDetector.
+
+    The workload repeats `distinct` queries, which is what a model sweep does
+    (every prompt is assembled once per model and mode).
+
+    Returns:
+        dict: Label -> queries per second
+    """
+    base_queries = [
+        "How do I file for unemployment benefits?",
+        "Where can I renew my driver license",
+        "¿Cómo renuevo mi licencia de conducir?",
+        "Jak złożyć wniosek o zasiłek dla bezrobotnych?",
+        "Làm thế nào để đăng ký phiếu thực phẩm?",
+        "food stamps",
+        "What documents do I need to apply for child care assistance in Washington State?",
+    ]
+    queries = [f"{base_queries[i % len(base_queries)]} {i % distinct}" for i in range(n_items)]
+    results = {}
+
+    start = time.perf_counter()
+    for query in queries:
+        try:
+            detect(query)
+        except LangDetectException:
+            pass
+    results["langdetect.detect"] = n_items / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    detector = LanguageDetector()
+    detector.detect_many(queries)
+    results["LanguageDetector (cold)"] = n_items / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    detector.detect_many(queries)
+    results["LanguageDetector (warm)"] = n_items / (time.perf_counter() - start)
+
+    baseline = results["langdetect.detect"]
+    print(f"Language detection over {n_items} queries ({distinct} distinct)")
+    for label, rate in results.items():
+        print(f"  {label:<24} {rate:12.1f} queries/s  {rate / baseline:8.2f}x")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark language detection")
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--distinct", type=int, default=500)
+    args = parser.parse_args()
+    benchmark_language_detection(args.items, args.distinct)
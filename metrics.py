@@ -0,0 +1,116 @@
+"""
+In-process metrics registry.
+
+Counters, gauges and bounded latency samples keyed by metric name plus labels, e.g.
+
+    metrics.increment("hedge_fired", model="us.amazon.nova-pro-v1:0")
+    metrics.observe("llm_latency_seconds", 2.31, model="us.amazon.nova-pro-v1:0")
+    metrics.percentile("llm_latency_seconds", 0.95, model="us.amazon.nova-pro-v1:0")
+
+The module-level `metrics` registry lives for the life of the process, so it
+survives Streamlit reruns and is shared by every session.
+"""
+
+import threading
+from collections import deque
+
+
+def _series_key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _nearest_rank(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values))) - 1))]
+
+
+class MetricsRegistry:
+    """Thread-safe counters, gauges and sample windows."""
+
+    def __init__(self, window=1000):
+        self.window = window
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._samples = {}
+
+    def increment(self, name, value=1, **labels):
+        key = _series_key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[_series_key(name, labels)] = value
+
+    def gauge(self, name, **labels):
+        with self._lock:
+            return self._gauges.get(_series_key(name, labels))
+
+    def observe(self, name, value, **labels):
+        """Record a sample (e.g. a latency); only the most recent `window` samples are kept."""
+        key = _series_key(name, labels)
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window)
+            samples.append(value)
+
+    def counter(self, name, **labels):
+        with self._lock:
+            return self._counters.get(_series_key(name, labels), 0)
+
+    def sample_count(self, name, **labels):
+        with self._lock:
+            return len(self._samples.get(_series_key(name, labels), ()))
+
+    def percentile(self, name, q, **labels):
+        """
+        Nearest-rank percentile of the recorded samples.
+
+        Args:
+            name (str): Metric name
+            q (float): Quantile between 0 and 1
+
+        Returns:
+            float | None: None if there are no samples
+        """
+        with self._lock:
+            samples = sorted(self._samples.get(_series_key(name, labels), ()))
+        if not samples:
+            return None
+        return _nearest_rank(samples, q)
+
+    def snapshot(self):
+        """
+        Plain-data view of every series.
+
+        Returns:
+            dict: counters and gauges (name -> list of {labels, value}) and samples
+            (name -> list of {labels, count, p50, p95, p99})
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            samples = {key: sorted(values) for key, values in self._samples.items()}
+
+        result = {"counters": {}, "gauges": {}, "samples": {}}
+        for kind, series in (("counters", counters), ("gauges", gauges)):
+            for (name, labels), value in series.items():
+                result[kind].setdefault(name, []).append({"labels": dict(labels), "value": value})
+        for (name, labels), values in samples.items():
+            if not values:
+                continue
+            summary = {"labels": dict(labels), "count": len(values)}
+            for q in (0.50, 0.95, 0.99):
+                summary[f"p{int(q * 100)}"] = _nearest_rank(values, q)
+            result["samples"].setdefault(name, []).append(summary)
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._samples.clear()
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,167 @@
+"""
+Background answer generation with live progress.
+
+Streamlit runs each session's script on its own thread; running answer_query
+inline there blocks the page until every stage is done. submit_with_progress
+runs the pipeline on a shared, process-wide executor instead and returns an
+AnswerProgress right away. The pipeline reports stage transitions and partial
+output on it; the page polls it (see app.py) and renders whatever has arrived,
+so sessions in other tabs keep running side by side.
+
+    answer_queue_wait_seconds      time from submit to a worker picking the job up
+    answer_stage_seconds{stage}
+    background_answers_active      gauge
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import metrics as default_metrics
+
+STAGE_QUEUED = "queued"
+STAGE_RETRIEVING = "retrieving"
+STAGE_DETECTING_LANGUAGE = "detecting language"
+STAGE_GENERATING = "generating"
+STAGE_WAITING_FOR_SHARED = "waiting for the same question asked in another session"
+STAGE_SAVING = "saving"
+STAGE_DONE = "done"
+STAGE_FAILED = "failed"
+
+ANSWER_WORKERS = 8
+
+_answer_pool = ThreadPoolExecutor(max_workers=ANSWER_WORKERS, thread_name_prefix="answer")
+_active = 0
+_active_lock = threading.Lock()
+
+
+class AnswerProgress:
+    """
+    Thread-safe progress of one answer: the current stage, output so far, and the result.
+    Written by the worker, read by the page.
+    """
+
+    def __init__(self, registry=None, clock=time.monotonic):
+        self.metrics = registry or default_metrics
+        self.clock = clock
+        self.started_at = clock()
+        self._lock = threading.Lock()
+        self._stage = STAGE_QUEUED
+        self._stage_started_at = self.started_at
+        self._stages = [(STAGE_QUEUED, 0.0)]
+        self._chunks = []
+        self._attempt = 0
+        self._result = None
+        self._error = None
+        self._done = threading.Event()
+
+    def _enter(self, stage):
+        now = self.clock()
+        self.metrics.observe("answer_stage_seconds", now - self._stage_started_at, stage=self._stage)
+        self._stage, self._stage_started_at = stage, now
+        self._stages.append((stage, now - self.started_at))
+
+    def set_stage(self, stage):
+        with self._lock:
+            if stage != self._stage and not self._done.is_set():
+                self._enter(stage)
+
+    def append(self, text):
+        """Add partial output (e.g. a streamed chunk)."""
+        with self._lock:
+            if not self._done.is_set():
+                self._chunks.append(text)
+
+    def _append_for(self, attempt, text):
+        with self._lock:
+            if attempt == self._attempt and not self._done.is_set():
+                self._chunks.append(text)
+
+    def restart(self):
+        """
+        Drop the partial output and start a new attempt at the answer, e.g. when a larger
+        or fallback model takes over or a model call is abandoned.
+
+        Returns:
+            callable: append for the new attempt. Once restart is called again it drops
+                      its chunks, so an abandoned call still streaming in the background
+                      cannot write over the answer that replaced it.
+        """
+        with self._lock:
+            self._attempt += 1
+            attempt = self._attempt
+            if not self._done.is_set():
+                self._chunks = []
+        return lambda text: self._append_for(attempt, text)
+
+    def finish(self, result):
+        with self._lock:
+            self._result = result
+            self._enter(STAGE_DONE)
+            self._done.set()
+
+    def fail(self, error):
+        with self._lock:
+            self._error = error
+            self._enter(STAGE_FAILED)
+            self._done.set()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Block until the answer is finished; returns True if it is."""
+        return self._done.wait(timeout)
+
+    def snapshot(self):
+        """
+        Consistent view for rendering.
+
+        Returns:
+            dict: stage, partial (output so far), done, result, error, elapsed_seconds,
+                  stages (list of (stage, seconds since submit))
+        """
+        with self._lock:
+            return {
+                "stage": self._stage,
+                "partial": "".join(self._chunks),
+                "done": self._done.is_set(),
+                "result": self._result,
+                "error": self._error,
+                "elapsed_seconds": self.clock() - self.started_at,
+                "stages": list(self._stages),
+            }
+
+
+def _set_active(delta, registry):
+    global _active
+    with _active_lock:
+        _active += delta
+        registry.set_gauge("background_answers_active", _active)
+
+
+def submit_with_progress(fn, *args, registry=None, **kwargs):
+    """
+    Run fn(*args, progress=<AnswerProgress>, **kwargs) on the shared answer executor.
+
+    Returns:
+        AnswerProgress: Finished with fn's return value, or failed with its exception
+    """
+    registry = registry or default_metrics
+    progress = AnswerProgress(registry)
+    submitted_at = time.monotonic()
+
+    def run():
+        registry.observe("answer_queue_wait_seconds", time.monotonic() - submitted_at)
+        _set_active(1, registry)
+        try:
+            progress.finish(fn(*args, progress=progress, **kwargs))
+        except Exception as e:
+            print(f"Background answer failed: {str(e)}")
+            progress.fail(e)
+        finally:
+            _set_active(-1, registry)
+
+    _answer_pool.submit(run)
+    return progress
@@ -0,0 +1,208 @@
+"""
+Multi-region Bedrock client pool with latency-based routing and failover.
+
+RegionalClientPool holds one client per configured region and can be passed
+anywhere a bedrock-runtime client is used: `pool.invoke_model(...)` is routed to
+the region with the best score (EWMA latency plus a penalty for its EWMA error
+rate, which halves every error_half_life_seconds without new errors). If that
+region fails with a retryable error (throttling, 5xx, connection or read timeout),
+the call moves to the next region. A small share of calls goes to a random other
+region so latency changes are noticed.
+
+Endpoints can be overridden per region (e.g. local stub servers in tests):
+
+    pool = RegionalClientPool(["us-west-2", "us-east-1"], session=session,
+                              endpoint_overrides={"us-west-2": "http://localhost:9001"})
+
+Per-region state is published to the metrics registry:
+
+    region_latency_ewma{service, region}   gauge, seconds
+    region_error_ewma{service, region}     gauge, 0..1
+    region_requests{service, region}
+    region_failovers{service, region}      calls that left a region after a retryable error
+"""
+
+import random
+import threading
+import time
+
+import boto3
+from botocore.exceptions import (
+    ClientError, ConnectionClosedError, ConnectTimeoutError, EndpointConnectionError, ReadTimeoutError
+)
+
+from metrics import metrics as default_metrics
+
+DEFAULT_BEDROCK_REGIONS = ("us-west-2", "us-east-1", "us-east-2")
+
+RETRYABLE_ERROR_CODES = {
+    "ThrottlingException", "ServiceUnavailableException", "InternalServerException",
+    "ModelNotReadyException", "ModelTimeoutException", "ServiceQuotaExceededException",
+}
+
+_CONNECTION_ERRORS = (ConnectionClosedError, ConnectTimeoutError, EndpointConnectionError, ReadTimeoutError)
+
+
+def is_retryable_error(error):
+    """True for errors another region may not have (throttling, 5xx, connection problems)."""
+    if isinstance(error, _CONNECTION_ERRORS):
+        return True
+    if isinstance(error, ClientError):
+        code = error.response.get("Error", {}).get("Code")
+        status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+        return code in RETRYABLE_ERROR_CODES or status >= 500
+    return False
+
+
+class RegionStats:
+    """EWMA latency and error rate of one region. The error rate also decays with time."""
+
+    def __init__(self, alpha, error_half_life_seconds, clock):
+        self.alpha = alpha
+        self.error_half_life_seconds = error_half_life_seconds
+        self.clock = clock
+        self.latency = None
+        self._error_rate = 0.0
+        self._updated = clock()
+
+    @property
+    def error_rate(self):
+        age = self.clock() - self._updated
+        return self._error_rate * 0.5 ** (age / self.error_half_life_seconds)
+
+    def record(self, latency, error):
+        if not error:
+            self.latency = latency if self.latency is None else (1 - self.alpha) * self.latency + self.alpha * latency
+        self._error_rate = (1 - self.alpha) * self.error_rate + self.alpha * (1.0 if error else 0.0)
+        self._updated = self.clock()
+
+
+class RegionalClientPool:
+    """
+    Route calls for one AWS service across regions.
+
+    Args:
+        regions (list): Region names in order of preference (used until latencies are known)
+        service (str): boto3 service name
+        session (boto3.Session): Session the clients are created from
+        endpoint_overrides (dict): Region -> endpoint URL
+        config (botocore.config.Config): Client config (timeouts, retries)
+        alpha (float): EWMA smoothing factor
+        error_penalty_seconds (float): Seconds added to a region's score per unit of EWMA error rate
+        error_half_life_seconds (float): Time for a region's error rate to halve without new errors
+        explore_rate (float): Share of calls sent to a random non-best region
+        client_factory (callable): (region, endpoint_url) -> client, replaces session.client
+    """
+
+    def __init__(self, regions=DEFAULT_BEDROCK_REGIONS, service="bedrock-runtime", session=None,
+                 endpoint_overrides=None, config=None, alpha=0.2, error_penalty_seconds=30.0,
+                 error_half_life_seconds=30.0, explore_rate=0.05, client_factory=None, registry=None,
+                 rng=None, clock=time.monotonic):
+        if not regions:
+            raise ValueError("RegionalClientPool needs at least one region")
+        self.regions = list(regions)
+        self.service = service
+        self.error_penalty_seconds = error_penalty_seconds
+        self.explore_rate = explore_rate
+        self.metrics = registry or default_metrics
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self._stats = {region: RegionStats(alpha, error_half_life_seconds, clock) for region in self.regions}
+
+        endpoint_overrides = endpoint_overrides or {}
+        if client_factory is None:
+            session = session or boto3.Session()
+
+            def client_factory(region, endpoint_url):
+                return session.client(service, region_name=region, endpoint_url=endpoint_url, config=config)
+
+        self._clients = {region: client_factory(region, endpoint_overrides.get(region)) for region in self.regions}
+
+    def _score(self, region):
+        stats = self._stats[region]
+        # Regions without a latency sample yet keep their configured order, ahead of measured ones.
+        latency = stats.latency if stats.latency is not None else 0.001 * self.regions.index(region)
+        return latency + self.error_penalty_seconds * stats.error_rate
+
+    def ranked_regions(self):
+        """Regions best first; occasionally a random other region is moved to the front."""
+        with self._lock:
+            ranked = sorted(self.regions, key=self._score)
+        if len(ranked) > 1 and self._rng.random() < self.explore_rate:
+            explore = self._rng.choice(ranked[1:])
+            ranked.remove(explore)
+            ranked.insert(0, explore)
+        return ranked
+
+    def _record(self, region, latency, error):
+        with self._lock:
+            stats = self._stats[region]
+            stats.record(latency, error)
+            latency_ewma, error_ewma = stats.latency, stats.error_rate
+        labels = {"service": self.service, "region": region}
+        if latency_ewma is not None:
+            self.metrics.set_gauge("region_latency_ewma", latency_ewma, **labels)
+        self.metrics.set_gauge("region_error_ewma", error_ewma, **labels)
+
+    def invoke(self, operation, **kwargs):
+        """
+        Call a client operation in the best region, failing over on retryable errors.
+
+        Raises:
+            The last error if every region failed, or the first non-retryable error
+        """
+        last_error = None
+        for region in self.ranked_regions():
+            labels = {"service": self.service, "region": region}
+            self.metrics.increment("region_requests", **labels)
+            start_time = time.time()
+            try:
+                result = getattr(self._clients[region], operation)(**kwargs)
+            except Exception as e:
+                if not is_retryable_error(e):
+                    raise
+                self._record(region, time.time() - start_time, error=True)
+                self.metrics.increment("region_failovers", **labels)
+                print(f"Region {region} failed {operation} ({e}); failing over")
+                last_error = e
+                continue
+            self._record(region, time.time() - start_time, error=False)
+            return result
+        raise last_error
+
+    def stats(self):
+        """Plain-data view: region -> latency EWMA, error EWMA and score."""
+        with self._lock:
+            return {
+                region: {"latency_ewma": s.latency, "error_ewma": s.error_rate, "score": self._score(region)}
+                for region, s in self._stats.items()
+            }
+
+    def client(self, region):
+        return self._clients[region]
+
+    def __getattr__(self, operation):
+        # Lets the pool stand in for a boto3 client: pool.invoke_model(...) -> pool.invoke("invoke_model", ...).
+        if operation.startswith("_"):
+            raise AttributeError(operation)
+
+        def call(**kwargs):
+            return self.invoke(operation, **kwargs)
+        return call
+
+
+_shared_pools = {}
+_shared_pools_lock = threading.Lock()
+
+
+def get_shared_pool(regions, service="bedrock-runtime", endpoint_overrides=None, **kwargs):
+    """
+    Process-wide RegionalClientPool for a region list, so latency history survives
+    Streamlit reruns (the first call's session and config are kept).
+    """
+    key = (service, tuple(regions), tuple(sorted((endpoint_overrides or {}).items())))
+    with _shared_pools_lock:
+        pool = _shared_pools.get(key)
+        if pool is None:
+            pool = _shared_pools[key] = RegionalClientPool(regions, service=service, endpoint_overrides=endpoint_overrides, **kwargs)
+    return pool
@@ -0,0 +1,103 @@
+"""
+Singleflight coalescing of identical in-flight requests.
+
+When several callers ask for the same key at the same time, only the first (the
+leader) runs the work; the others wait for it and share its result or its
+exception. Nothing is cached after the leader finishes: the next request for the
+key starts a new execution.
+
+answer_query uses this for questions asked without chat history, keyed by the
+normalized question, model, mode and knowledge base, so a burst of identical
+questions costs one retrieval and one generation.
+"""
+
+import re
+import threading
+
+from metrics import metrics as default_metrics
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_question(question):
+    """Case-fold, collapse whitespace and drop trailing punctuation."""
+    return _WHITESPACE_RE.sub(" ", str(question).casefold()).strip().rstrip("?.!¿¡ ")
+
+
+def coalescing_key(question, model_id, mode, kb_id):
+    return normalize_question(question), model_id, mode, kb_id
+
+
+class CoalescedTimeout(TimeoutError):
+    """A follower gave up waiting for the in-flight execution."""
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """Share one execution of fn among concurrent callers with the same key."""
+
+    def __init__(self, name="answer", registry=None):
+        self.name = name
+        self.metrics = registry or default_metrics
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, timeout=None, on_follow=None):
+        """
+        Run fn() for key, or wait for the execution already in flight.
+
+        Args:
+            key: Hashable request key
+            fn (callable): Work to run if no call for key is in flight
+            timeout (float): Longest a follower waits for the leader (None waits indefinitely)
+            on_follow (callable): Called before a follower starts waiting (e.g. to report it)
+
+        Returns:
+            tuple: (result, shared) where shared is True for followers
+
+        Raises:
+            CoalescedTimeout: If a follower's timeout runs out first
+            The leader's exception, in the leader and in every follower
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.followers += 1
+
+        if leader:
+            self.metrics.increment("singleflight_leaders", flight=self.name)
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+                if call.followers:
+                    print(f"Singleflight: {call.followers} request(s) shared one {self.name} execution")
+            return call.result, False
+
+        self.metrics.increment("singleflight_followers", flight=self.name)
+        if on_follow is not None:
+            on_follow()
+        if not call.done.wait(timeout):
+            raise CoalescedTimeout(f"Timed out waiting for in-flight {self.name}")
+        if call.error is not None:
+            raise call.error
+        return call.result, True
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
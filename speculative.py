@@ -0,0 +1,169 @@
+"""
+Speculative knowledge-base retrieval from partial speech transcripts.
+
+While the user is still speaking, a streaming STT backend reports partial
+hypotheses. Once a partial has stayed the same for a few updates (the speaker
+paused, or the recognizer settled on it), SpeculativeRetriever starts the
+retrieval for it in the background. When the final transcript arrives, the
+speculative result is used if the final text is close enough to the text it
+was retrieved for (difflib similarity of the normalized texts); otherwise it is
+discarded and the caller retrieves for the final transcript as usual, so the
+answer is only built from retrieval that matches what the user said.
+
+What this hides in the voice bot today is limited. audio_recorder hands over the
+clip only after the user has stopped speaking, and the Google backend reports no
+partials at all, so no retrieval runs while the user is still talking. The only
+gain is with the Vosk backend: partials arrive while the finished clip is being
+decoded, so retrieval overlaps with the rest of the decoding. At most the
+remaining decode time is saved, a fraction of a second on a short question.
+Hiding retrieval behind the speech itself needs a live chunk source (microphone
+chunks fed to stt.recognize_chunks while recording), which the Streamlit
+recorder does not provide. benchmark_clip measures the overlap on a recorded
+clip:
+
+    python speculative.py question.wav --backend vosk --retrieval-seconds 0.8
+
+    speculative_retrieval_started
+    speculative_retrieval_hits / speculative_retrieval_misses
+    speculative_retrieval_saved_seconds   retrieval time already spent when the final transcript arrived
+"""
+
+import argparse
+import difflib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import speech_recognition as sr
+
+from metrics import MetricsRegistry, metrics as default_metrics
+from singleflight import normalize_question
+
+_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="speculative")
+
+
+def transcript_similarity(a, b):
+    """Similarity ratio (0..1) of two transcripts after normalization."""
+    return difflib.SequenceMatcher(None, normalize_question(a), normalize_question(b)).ratio()
+
+
+class SpeculativeRetriever:
+    """
+    Start retrieval on stable partial transcripts and reuse it for a matching final one.
+
+    Args:
+        retrieve (callable): Takes a transcript, returns the retrieval result
+        stable_updates (int): Identical consecutive partials needed before speculating
+        min_words (int): Shortest partial worth retrieving for
+        min_similarity (float): Similarity to the final transcript needed to reuse a result
+    """
+
+    def __init__(self, retrieve, stable_updates=2, min_words=3, min_similarity=0.9, registry=None,
+                 clock=time.monotonic):
+        self.retrieve = retrieve
+        self.stable_updates = stable_updates
+        self.min_words = min_words
+        self.min_similarity = min_similarity
+        self.metrics = registry or default_metrics
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._last_partial = None
+        self._repeats = 0
+        self._speculated_text = None
+        self._future = None
+        self._started_at = None
+
+    def _timed_retrieve(self, text):
+        start_time = self.clock()
+        result = self.retrieve(text)
+        return result, self.clock() - start_time
+
+    def on_partial(self, text):
+        """Feed each partial hypothesis as the STT backend reports it."""
+        with self._lock:
+            if text == self._last_partial:
+                self._repeats += 1
+            else:
+                self._last_partial, self._repeats = text, 1
+            if self._repeats < self.stable_updates or len(text.split()) < self.min_words:
+                return
+            if self._speculated_text is not None and transcript_similarity(text, self._speculated_text) >= self.min_similarity:
+                return
+            # A newer stable hypothesis replaces the previous speculation.
+            self._speculated_text = text
+            self._started_at = self.clock()
+            self._future = _pool.submit(self._timed_retrieve, text)
+            self.metrics.increment("speculative_retrieval_started")
+            print(f"Speculative retrieval started for partial transcript: {text!r}")
+
+    def result_for(self, final_text):
+        """
+        Retrieval result for the final transcript, if a close enough speculation exists.
+
+        Returns:
+            The speculative retrieval result, or None if the caller should retrieve itself
+        """
+        with self._lock:
+            future, speculated_text, started_at = self._future, self._speculated_text, self._started_at
+        if future is None:
+            return None
+
+        similarity = transcript_similarity(final_text, speculated_text)
+        if similarity < self.min_similarity:
+            future.cancel()
+            self.metrics.increment("speculative_retrieval_misses")
+            print(f"Speculative retrieval discarded (similarity {similarity:.2f}): {speculated_text!r} vs {final_text!r}")
+            return None
+
+        head_start = self.clock() - started_at
+        try:
+            result, duration = future.result()
+        except Exception as e:
+            self.metrics.increment("speculative_retrieval_misses")
+            print(f"Speculative retrieval failed: {str(e)}")
+            return None
+        self.metrics.increment("speculative_retrieval_hits")
+        self.metrics.observe("speculative_retrieval_saved_seconds", min(head_start, duration))
+        return result
+
+
+def benchmark_clip(path, backend="vosk", retrieval_seconds=0.8, chunk_seconds=0.25):
+    """
+    Decode a recorded clip the way talkie does (trim, then stream through the backend)
+    with speculation on, and report how much of a simulated retrieval it hid.
+
+    Returns:
+        dict: transcript, decode_seconds (feeding the clip to the final transcript),
+              speculated (bool), saved_seconds (retrieval time already spent when the
+              final transcript arrived)
+    """
+    from stt import SAMPLE_RATE, SAMPLE_WIDTH, audio_data_to_pcm, get_stt_backend, recognize_chunks, split_pcm
+    from vad import trim_and_normalize
+
+    with sr.AudioFile(path) as source:
+        audio = sr.Recognizer().record(source)
+    pcm = trim_and_normalize(audio_data_to_pcm(audio))
+    stt_backend = get_stt_backend(backend)
+
+    registry = MetricsRegistry()
+    speculative = SpeculativeRetriever(lambda text: time.sleep(retrieval_seconds) or text, registry=registry)
+    start = time.perf_counter()
+    transcript, _ = recognize_chunks(stt_backend, split_pcm(pcm, chunk_seconds), on_partial=speculative.on_partial, registry=registry)
+    decode_seconds = time.perf_counter() - start
+    speculated = speculative.result_for(transcript) is not None
+    saved = registry.percentile("speculative_retrieval_saved_seconds", 1.0) if speculated else 0.0
+
+    print(f"{path}: {len(pcm) / (SAMPLE_RATE * SAMPLE_WIDTH):.1f}s of audio, decoded by {backend} in {decode_seconds:.3f}s")
+    print(f"  transcript: {transcript!r}")
+    print(f"  speculative retrieval {'hit' if speculated else 'not used'}; "
+          f"{saved:.3f}s of a {retrieval_seconds:.1f}s retrieval hidden behind decoding")
+    return {"transcript": transcript, "decode_seconds": decode_seconds, "speculated": speculated, "saved_seconds": saved}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure speculative retrieval on a recorded clip")
+    parser.add_argument("clip", help="WAV/AIFF/FLAC recording of a question")
+    parser.add_argument("--backend", default="vosk")
+    parser.add_argument("--retrieval-seconds", type=float, default=0.8)
+    args = parser.parse_args()
+    benchmark_clip(args.clip, args.backend, args.retrieval_seconds)
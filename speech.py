@@ -0,0 +1,392 @@
+"""
+Sentence-pipelined text-to-speech for the voice bot.
+
+Instead of waiting for the whole answer and synthesizing it in one Polly call,
+SpeechPipeline takes the model output chunk by chunk as it streams:
+
+1. SpokenSection keeps only the part meant to be read aloud (the "**XXYZ:**"
+   summary the talkie prompt asks for at the start of the answer).
+2. SentenceSplitter cuts that text into sentences as soon as each one is complete.
+3. Each sentence is synthesized on a thread pool, so later sentences are being
+   synthesized while earlier ones play.
+4. A player thread plays the synthesized sentences strictly in order.
+
+The first sentence starts playing while the model is still generating the rest.
+Audio stays in memory: Polly's AudioStream is read into bytes and played from a
+BytesIO on one process-wide pygame mixer (AudioPlayer), or handed to st.audio;
+recorder WAV bytes go straight to sr.AudioData. No temp files are written, so
+concurrent sessions cannot overwrite each other's audio.
+
+Timings are recorded in the metrics registry:
+
+    voice_time_to_first_audio_seconds   pipeline start -> first sentence starts playing
+    tts_synthesis_seconds               one Polly call
+    tts_sentences                       sentences synthesized
+"""
+
+import argparse
+import io
+import os
+import queue
+import re
+import tempfile
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import speech_recognition as sr
+from pygame import mixer
+
+from metrics import metrics as default_metrics
+
+SPOKEN_MARKER = "**XXYZ:**"
+
+# Words whose trailing period does not end a sentence.
+ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "st", "jr", "sr", "no", "vs", "etc", "inc", "ave", "e.g", "i.e", "u.s", "a.m", "p.m"}
+
+_SENTENCE_END_RE = re.compile(r"[.!?]+[\"')\]]*\s+|\n+")
+_CLAUSE_END_RE = re.compile(r"[,;:]\s+")
+_SECTION_END_RE = re.compile(r"\n[ \t]*\n")
+_URL_RE = re.compile(r"https?://\S+")
+_MARKDOWN_RE = re.compile(r"[*_`#>]+")
+_SPACE_BEFORE_PUNCTUATION_RE = re.compile(r"\s+([.,!?;:])")
+_EMOJI_RE = re.compile("[\U0001F000-\U0001FAFF\u2600-\u27BF\uFE0F]")
+
+
+def build_ssml(text, speed=1.0):
+    cleaned_text = text.replace('&', 'and')
+    cleaned_text = cleaned_text.replace('<', '&lt;')
+    cleaned_text = cleaned_text.replace('>', '&gt;')
+
+    if speed != 1.0:
+        return f"""<speak><prosody rate="{int(speed*100)}%">{cleaned_text}</prosody></speak>"""
+    return f"""<speak>{cleaned_text}</speak>"""
+
+
+def clean_text_for_speech(text):
+    """Drop URLs, markdown markup and emoji, which Polly would read out or stumble on."""
+    text = _URL_RE.sub("", text)
+    text = _MARKDOWN_RE.sub("", text)
+    text = _EMOJI_RE.sub("", text)
+    return _SPACE_BEFORE_PUNCTUATION_RE.sub(r"\1", " ".join(text.split()))
+
+
+def synthesize_speech(polly, text, voice_id='Joanna', speed=1.0, engine='neural'):
+    """One Polly call; returns the MP3 bytes."""
+    response = polly.synthesize_speech(
+        Engine=engine,
+        Text=build_ssml(text, speed),
+        TextType='ssml',
+        OutputFormat='mp3',
+        VoiceId=voice_id
+    )
+    if "AudioStream" not in response:
+        raise Exception("No AudioStream in response")
+    return response["AudioStream"].read()
+
+
+def wav_bytes_to_audio_data(audio_bytes):
+    """Recorder WAV bytes -> sr.AudioData, without a temp file."""
+    try:
+        with wave.open(io.BytesIO(audio_bytes), "rb") as wav:
+            if wav.getnchannels() == 1:
+                return sr.AudioData(wav.readframes(wav.getnframes()), wav.getframerate(), wav.getsampwidth())
+    except wave.Error:
+        pass
+    # Stereo or non-PCM input: AudioFile mixes it down, still reading from memory.
+    with sr.AudioFile(io.BytesIO(audio_bytes)) as source:
+        return sr.Recognizer().record(source)
+
+
+class AudioPlayer:
+    """
+    Server-side playback on one pygame mixer, initialized once per process.
+
+    Clips are played from memory. Plays are serialized: there is one output device,
+    so concurrent sessions take turns instead of cutting each other off.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def play(self, audio, volume=1.0, namehint="mp3", poll_seconds=0.05):
+        """Play one clip (bytes) and return when it has finished."""
+        with self._lock:
+            if not self._initialized:
+                mixer.init()
+                self._initialized = True
+            mixer.music.load(io.BytesIO(audio), namehint)
+            mixer.music.set_volume(volume)
+            mixer.music.play()
+            while mixer.music.get_busy():
+                time.sleep(poll_seconds)
+            mixer.music.unload()
+
+
+_audio_player = None
+_audio_player_lock = threading.Lock()
+
+
+def get_audio_player():
+    """Process-wide AudioPlayer, so the mixer outlives Streamlit reruns."""
+    global _audio_player
+    if _audio_player is None:
+        with _audio_player_lock:
+            if _audio_player is None:
+                _audio_player = AudioPlayer()
+    return _audio_player
+
+
+class SentenceSplitter:
+    """
+    Incremental sentence splitter for streamed text.
+
+    Args:
+        max_chars (int): A sentence still open at this length is cut at its last comma,
+            semicolon or colon, so one long sentence does not hold up playback
+    """
+
+    def __init__(self, max_chars=250):
+        self.max_chars = max_chars
+        self._buffer = ""
+
+    def _is_abbreviation(self, text):
+        # "Dr. Smith", "e.g. a permit" and list numbers ("1. Apply") do not end a sentence.
+        words = text.rstrip(".!?\"')] \n").rsplit(None, 2)
+        if not words:
+            return False
+        if words[-1].lower() in ABBREVIATIONS:
+            return True
+        # A list number starts its item ("1. Apply", "Steps: 2. Pay"); "The fee is 25." ends a sentence.
+        return words[-1].isdigit() and (len(words) == 1 or words[-2].endswith(":"))
+
+    def feed(self, text):
+        """Add streamed text; returns the sentences it completed."""
+        self._buffer += text
+        sentences = []
+        start = 0
+        for match in _SENTENCE_END_RE.finditer(self._buffer):
+            candidate = self._buffer[start:match.end()]
+            if "\n" not in match.group() and self._is_abbreviation(candidate):
+                continue
+            sentences.append(candidate.strip())
+            start = match.end()
+        self._buffer = self._buffer[start:]
+
+        if len(self._buffer) > self.max_chars:
+            clauses = list(_CLAUSE_END_RE.finditer(self._buffer))
+            if clauses:
+                sentences.append(self._buffer[:clauses[-1].end()].strip())
+                self._buffer = self._buffer[clauses[-1].end():]
+        return [sentence for sentence in sentences if sentence]
+
+    def flush(self):
+        """Whatever is left once the stream has ended."""
+        rest, self._buffer = self._buffer.strip(), ""
+        return [rest] if rest else []
+
+
+class SpokenSection:
+    """
+    Pass through only the streamed text after `marker`, up to the next blank line.
+    With marker=None everything is passed through.
+    """
+
+    def __init__(self, marker=SPOKEN_MARKER):
+        self.marker = marker
+        self.state = "waiting" if marker else "speaking"
+        self._buffer = ""
+        self._after_marker = False
+
+    def feed(self, text):
+        """Add streamed text; returns the part of it that should be spoken."""
+        if self.state == "done":
+            return ""
+        self._buffer += text
+        if self.state == "waiting":
+            index = self._buffer.find(self.marker)
+            if index == -1:
+                # Keep enough of the tail to catch a marker split across chunks.
+                self._buffer = self._buffer[-(len(self.marker) - 1):]
+                return ""
+            self._buffer = self._buffer[index + len(self.marker):]
+            self.state = "speaking"
+            self._after_marker = True
+
+        if self._after_marker:
+            # Drop the whitespace after the marker, even when it arrives in later chunks.
+            self._buffer = self._buffer.lstrip()
+            if not self._buffer:
+                return ""
+            self._after_marker = False
+
+        if not self.marker:
+            spoken, self._buffer = self._buffer, ""
+            return spoken
+        match = _SECTION_END_RE.search(self._buffer)
+        if match:
+            spoken, self._buffer = self._buffer[:match.start()], ""
+            self.state = "done"
+            return spoken
+        # Hold back trailing whitespace: a newline may be the first half of the blank line.
+        spoken = self._buffer.rstrip()
+        self._buffer = self._buffer[len(spoken):]
+        return spoken
+
+    @property
+    def found(self):
+        return self.state != "waiting"
+
+
+class SpeechPipeline:
+    """
+    Speak a streamed answer sentence by sentence.
+
+    Args:
+        synthesize (callable): Takes a sentence, returns audio for `play` (None to skip it)
+        play (callable): Plays one synthesized sentence and returns when it has finished
+        max_workers (int): Sentences synthesized at the same time
+        marker (str): Only the section after this marker is spoken (None speaks everything)
+        registry (MetricsRegistry): Where timings are recorded
+    """
+
+    def __init__(self, synthesize, play, max_workers=4, marker=SPOKEN_MARKER, registry=None, clock=time.monotonic):
+        self.synthesize = synthesize
+        self.play = play
+        self.metrics = registry or default_metrics
+        self.clock = clock
+        self.started_at = clock()
+        self.first_audio_latency = None
+
+        self._section = SpokenSection(marker)
+        self._splitter = SentenceSplitter()
+        self._synthesis_pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tts")
+        self._playlist = queue.Queue()
+        self._player = threading.Thread(target=self._play_in_order, name="tts-player", daemon=True)
+        self._player.start()
+
+    def _synthesize(self, sentence):
+        start_time = time.time()
+        try:
+            return self.synthesize(sentence)
+        except Exception as e:
+            print(f"Error in text-to-speech conversion: {str(e)}")
+            return None
+        finally:
+            self.metrics.observe("tts_synthesis_seconds", time.time() - start_time)
+
+    def _play_in_order(self):
+        while True:
+            future = self._playlist.get()
+            if future is None:
+                return
+            audio = future.result()
+            if audio is None:
+                continue
+            if self.first_audio_latency is None:
+                self.first_audio_latency = self.clock() - self.started_at
+                self.metrics.observe("voice_time_to_first_audio_seconds", self.first_audio_latency)
+                print(f"Time to first audio: {self.first_audio_latency:.2f} seconds")
+            try:
+                self.play(audio)
+            except Exception as e:
+                print(f"Error playing audio: {str(e)}")
+
+    def _speak(self, sentences):
+        for sentence in sentences:
+            sentence = clean_text_for_speech(sentence)
+            if sentence:
+                self.metrics.increment("tts_sentences")
+                self._playlist.put(self._synthesis_pool.submit(self._synthesize, sentence))
+
+    def feed(self, chunk):
+        """Add a chunk of streamed model output."""
+        spoken = self._section.feed(chunk)
+        if spoken:
+            self._speak(self._splitter.feed(spoken))
+
+    def finish(self, timeout=None):
+        """Speak what is left and wait until playback has finished."""
+        self._speak(self._splitter.flush())
+        if not self._section.found:
+            print(f"No {self._section.marker} section in the response; nothing to speak")
+        self._playlist.put(None)
+        self._player.join(timeout)
+        self._synthesis_pool.shutdown(wait=False)
+
+
+def _synthetic_wav(seconds=3.0, sample_rate=16000):
+    samples = np.linspace(0, seconds, int(seconds * sample_rate), endpoint=False)
+    pcm = (np.sin(2 * np.pi * 440 * samples) * 10000).astype("<i2").tobytes()
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+
+def benchmark_audio_path(n_iterations=50, seconds=3.0):
+    """
+    Compare the temp-file audio path with the in-memory one on a synthetic WAV clip.
+
+    Playback: write the clip to disk, init the mixer, load, quit and delete (as
+    play_audio_with_stop used to), versus loading from a BytesIO on a persistent mixer.
+    Recognition input: NamedTemporaryFile plus sr.AudioFile, versus wav_bytes_to_audio_data.
+    Only setup is timed; the clip is not played. On a machine without an audio device,
+    run with SDL_AUDIODRIVER=dummy.
+
+    Returns:
+        dict: Label -> milliseconds per call
+    """
+    clip = _synthetic_wav(seconds)
+    results = {}
+
+    start = time.perf_counter()
+    for _ in range(n_iterations):
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as f:
+            f.write(clip)
+        mixer.init()
+        mixer.music.load(f.name)
+        mixer.quit()
+        os.remove(f.name)
+    results["playback: temp file + mixer init"] = (time.perf_counter() - start) / n_iterations * 1000
+
+    mixer.init()
+    start = time.perf_counter()
+    for _ in range(n_iterations):
+        mixer.music.load(io.BytesIO(clip), "wav")
+        mixer.music.unload()
+    results["playback: BytesIO + persistent mixer"] = (time.perf_counter() - start) / n_iterations * 1000
+    mixer.quit()
+
+    start = time.perf_counter()
+    for _ in range(n_iterations):
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as f:
+            f.write(clip)
+        with sr.AudioFile(f.name) as source:
+            sr.Recognizer().record(source)
+        os.unlink(f.name)
+    results["recognizer input: temp file + AudioFile"] = (time.perf_counter() - start) / n_iterations * 1000
+
+    start = time.perf_counter()
+    for _ in range(n_iterations):
+        wav_bytes_to_audio_data(clip)
+    results["recognizer input: AudioData from bytes"] = (time.perf_counter() - start) / n_iterations * 1000
+
+    print(f"Audio path setup, {seconds:.0f}s clip, {n_iterations} iterations")
+    for label, ms in results.items():
+        print(f"  {label:<42} {ms:8.2f} ms")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the talkie audio path")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+    benchmark_audio_path(args.iterations, args.seconds)
@@ -0,0 +1,199 @@
+"""
+Pluggable speech-to-text backends for the voice bot.
+
+A backend starts a RecognitionStream per utterance. Audio is fed to the stream
+in chunks as it arrives (16 kHz, 16-bit mono PCM) and each chunk may produce a
+partial hypothesis; finish() returns the final transcript.
+
+- GoogleBackend: the Google Web Speech API (recognize_google). It only accepts
+  whole clips, so its stream buffers the audio and does all the work, one
+  network round-trip, in finish().
+- VoskBackend: local CPU recognition with Vosk. Audio is decoded while it is
+  fed, so little work is left once speech ends, and it runs offline. Optional:
+  `pip install vosk` and download a model (VOSK_MODEL_PATH, default
+  models/vosk-model-small-en-us-0.15).
+
+recognize_chunks measures end-of-speech to transcript latency (from the last
+chunk fed to the final transcript) per backend:
+
+    stt_latency_seconds{backend}
+    stt_partials{backend}           partial hypotheses produced
+"""
+
+import json
+import os
+import threading
+import time
+
+import speech_recognition as sr
+
+from metrics import metrics as default_metrics
+
+try:
+    import vosk
+except ImportError:
+    vosk = None
+
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
+DEFAULT_VOSK_MODEL_PATH = os.environ.get("VOSK_MODEL_PATH", "models/vosk-model-small-en-us-0.15")
+
+
+class RecognitionStream:
+    """Incremental recognition of one utterance."""
+
+    def accept(self, pcm):
+        """Feed a chunk of PCM audio; returns the current partial hypothesis or None."""
+        raise NotImplementedError
+
+    def finish(self):
+        """End of speech; returns the final transcript."""
+        raise NotImplementedError
+
+
+class BufferedRecognitionStream(RecognitionStream):
+    """Stream for whole-clip recognizers: buffers the audio and recognizes it in finish()."""
+
+    def __init__(self, recognize, sample_rate=SAMPLE_RATE, sample_width=SAMPLE_WIDTH):
+        self.recognize = recognize
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self._chunks = []
+
+    def accept(self, pcm):
+        self._chunks.append(pcm)
+        return None
+
+    def finish(self):
+        return self.recognize(sr.AudioData(b"".join(self._chunks), self.sample_rate, self.sample_width))
+
+
+class VoskRecognitionStream(RecognitionStream):
+    def __init__(self, recognizer):
+        self._recognizer = recognizer
+        self._final = []
+
+    def accept(self, pcm):
+        if self._recognizer.AcceptWaveform(pcm):
+            # Vosk closed an utterance segment at a pause.
+            self._final.append(json.loads(self._recognizer.Result()).get("text", ""))
+            partial = ""
+        else:
+            partial = json.loads(self._recognizer.PartialResult()).get("partial", "")
+        return " ".join(text for text in self._final + [partial] if text) or None
+
+    def finish(self):
+        self._final.append(json.loads(self._recognizer.FinalResult()).get("text", ""))
+        return " ".join(text for text in self._final if text)
+
+
+class SpeechToTextBackend:
+    name = None
+
+    def start(self, sample_rate=SAMPLE_RATE):
+        """Begin recognizing one utterance; returns a RecognitionStream."""
+        raise NotImplementedError
+
+
+class GoogleBackend(SpeechToTextBackend):
+    name = "google"
+
+    def __init__(self, language="en-US"):
+        self.language = language
+        self._recognizer = sr.Recognizer()
+
+    def start(self, sample_rate=SAMPLE_RATE):
+        return BufferedRecognitionStream(
+            lambda audio: self._recognizer.recognize_google(audio, language=self.language), sample_rate
+        )
+
+
+class VoskBackend(SpeechToTextBackend):
+    name = "vosk"
+
+    def __init__(self, model_path=DEFAULT_VOSK_MODEL_PATH):
+        if vosk is None:
+            raise ImportError("The vosk backend needs `pip install vosk` and a downloaded model")
+        if not os.path.isdir(model_path):
+            raise FileNotFoundError(f"Vosk model not found at {model_path} (set VOSK_MODEL_PATH)")
+        vosk.SetLogLevel(-1)
+        self.model = vosk.Model(model_path)
+
+    def start(self, sample_rate=SAMPLE_RATE):
+        return VoskRecognitionStream(vosk.KaldiRecognizer(self.model, sample_rate))
+
+
+BACKENDS = {
+    "google": GoogleBackend,
+    "vosk": VoskBackend,
+}
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def available_backends():
+    """Names of the backends that can run here."""
+    names = ["google"]
+    if vosk is not None and os.path.isdir(DEFAULT_VOSK_MODEL_PATH):
+        names.append("vosk")
+    return names
+
+
+def get_stt_backend(name="google"):
+    """Process-wide backend instance, so models are loaded once."""
+    with _backends_lock:
+        backend = _backends.get(name)
+        if backend is None:
+            backend = _backends[name] = BACKENDS[name]()
+    return backend
+
+
+def audio_data_to_pcm(audio_data, sample_rate=SAMPLE_RATE):
+    """sr.AudioData -> 16-bit mono PCM at sample_rate, the format the streams take."""
+    return audio_data.get_raw_data(convert_rate=sample_rate, convert_width=SAMPLE_WIDTH)
+
+
+def split_pcm(pcm, chunk_seconds=0.25, sample_rate=SAMPLE_RATE):
+    chunk_bytes = int(chunk_seconds * sample_rate) * SAMPLE_WIDTH
+    return [pcm[i:i + chunk_bytes] for i in range(0, len(pcm), chunk_bytes)]
+
+
+def recognize_chunks(backend, chunks, sample_rate=SAMPLE_RATE, on_partial=None, registry=None):
+    """
+    Stream PCM chunks through a backend.
+
+    Args:
+        backend (SpeechToTextBackend): Backend to recognize with
+        chunks (iterable): 16-bit mono PCM chunks, in order, e.g. from a live microphone
+        on_partial (callable): Called with the current partial hypothesis after each chunk that
+            has one (repeats included, so callers can tell when a hypothesis is stable)
+
+    Returns:
+        tuple: (final transcript, end-of-speech to transcript latency in seconds)
+    """
+    registry = registry or default_metrics
+    stream = backend.start(sample_rate)
+    last_partial = None
+    for pcm in chunks:
+        partial = stream.accept(pcm)
+        if not partial:
+            continue
+        if partial != last_partial:
+            last_partial = partial
+            registry.increment("stt_partials", backend=backend.name)
+        if on_partial:
+            on_partial(partial)
+
+    end_of_speech = time.perf_counter()
+    transcript = stream.finish()
+    latency = time.perf_counter() - end_of_speech
+    registry.observe("stt_latency_seconds", latency, backend=backend.name)
+    print(f"STT {backend.name}: transcript {latency:.3f} seconds after end of speech")
+    return transcript, latency
+
+
+def recognize_audio(backend, audio_data, chunk_seconds=0.25, on_partial=None, registry=None):
+    """Recognize a recorded clip by streaming it through the backend in chunks."""
+    chunks = split_pcm(audio_data_to_pcm(audio_data), chunk_seconds)
+    return recognize_chunks(backend, chunks, on_partial=on_partial, registry=registry)
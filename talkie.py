@@ -1,90 +1,51 @@
 import os
-import time
 import re
 import streamlit as st
 import boto3
-import speech_recognition as sr
 from app import load_environment_secrets, initialize_aws_clients, initialize_openai_client
-from utils import ChatHandler, answer_query_talkie
-import threading
-from pygame import mixer
+from utils import ChatHandler, answer_query_talkie_stream, get_context
+from speech import SpeechPipeline, get_audio_player, wav_bytes_to_audio_data
+from tts_cache import synthesize_speech_cached
+from stt import audio_data_to_pcm, available_backends, get_stt_backend, recognize_chunks, split_pcm
+from vad import trim_and_normalize
+from speculative import SpeculativeRetriever
+from language import get_language_detector
 from audio_recorder_streamlit import audio_recorder
-import tempfile
 
 def text_to_speech(text, polly, voice_id='Ruth', speed=1.0):
+    """Synthesize text with Polly (through the local audio cache); returns the MP3 bytes, or None on error."""
     try:
-        cleaned_text = text.replace('&', 'and')
-        cleaned_text = cleaned_text.replace('<', '&lt;')
-        cleaned_text = cleaned_text.replace('>', '&gt;')
-        
-        if speed != 1.0:
-            ssml_text = f"""<speak><prosody rate="{int(speed*100)}%">{cleaned_text}</prosody></speak>"""
-        else:
-            ssml_text = f"""<speak>{cleaned_text}</speak>"""
-
-        response = polly.synthesize_speech(
-            Engine='neural',
-            Text=ssml_text,
-            TextType='ssml',
-            OutputFormat='mp3',
-            VoiceId=voice_id
-        )
-
-        if "AudioStream" in response:
-            audio_data = response["AudioStream"].read()
-            temp_file = "temp_audio.mp3"
-            with open(temp_file, 'wb') as file:
-                file.write(audio_data)
-            return temp_file
-        else:
-            raise Exception("No AudioStream in response")
-            
+        return synthesize_speech_cached(polly, text, voice_id=voice_id, speed=speed)
     except Exception as e:
         print(f"Error in text-to-speech conversion: {str(e)}")
         return None
 
-def play_audio_with_stop(file_path, volume=1.0):
+def play_audio_with_stop(audio, volume=1.0):
+    """Play MP3 bytes on the shared mixer and return when playback has finished."""
     try:
-        mixer.init()
-        mixer.music.load(file_path)
-        mixer.music.set_volume(volume)
-        mixer.music.play()
-        is_speaking = True
-        
-        while mixer.music.get_busy() and is_speaking:
-            time.sleep(0.1)
-            
-        mixer.music.stop()
-        mixer.quit()
-        try:
-            os.remove(file_path)
-        except:
-            pass
+        get_audio_player().play(audio, volume)
     except Exception as e:
         print(f"Error playing audio: {str(e)}")
 
-def speech_to_text(audio_bytes):
-    """Convert speech to text using Google Speech Recognition"""
+def speech_to_text(audio_bytes, backend="google", on_partial=None):
+    """Convert speech to text with the selected STT backend (see stt.py)"""
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as f:
-            f.write(audio_bytes)
-            temp_filename = f.name
-
-        r = sr.Recognizer()
-        with sr.AudioFile(temp_filename) as source:
-            audio = r.record(source)
-        text = r.recognize_google(audio)
-        os.unlink(temp_filename)
+        audio = wav_bytes_to_audio_data(audio_bytes)
+        # Drop the recorder's trailing pause and leading noise before recognition.
+        pcm = trim_and_normalize(audio_data_to_pcm(audio))
+        if not pcm:
+            return "Error in speech recognition: empty recording"
+        text, _ = recognize_chunks(get_stt_backend(backend), split_pcm(pcm), on_partial=on_partial)
         return text
     except Exception as e:
         return f"Error in speech recognition: {str(e)}"
     
 def extract_summary(response_text):
     """
-    Extracts the 'Summary:' section from a chatbot response.
+    Extracts the 'Summary:' section from a chatbot response, up to the next blank line.
     Returns the summary as a string, or None if not found.
     """
-    match = re.search(r"\*\*XXYZ:\*\*\s*(.+)", response_text, re.IGNORECASE | re.DOTALL)
+    match = re.search(r"\*\*XXYZ:\*\*\s*(.+?)(?:\n[ \t]*\n|$)", response_text, re.IGNORECASE | re.DOTALL)
     if match:
         return match.group(1).strip()
     return None
@@ -131,12 +92,34 @@ def main():
                 help="Adjust the volume of the assistant's voice"
             )
 
+            audio_output = st.radio(
+                "Audio output",
+                ["Speaker", "Browser"],
+                help="Speaker plays on this machine sentence by sentence; Browser plays the whole answer in your browser"
+            )
+
+            pause_threshold = st.slider(
+                "End-of-speech pause",
+                min_value=0.5,
+                max_value=3.0,
+                value=1.0,
+                step=0.1,
+                help="Seconds of silence before recording stops; shorter sends your question sooner"
+            )
+
+            stt_backend = st.selectbox(
+                "Speech recognition",
+                available_backends(),
+                help="google sends the recording to the Google Web Speech API; vosk recognizes it locally"
+            )
+
     # Main Content
     with main_content:
         st.title("WA-bot Services Assistant. Talk to me!")
         
         # Load environment variables and initialize clients
         load_environment_secrets()
+        get_language_detector()
         clients = (
             *initialize_aws_clients(),
             initialize_openai_client()
@@ -148,8 +131,16 @@ def main():
         # Voice mode toggle
         #voice_mode = st.toggle("Enable Voice Mode", value=True)
 
+        model_id = "us.amazon.nova-micro-v1:0"
+        kb_id = "KIVB1LSZCN"
+        mode = "KB-Website"
+        report_mode = False
+
         # Initialize prompt variable
         prompt = None
+        # Retrieval starts on stable partial transcripts while the finished recording is decoded
+        # (Vosk only; see speculative.py for what this does and does not hide).
+        speculative = SpeculativeRetriever(lambda text: get_context(bedrock_agent_runtime, model_id, kb_id, text))
 
         if True:
             st.write("Click the microphone button to record your question:")
@@ -157,7 +148,7 @@ def main():
             st.info("🎤 Click the button below and  speak...")
             
             audio_bytes = audio_recorder(
-                pause_threshold=2.0,
+                pause_threshold=pause_threshold,
                 recording_color="#e74c3c",
                 neutral_color="#2ecc71",
                 icon_name="microphone",
@@ -166,7 +157,14 @@ def main():
             
             if audio_bytes:
                 st.write("🎯 Processing your question...")
-                prompt = speech_to_text(audio_bytes)
+                partial_placeholder = st.empty()
+
+                def show_partial(partial):
+                    partial_placeholder.caption(f"… {partial}")
+                    speculative.on_partial(partial)
+
+                prompt = speech_to_text(audio_bytes, backend=stt_backend, on_partial=show_partial)
+                partial_placeholder.empty()
                 
                 if prompt and not prompt.startswith("Error"):
                     st.success(f"✅ You said: {prompt}")
@@ -178,40 +176,42 @@ def main():
 
         # Only proceed if we have a valid prompt
         if prompt:
-            model_id = "us.amazon.nova-micro-v1:0"
-            kb_id = "KIVB1LSZCN"
-            mode = "KB-Website"
-            report_mode = False
-
-            with st.spinner("Generating response..."):
-                response = answer_query_talkie(
-                    prompt,
-                    ChatHandler(),
-                    bedrock,
-                    bedrock_agent_runtime,
-                    s3,
-                    openai_client,
-                    model_id,
-                    kb_id,
-                    mode,
-                    report_mode,
-                    cohort='user',
-                    batch_mode=False
-                )
-
-            st.write("Assistant:", response)
-
             selected_voice = "Joanna"
-            summary = extract_summary(response)
-            with st.spinner("Converting to speech..."):
-                audio_file = text_to_speech(summary, polly, voice_id=selected_voice, speed=speed)
-                if audio_file:
-                    audio_thread = threading.Thread(
-                        target=play_audio_with_stop,
-                        args=(audio_file, volume)
-                    )
-                    audio_thread.start()
-                    audio_thread.join()
+            # Sentences are spoken as soon as they stream in, while the rest is still generated.
+            browser_audio = []
+            pipeline = SpeechPipeline(
+                synthesize=lambda sentence: text_to_speech(sentence, polly, voice_id=selected_voice, speed=speed),
+                play=browser_audio.append if audio_output == "Browser" else lambda audio: play_audio_with_stop(audio, volume)
+            )
+            response_placeholder = st.empty()
+            response = ""
+            # finish() also runs if the stream fails, so the synthesis workers and player thread stop.
+            try:
+                with st.spinner("Generating response..."):
+                    for chunk in answer_query_talkie_stream(
+                        prompt,
+                        ChatHandler(),
+                        bedrock,
+                        bedrock_agent_runtime,
+                        s3,
+                        openai_client,
+                        model_id,
+                        kb_id,
+                        mode,
+                        report_mode,
+                        cohort='user',
+                        batch_mode=False,
+                        context=speculative.result_for(prompt)
+                    ):
+                        response += chunk
+                        response_placeholder.write(f"Assistant: {response}")
+                        pipeline.feed(chunk)
+            finally:
+                with st.spinner("Speaking..."):
+                    pipeline.finish()
+            if browser_audio:
+                # Polly MP3 streams are bare MPEG frames, so the sentences concatenate into one clip.
+                st.audio(b"".join(browser_audio), format="audio/mp3", autoplay=True)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,65 @@
+"""do_adaptive_model_sweep with fake generation and judging on a fake clock (one worker, so calls run in order)."""
+
+from types import SimpleNamespace
+
+import pytest
+
+import batch
+from utils import ChatHandler
+
+SONNET = "us.anthropic.claude-3-5-sonnet-20241022-v2:0"
+
+
+class FakeS3:
+    def put_object(self, **kwargs):
+        pass
+
+
+@pytest.fixture
+def sweep(monkeypatch):
+    clock = SimpleNamespace(now=0.0)
+    behaviour = {"latency": {}, "score": {}}
+
+    def answer_query(item, chat_handler, bedrock, agent, s3, openai_client, model_id, *args, **kwargs):
+        clock.now += behaviour["latency"].get(model_id, 1.0)
+        return model_id
+
+    monkeypatch.setattr(batch, "time", SimpleNamespace(time=lambda: clock.now))
+    monkeypatch.setattr(batch, "read_prompt_list", lambda s3, uri: [f"question {i}" for i in range(500)])
+    monkeypatch.setattr(batch, "answer_query", answer_query)
+    monkeypatch.setattr(batch, "assess_answer_query", lambda item, answer, *args, **kwargs: answer)
+    monkeypatch.setattr(batch, "parse_judge_scores", lambda model_id: {"helpfulness": behaviour["score"].get(model_id, 4.0)})
+
+    def run(**kwargs):
+        return batch.do_adaptive_model_sweep(None, None, FakeS3(), None, ChatHandler(), "kb", max_threads=1,
+                                             judge_cache=object(), **kwargs)
+
+    return behaviour, run
+
+
+def test_latency_beyond_the_assumed_range_is_clipped(sweep):
+    behaviour, run = sweep
+    behaviour["latency"][SONNET] = 1000.0
+
+    summary = run(batch_size=25, min_samples=50, latency_weight=0.1, max_latency_seconds=30.0)
+
+    assert summary[SONNET]["mean_latency"] == pytest.approx(1000.0)
+    assert summary[SONNET]["mean_utility"] == pytest.approx(4.0 - 0.1 * 30.0)
+
+
+def test_sweep_stops_early_when_the_models_are_tied(sweep):
+    behaviour, run = sweep
+
+    summary = run(batch_size=25, min_samples=50, tolerance=2.0)
+
+    assert all(stats["eliminated_round"] is None for stats in summary.values())
+    assert 50 <= summary[SONNET]["n"] < 500
+
+
+def test_clearly_worse_model_is_eliminated(sweep):
+    behaviour, run = sweep
+    behaviour["score"][SONNET] = 1.0
+
+    summary = run(batch_size=25, min_samples=50)
+
+    assert summary[SONNET]["eliminated_round"] is not None
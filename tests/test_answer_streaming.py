@@ -0,0 +1,82 @@
+"""Streamed partial answers when a model call is replaced (fallback) or abandoned (cascade escalation)."""
+
+import threading
+
+import pytest
+
+import utils
+from cascade import AUTO_MODEL_ID
+from circuit_breaker import CircuitBreakerRegistry
+from deadline import Deadline
+from metrics import MetricsRegistry
+from progress import AnswerProgress
+from utils import ChatHandler
+
+MICRO = "us.amazon.nova-micro-v1:0"
+HAIKU = "us.anthropic.claude-3-5-haiku-20241022-v1:0"
+SONNET = "us.anthropic.claude-3-5-sonnet-20241022-v2:0"
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """Fake retrieval and prompt assembly; tests supply the per-model streams."""
+    streams = {}
+    monkeypatch.setattr(utils, "get_answer_context", lambda *args, **kwargs: ("context", []))
+    monkeypatch.setattr(utils, "assemble_answer_prompt", lambda *args: "prompt")
+    monkeypatch.setattr(utils, "stream_model_response", lambda bedrock, agent, openai_client, model_id, *args: streams[model_id]())
+    monkeypatch.setattr(utils, "_circuit_breakers", CircuitBreakerRegistry(registry=MetricsRegistry(), min_calls=1))
+    return streams
+
+
+def _run(model_id, deadline=None):
+    progress = AnswerProgress(MetricsRegistry())
+    result = utils.get_model_response_within_deadline(
+        deadline or Deadline(), "how do i renew my license?", ChatHandler(), None, None, None,
+        model_id, "kb", "KB-Website", progress=progress
+    )
+    return result, progress
+
+
+def test_fallback_model_replaces_the_failed_models_partial_answer(pipeline):
+    def failing():
+        yield "Nova started "
+        raise RuntimeError("stream broke")
+
+    pipeline[MICRO] = failing
+    pipeline[HAIKU] = lambda: iter(["Haiku ", "answer."])
+
+    (model_id, output), progress = _run(MICRO)
+
+    assert (model_id, output) == (HAIKU, "Haiku answer.")
+    assert progress.snapshot()["partial"] == "Haiku answer."
+
+
+def test_abandoned_escalation_stops_streaming_and_keeps_the_first_answer(pipeline):
+    release = threading.Event()
+    finished = threading.Event()
+
+    def slow_sonnet():
+        yield "Sonnet started "
+        release.wait(5)
+        yield "late chunk"
+        finished.set()
+
+    pipeline[MICRO] = lambda: iter(["I don't know ", "the answer."])
+    pipeline[SONNET] = slow_sonnet
+
+    (model_id, output), progress = _run(AUTO_MODEL_ID, Deadline(stage_budgets={"generation": 0.3}))
+    release.set()
+    assert finished.wait(5)
+
+    assert (model_id, output) == (f"{AUTO_MODEL_ID}:{MICRO}", "I don't know the answer.")
+    assert progress.snapshot()["partial"] == "I don't know the answer."
+
+
+def test_restart_drops_chunks_from_earlier_attempts():
+    progress = AnswerProgress(MetricsRegistry())
+    first = progress.restart()
+    first("old ")
+    second = progress.restart()
+    first("stale")
+    second("new")
+    assert progress.snapshot()["partial"] == "new"
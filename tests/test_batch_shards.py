@@ -0,0 +1,110 @@
+"""Sharded thread sweep: partial shards when the prompt stream fails, and the merge checks."""
+
+import io
+import json
+
+import pytest
+
+import batch
+from utils import ChatHandler
+
+BUCKET = "watech-rppilot-bronze"
+
+
+class FakeBody(io.BytesIO):
+    def iter_lines(self):
+        return iter(self.read().splitlines())
+
+
+class FailingBody:
+    """Prompt list stream that breaks after a few lines, like a dropped S3 connection."""
+
+    def __init__(self, lines, fail_after):
+        self.lines = lines
+        self.fail_after = fail_after
+
+    def iter_lines(self):
+        for i, line in enumerate(self.lines):
+            if i == self.fail_after:
+                raise ConnectionError("connection reset")
+            yield line
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+        self.prompt_body = None
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[(Bucket, Key)] = Body if isinstance(Body, bytes) else Body.encode("utf-8")
+
+    def get_object(self, Bucket, Key):
+        if Key.endswith(".csv"):
+            return {"Body": self.prompt_body}
+        return {"Body": FakeBody(self.objects[(Bucket, Key)])}
+
+    def get_paginator(self, operation):
+        s3 = self
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix):
+                return [{"Contents": [{"Key": key} for bucket, key in s3.objects if bucket == Bucket and key.startswith(Prefix)]}]
+
+        return Paginator()
+
+
+@pytest.fixture
+def sweep(monkeypatch):
+    s3 = FakeS3()
+    monkeypatch.setattr(batch, "answer_query", lambda item, *args, **kwargs: f"answer to {item}")
+
+    def run(fail_after=None, shard_index=0, shard_count=1):
+        lines = [f"question {i}".encode() for i in range(4)]
+        s3.prompt_body = FailingBody(lines, fail_after) if fail_after is not None else FakeBody(b"\n".join(lines))
+        return batch.do_batch_prompts_threads(None, None, s3, None, ChatHandler(), "kb", max_threads=2,
+                                              shard_index=shard_index, shard_count=shard_count)
+
+    return s3, run
+
+
+def _shard_prefix(manifest):
+    return manifest["output_key"].rsplit("/", 1)[0] + "/"
+
+
+def test_failed_prompt_stream_keeps_the_records_already_generated(sweep):
+    s3, run = sweep
+    manifest = run(fail_after=2)
+
+    assert manifest["complete"] is False
+    assert "connection reset" in manifest["error"]
+    assert manifest["prompt_count"] == 2
+    records = [json.loads(line) for line in s3.objects[(BUCKET, manifest["output_key"])].splitlines()]
+    assert len(records) == manifest["record_count"] == 2 * len(manifest["model_ids"])
+    assert {r["question"] for r in records} == {"question 0", "question 1"}
+
+
+def test_merge_refuses_incomplete_shards_unless_allowed(sweep):
+    s3, run = sweep
+    manifest = run(fail_after=2)
+    prefix = _shard_prefix(manifest)
+
+    with pytest.raises(ValueError, match="incomplete shards"):
+        batch.merge_shard_outputs(s3, BUCKET, prefix)
+
+    merged = batch.merge_shard_outputs(s3, BUCKET, prefix, allow_partial=True)
+    assert merged["complete"] is False
+    assert merged["incomplete_shards"] == [0]
+
+
+def test_merge_refuses_missing_shards(sweep):
+    s3, run = sweep
+    manifest = run(shard_index=0, shard_count=2)
+    assert manifest["complete"] is True
+
+    with pytest.raises(ValueError, match=r"missing shards \[1\]"):
+        batch.merge_shard_outputs(s3, BUCKET, _shard_prefix(manifest))
+
+    run(shard_index=1, shard_count=2)
+    merged = batch.merge_shard_outputs(s3, BUCKET, _shard_prefix(manifest))
+    assert merged["complete"] is True
+    assert merged["prompt_count"] == 4
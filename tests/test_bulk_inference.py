@@ -0,0 +1,151 @@
+"""run_bulk_sweep end to end against local fakes of Bedrock batch, S3 and the OpenAI Batch API."""
+
+import io
+import json
+from types import SimpleNamespace
+
+import bulk_inference
+from utils import ChatHandler
+
+NOVA = "us.amazon.nova-micro-v1:0"
+GPT = "gpt-4o"
+
+
+class FakeBody(io.BytesIO):
+    """botocore StreamingBody stand-in."""
+
+    def iter_lines(self):
+        return iter(self.read().splitlines())
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[(Bucket, Key)] = Body if isinstance(Body, bytes) else Body.encode("utf-8")
+
+    def get_object(self, Bucket, Key):
+        return {"Body": FakeBody(self.objects[(Bucket, Key)])}
+
+
+class FakeRetrieval:
+    def retrieve(self, **kwargs):
+        return {"retrievalResults": [{"content": {"text": "context"}, "score": 0.9}]}
+
+
+class FakeBedrockBatch:
+    """Completes each job on the second poll, answering every record except those marked FAIL."""
+
+    def __init__(self, s3):
+        self.s3 = s3
+        self.polls = {}
+        self.jobs = {}
+
+    def create_model_invocation_job(self, jobName, roleArn, modelId, inputDataConfig, outputDataConfig):
+        job_arn = f"arn:aws:bedrock:us-west-2:123:model-invocation-job/{jobName}"
+        self.jobs[job_arn] = (jobName, inputDataConfig["s3InputDataConfig"]["s3Uri"], outputDataConfig["s3OutputDataConfig"]["s3Uri"])
+        self.polls[job_arn] = 0
+        return {"jobArn": job_arn}
+
+    def get_model_invocation_job(self, jobIdentifier):
+        self.polls[jobIdentifier] += 1
+        if self.polls[jobIdentifier] < 2:
+            return {"status": "InProgress"}
+        self._write_output(jobIdentifier)
+        return {"status": "Completed"}
+
+    def _write_output(self, job_arn):
+        job_name, input_uri, output_uri = self.jobs[job_arn]
+        bucket, input_key = input_uri[len("s3://"):].split("/", 1)
+        lines = []
+        for line in self.s3.objects[(bucket, input_key)].decode("utf-8").splitlines():
+            record = json.loads(line)
+            question = record["modelInput"]["messages"][-1]["content"][-1]["text"]
+            if "FAIL" in question:
+                lines.append(json.dumps({"recordId": record["recordId"], "error": {"errorMessage": "throttled"}}))
+            else:
+                text = f"answer {record['recordId']}"
+                lines.append(json.dumps({"recordId": record["recordId"],
+                                         "modelOutput": {"output": {"message": {"content": [{"text": text}]}}}}))
+        output_prefix = output_uri[len(f"s3://{bucket}/"):]
+        key = f"{output_prefix}{job_name}/{job_name}.jsonl.out"
+        self.s3.put_object(Bucket=bucket, Key=key, Body="\n".join(lines) + "\n")
+
+
+class FakeOpenAI:
+    def __init__(self):
+        self.uploads = {}
+        self.batch = None
+        self.polls = 0
+        self.files = SimpleNamespace(create=self._create_file, content=self._content)
+        self.batches = SimpleNamespace(create=self._create_batch, retrieve=self._retrieve)
+
+    def _create_file(self, file, purpose):
+        name, data = file
+        file_id = f"file-{len(self.uploads)}"
+        self.uploads[file_id] = data.read().decode("utf-8")
+        return SimpleNamespace(id=file_id)
+
+    def _create_batch(self, input_file_id, endpoint, completion_window, metadata):
+        self.batch = SimpleNamespace(id="batch-1", status="validating", output_file_id=None, input_file_id=input_file_id)
+        return self.batch
+
+    def _retrieve(self, batch_id):
+        self.polls += 1
+        if self.polls >= 2:
+            lines = []
+            for line in self.uploads[self.batch.input_file_id].splitlines():
+                request = json.loads(line)
+                lines.append(json.dumps({"custom_id": request["custom_id"], "response": {"body": {
+                    "choices": [{"message": {"content": f"answer {request['custom_id']}"}}]}}}))
+            self.uploads["file-out"] = "\n".join(lines)
+            self.batch.status, self.batch.output_file_id = "completed", "file-out"
+        return self.batch
+
+    def _content(self, file_id):
+        return SimpleNamespace(text=self.uploads[file_id])
+
+
+def _records(s3, prefix):
+    return [json.loads(body) for (_, key), body in s3.objects.items() if key.startswith(prefix)]
+
+
+def test_bulk_sweep_submits_polls_and_maps_results_back(monkeypatch):
+    monkeypatch.setattr(bulk_inference, "BEDROCK_MIN_RECORDS", 1)
+    s3 = FakeS3()
+    bedrock_batch = FakeBedrockBatch(s3)
+    openai_client = FakeOpenAI()
+    sleeps = []
+    questions = ["How do I renew my driver license?", "Where do I apply for food assistance?", "FAIL this one"]
+
+    written = bulk_inference.run_bulk_sweep(
+        questions, [NOVA, GPT, "agent"], "KB-Website", "kb-1", "cohort", bedrock_batch, FakeRetrieval(),
+        s3, openai_client, ChatHandler(), "arn:aws:iam::123:role/batch", bucket_name="bucket",
+        staging_prefix="bulk/", object_key_path="reports/", poll_seconds=5, sleep=sleeps.append
+    )
+
+    # The agent has no bulk API; the failed Bedrock record is skipped; OpenAI answers all three.
+    assert written == {NOVA: 2, GPT: 3}
+    # Both jobs were submitted before polling began, and each was polled until terminal.
+    assert sleeps == [5, 5]
+
+    records = _records(s3, "reports/")
+    assert len(records) == 5
+    by_model = {}
+    for record in records:
+        by_model.setdefault(record["model"], []).append(record)
+        assert record["inference"] == "bulk"
+        assert "timetorun" not in record
+    assert sorted(r["question"] for r in by_model[NOVA]) == sorted(questions[:2])
+    assert sorted(r["question"] for r in by_model[GPT]) == sorted(questions)
+
+
+def test_to_jsonl_uses_provider_formats():
+    requests = [{"record_id": "r1", "question": "q", "prompt": "full prompt"}]
+
+    nova = json.loads(bulk_inference.to_jsonl(requests, NOVA))
+    assert nova["recordId"] == "r1" and "modelInput" in nova
+
+    gpt = json.loads(bulk_inference.to_jsonl(requests, GPT))
+    assert gpt["custom_id"] == "r1" and gpt["url"] == "/v1/chat/completions"
@@ -0,0 +1,75 @@
+"""Deadline budgets and the fast-model switch, on a fake clock."""
+
+import utils
+from deadline import FAST_MODEL_ID, Deadline
+from utils import ChatHandler
+
+SONNET = "us.anthropic.claude-3-5-sonnet-20241022-v2:0"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def _retrieve_in(clock, seconds):
+    def retrieve():
+        clock.advance(seconds)
+        return "context"
+    return retrieve
+
+
+def test_fast_retrieval_keeps_the_requested_model():
+    clock = FakeClock()
+    deadline = Deadline(clock=clock)
+    deadline.run("retrieval", _retrieve_in(clock, 1.0))
+    assert not deadline.prefer_fast_model()
+
+
+def test_retrieval_at_its_cap_switches_to_the_fast_model():
+    clock = FakeClock()
+    deadline = Deadline(clock=clock)
+    deadline.run("retrieval", _retrieve_in(clock, 6.0))
+    assert deadline.ran_slow("retrieval")
+    assert deadline.prefer_fast_model()
+
+
+def test_waiting_before_generation_switches_to_the_fast_model():
+    clock = FakeClock()
+    deadline = Deadline(clock=clock)
+    clock.advance(8.0)  # e.g. queued for a free worker
+    deadline.run("retrieval", _retrieve_in(clock, 0.5))
+    assert deadline.short_of("generation", "report")
+    assert deadline.prefer_fast_model()
+
+
+def test_answer_pipeline_uses_the_fast_model_after_a_6s_retrieval(monkeypatch):
+    clock = FakeClock()
+    deadline = Deadline(clock=clock)
+    used = []
+
+    def get_answer_context(*args, **kwargs):
+        clock.advance(6.0)
+        return "context", []
+
+    def generate_answer(bedrock, agent_runtime, openai_client, model_id, *args):
+        used.append(model_id)
+        return model_id, "answer"
+
+    monkeypatch.setattr(utils, "get_answer_context", get_answer_context)
+    monkeypatch.setattr(utils, "generate_answer", generate_answer)
+    monkeypatch.setattr(utils, "assemble_answer_prompt", lambda *args: "prompt")
+
+    model_id, output = utils.get_model_response_within_deadline(
+        deadline, "how do i renew my license?", ChatHandler(), None, None, None, SONNET, "kb", "kb", batch_mode=True
+    )
+
+    assert (model_id, output) == (FAST_MODEL_ID, "answer")
+    assert used == [FAST_MODEL_ID]
+    assert "fast_model" in deadline.degraded
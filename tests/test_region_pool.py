@@ -0,0 +1,99 @@
+"""RegionalClientPool against local stub Bedrock endpoints: failover and EWMA latency routing."""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import boto3
+import pytest
+from botocore.config import Config
+
+from metrics import MetricsRegistry
+from region_pool import RegionalClientPool
+
+MODEL_ID = "us.amazon.nova-micro-v1:0"
+
+
+def _stub_handler(region, behaviour):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            behaviour["calls"] += 1
+            time.sleep(behaviour.get("delay", 0.0))
+            if behaviour.get("fail"):
+                body = json.dumps({"message": "stub unavailable"}).encode()
+                self.send_response(503)
+                self.send_header("x-amzn-ErrorType", "ServiceUnavailableException")
+            else:
+                body = json.dumps({"region": region}).encode()
+                self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+@pytest.fixture
+def stub_regions():
+    """Two stub bedrock-runtime endpoints; tests tweak each one's behaviour dict."""
+    behaviours = {"us-west-2": {"calls": 0}, "us-east-1": {"calls": 0}}
+    servers = []
+    for region, behaviour in behaviours.items():
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _stub_handler(region, behaviour))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        behaviour["url"] = f"http://127.0.0.1:{server.server_address[1]}"
+    yield behaviours
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _pool(behaviours, registry):
+    session = boto3.Session(aws_access_key_id="test", aws_secret_access_key="test", region_name="us-west-2")
+    return RegionalClientPool(
+        list(behaviours), session=session,
+        endpoint_overrides={region: b["url"] for region, b in behaviours.items()},
+        config=Config(retries={"total_max_attempts": 1}, connect_timeout=2, read_timeout=5),
+        explore_rate=0.0, registry=registry
+    )
+
+
+def _answering_region(pool):
+    response = pool.invoke_model(modelId=MODEL_ID, body=json.dumps({"prompt": "hi"}))
+    return json.loads(response["body"].read())["region"]
+
+
+def test_fails_over_to_next_region_on_retryable_error(stub_regions):
+    registry = MetricsRegistry()
+    stub_regions["us-west-2"]["fail"] = True
+    pool = _pool(stub_regions, registry)
+
+    assert _answering_region(pool) == "us-east-1"
+    assert registry.counter("region_failovers", service="bedrock-runtime", region="us-west-2") == 1
+
+    # The error penalty now ranks the failing region last, so it is not tried first again.
+    assert pool.ranked_regions()[0] == "us-east-1"
+    assert _answering_region(pool) == "us-east-1"
+    assert stub_regions["us-west-2"]["calls"] == 1
+
+
+def test_routes_to_the_region_with_the_lower_latency_ewma(stub_regions):
+    registry = MetricsRegistry()
+    stub_regions["us-west-2"]["delay"] = 0.3
+    pool = _pool(stub_regions, registry)
+
+    # Configured order first; then the still unmeasured region ranks ahead of the measured one.
+    assert _answering_region(pool) == "us-west-2"
+    assert _answering_region(pool) == "us-east-1"
+
+    stats = pool.stats()
+    assert stats["us-east-1"]["latency_ewma"] < stats["us-west-2"]["latency_ewma"]
+    assert all(_answering_region(pool) == "us-east-1" for _ in range(3))
+    assert registry.gauge("region_latency_ewma", service="bedrock-runtime", region="us-west-2") >= 0.3
@@ -0,0 +1,52 @@
+"""Identical questions asked together share one answer; the follower's progress says it is waiting."""
+
+import threading
+import time
+
+import utils
+from metrics import MetricsRegistry
+from progress import STAGE_GENERATING, STAGE_WAITING_FOR_SHARED, AnswerProgress
+from utils import ChatHandler
+
+MICRO = "us.amazon.nova-micro-v1:0"
+
+
+def _wait_for_stage(progress, stage, timeout=5.0):
+    give_up = time.monotonic() + timeout
+    while progress.snapshot()["stage"] != stage:
+        assert time.monotonic() < give_up, f"stage is {progress.snapshot()['stage']!r}, expected {stage!r}"
+        time.sleep(0.01)
+
+
+def test_follower_progress_reports_waiting_for_the_shared_answer(monkeypatch):
+    release = threading.Event()
+    calls = []
+
+    def generate_answer(*args):
+        calls.append(args[3])
+        release.wait(5)
+        return args[3], "shared answer"
+
+    monkeypatch.setattr(utils, "get_answer_context", lambda *args, **kwargs: ("context", []))
+    monkeypatch.setattr(utils, "assemble_answer_prompt", lambda *args: "prompt")
+    monkeypatch.setattr(utils, "generate_answer", generate_answer)
+
+    def ask(progress, results):
+        results.append(utils.answer_query("How do I renew my license?", ChatHandler(), None, None, None, None,
+                                          MICRO, "kb", "KB-Website", progress=progress))
+
+    leader, follower = AnswerProgress(MetricsRegistry()), AnswerProgress(MetricsRegistry())
+    results = []
+    threads = [threading.Thread(target=ask, args=(leader, results))]
+    threads[0].start()
+    _wait_for_stage(leader, STAGE_GENERATING)
+    threads.append(threading.Thread(target=ask, args=(follower, results)))
+    threads[1].start()
+    _wait_for_stage(follower, STAGE_WAITING_FOR_SHARED)
+
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert calls == [MICRO]
+    assert len(results) == 2 and all(result.startswith("shared answer") for result in results)
@@ -0,0 +1,65 @@
+"""SentenceSplitter and SpokenSection fed chunked model output, including markers and sentences split across chunks."""
+
+import pytest
+
+from speech import SPOKEN_MARKER, SentenceSplitter, SpokenSection
+
+
+def _split(chunks, **kwargs):
+    splitter = SentenceSplitter(**kwargs)
+    sentences = []
+    for chunk in chunks:
+        sentences += splitter.feed(chunk)
+    return sentences + splitter.flush()
+
+
+def _chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 1000])
+def test_sentences_are_the_same_for_any_chunking(size):
+    text = "You can renew online. It takes about 10 minutes! Do you need help? "
+    assert _split(_chunked(text, size)) == ["You can renew online.", "It takes about 10 minutes!", "Do you need help?"]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("The fee is $25. Apply online. ", ["The fee is $25.", "Apply online."]),
+    ("The fee is 25. Apply online. ", ["The fee is 25.", "Apply online."]),
+    ("Call Dr. Smith at the office. Bring your ID. ", ["Call Dr. Smith at the office.", "Bring your ID."]),
+    ("Bring proof, e.g. a utility bill. Then apply. ", ["Bring proof, e.g. a utility bill.", "Then apply."]),
+    ("Steps:\n1. Apply online.\n2. Pay the fee. ", ["Steps:", "1. Apply online.", "2. Pay the fee."]),
+    ("Steps: 1. Apply online. 2. Pay the fee. ", ["Steps: 1. Apply online.", "2. Pay the fee."]),
+])
+def test_abbreviations_and_numbers(text, expected):
+    assert _split(_chunked(text, 4)) == expected
+
+
+def test_long_sentence_is_cut_at_its_last_clause():
+    text = "Before you apply, gather your documents, check the fee schedule, and read the guide"
+    sentences = _split([text], max_chars=60)
+    assert sentences[0] == "Before you apply, gather your documents, check the fee schedule,"
+    assert sentences[1] == "and read the guide"
+
+
+def _spoken(chunks, marker=SPOKEN_MARKER):
+    section = SpokenSection(marker)
+    return "".join(section.feed(chunk) for chunk in chunks), section.found
+
+
+@pytest.mark.parametrize("size", [1, 2, 5, 1000])
+def test_spoken_section_with_marker_split_across_chunks(size):
+    text = f"**Answer:** Details here.\n\n{SPOKEN_MARKER} Renew online at dol.wa.gov.\nIt takes ten minutes.\n\nSources: ..."
+    spoken, found = _spoken(_chunked(text, size))
+    assert found
+    assert spoken == "Renew online at dol.wa.gov.\nIt takes ten minutes."
+
+
+def test_spoken_section_without_marker_speaks_nothing():
+    spoken, found = _spoken(_chunked("Just an answer.\n\nNo summary.", 3))
+    assert (spoken, found) == ("", False)
+
+
+def test_spoken_section_without_a_marker_configured_passes_everything():
+    spoken, found = _spoken(_chunked("All of it.\n\nEven this.", 3), marker=None)
+    assert (spoken, found) == ("All of it.\n\nEven this.", True)
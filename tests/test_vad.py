@@ -0,0 +1,39 @@
+"""trim_and_normalize on synthetic clips: trimming around speech, and quiet clips passed through."""
+
+import numpy as np
+
+from metrics import MetricsRegistry
+from vad import SAMPLE_RATE, trim_and_normalize
+
+
+def _pcm(*segments):
+    """Concatenate (seconds, level_dbfs) segments; level None is digital silence plus faint noise."""
+    rng = np.random.default_rng(0)
+    parts = []
+    for seconds, level_db in segments:
+        n = int(seconds * SAMPLE_RATE)
+        if level_db is None:
+            parts.append(rng.normal(0, 10 ** (-80 / 20), n))
+        else:
+            t = np.arange(n) / SAMPLE_RATE
+            parts.append(np.sin(2 * np.pi * 220 * t) * 10 ** (level_db / 20) * np.sqrt(2))
+    return (np.concatenate(parts) * 32768).astype("<i2").tobytes()
+
+
+def _seconds(pcm):
+    return len(pcm) / 2 / SAMPLE_RATE
+
+
+def test_trailing_pause_is_trimmed():
+    pcm = _pcm((0.5, None), (1.0, -20), (2.0, None))
+    trimmed = trim_and_normalize(pcm, registry=MetricsRegistry())
+    assert 1.0 <= _seconds(trimmed) <= 1.5
+
+
+def test_quiet_speech_below_the_threshold_floor_is_passed_through():
+    pcm = _pcm((1.0, -55), (0.5, -56))
+    assert trim_and_normalize(pcm, registry=MetricsRegistry()) == pcm
+
+
+def test_empty_clip_stays_empty():
+    assert trim_and_normalize(b"", registry=MetricsRegistry()) == b""
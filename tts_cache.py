@@ -0,0 +1,180 @@
+"""
+Content-addressed cache for Polly speech synthesis.
+
+Audio is keyed by a hash of (SSML text, voice id, engine, speed), so phrases the
+voice bot says again and again ("Call 800-318-6022 for help.") are synthesized
+once and then played straight from disk. The cache is a single SQLite file with
+a size limit; the least recently used clips are evicted first.
+
+Texts longer than one Polly request allows are split at sentence (or word)
+boundaries. The chunks are cached and synthesized independently, in parallel,
+and the MP3 bytes are concatenated.
+
+Cache use and Polly spend are recorded in the metrics registry:
+
+    tts_cache_hits / tts_cache_misses   per chunk
+    tts_characters_synthesized          characters sent to Polly (what Polly bills)
+"""
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import metrics as default_metrics
+from speech import build_ssml, synthesize_speech
+
+# Polly bills at most 3,000 characters per request; leave room for SSML escaping.
+POLLY_MAX_CHARS = 2500
+
+_SENTENCE_BOUNDARY_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def tts_cache_key(ssml_text, voice_id, engine, speed):
+    """
+    Build the content address for a synthesized clip.
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    payload = json.dumps([ssml_text, voice_id, engine, speed], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def split_for_polly(text, max_chars=POLLY_MAX_CHARS):
+    """Split text into chunks of at most max_chars, at sentence boundaries where possible."""
+    text = text.strip()
+    if len(text) <= max_chars:
+        return [text] if text else []
+
+    pieces = []
+    for sentence in _SENTENCE_BOUNDARY_RE.split(text):
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            pieces.append(sentence[:cut])
+            sentence = sentence[cut:].lstrip()
+        pieces.append(sentence)
+
+    chunks = []
+    for piece in pieces:
+        if chunks and len(chunks[-1]) + 1 + len(piece) <= max_chars:
+            chunks[-1] = f"{chunks[-1]} {piece}"
+        else:
+            chunks.append(piece)
+    return chunks
+
+
+class SQLiteTTSCache:
+    """
+    Local audio cache in a single SQLite file, limited to max_bytes of audio.
+    Safe to share across threads.
+    """
+
+    def __init__(self, db_path="tts_cache.sqlite3", max_bytes=256 * 1024 * 1024):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS tts_audio (
+                    key TEXT PRIMARY KEY,
+                    voice_id TEXT,
+                    audio BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL
+                )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS tts_audio_last_used ON tts_audio (last_used)")
+            self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT audio FROM tts_audio WHERE key = ?", (key,)).fetchone()
+            if row:
+                self._conn.execute("UPDATE tts_audio SET last_used = ? WHERE key = ?", (time.time(), key))
+                self._conn.commit()
+        return row[0] if row else None
+
+    def put(self, key, audio, voice_id=None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO tts_audio VALUES (?, ?, ?, ?, ?)",
+                (key, voice_id, audio, len(audio), time.time())
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM tts_audio").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for key, size in self._conn.execute("SELECT key, size FROM tts_audio ORDER BY last_used"):
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM tts_audio WHERE key = ?", evicted)
+
+    def size_bytes(self):
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM tts_audio").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+_chunk_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="polly")
+
+
+def get_tts_cache():
+    """Process-wide SQLiteTTSCache, so Streamlit reruns share one connection."""
+    global _default_cache
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = SQLiteTTSCache()
+    return _default_cache
+
+
+def synthesize_speech_cached(polly, text, voice_id='Joanna', speed=1.0, engine='neural', cache=None,
+                             max_chars=POLLY_MAX_CHARS, registry=None):
+    """
+    synthesize_speech with a content-addressed cache and chunking of long texts.
+
+    Args:
+        cache: Object with get(key) / put(key, audio, voice_id); defaults to get_tts_cache()
+
+    Returns:
+        bytes: MP3 audio for the whole text
+    """
+    cache = cache or get_tts_cache()
+    registry = registry or default_metrics
+
+    def synthesize_chunk(chunk):
+        key = tts_cache_key(build_ssml(chunk, speed), voice_id, engine, speed)
+        audio = cache.get(key)
+        if audio is not None:
+            registry.increment("tts_cache_hits")
+            return audio
+        registry.increment("tts_cache_misses")
+        registry.increment("tts_characters_synthesized", len(chunk))
+        audio = synthesize_speech(polly, chunk, voice_id=voice_id, speed=speed, engine=engine)
+        cache.put(key, audio, voice_id=voice_id)
+        return audio
+
+    chunks = split_for_polly(text, max_chars)
+    if not chunks:
+        return b""
+    if len(chunks) == 1:
+        return synthesize_chunk(chunks[0])
+    # Polly MP3 streams are bare MPEG frames, so the chunks concatenate into one clip.
+    return b"".join(_chunk_pool.map(synthesize_chunk, chunks))
@@ -3,7 +3,6 @@ import json
 import os
 
 from langchain_community.chat_message_histories import ChatMessageHistory
-from langdetect import detect
 import time
 
 from requests_aws4auth import AWS4Auth
@@ -22,6 +21,19 @@ import io
 
 from concurrent.futures import ThreadPoolExecutor
 
+from judge_cache import judge_cache_key
+from language import detect_language
+from deadline import FAST_MODEL_ID, StageTimeout, TIMEOUT_MESSAGE
+from cascade import AUTO_MODEL_ID, CascadeRouter
+from circuit_breaker import CircuitBreakerRegistry, model_provider_name
+from singleflight import CoalescedTimeout, SingleFlight, coalescing_key
+from agent_sessions import AgentSessionPool, AgentTrace
+from progress import STAGE_DETECTING_LANGUAGE, STAGE_GENERATING, STAGE_RETRIEVING, STAGE_SAVING, STAGE_WAITING_FOR_SHARED
+from prompts import PromptText, get_prompt_template, record_prompt_usage, supports_prompt_cache
+
+# Bump whenever the judge prompt in assess_answer_query changes so cached results are not reused.
+JUDGE_PROMPT_VERSION = "v1"
+
 def generate_json_filename(tag):
     # Get current date and time
     current_datetime = datetime.now().strftime("%Y%m%d%H%M%S")
@@ -154,7 +166,9 @@ def list_json_files_in_s3_folder(s3_uri):
 
 
 class ChatHandler:
-    def __init__(self):
+    def __init__(self, session_id=None):
+        # Identifies the conversation, e.g. to reuse its Bedrock Agent session.
+        self.session_id = session_id or str(uuid.uuid4())
         self.memory = ChatMessageHistory()
 
     def add_message(self, role, content):
@@ -166,6 +180,13 @@ class ChatHandler:
     def get_chat_history(self):
         return self.memory.messages
 
+    def tag_last_answer(self, answer_id):
+        """Set the id of the latest AI message, so per-answer state (e.g. its judgement) can be found again."""
+        for message in reversed(self.memory.messages):
+            if message.type == "ai":
+                message.id = answer_id
+                return
+
     def get_conversation_string(self):
         return "\n".join([f"{msg.type}: {msg.content}" for msg in self.memory.messages])
     
@@ -223,14 +244,23 @@ def get_context(fbedrock_agent_runtime_client, foundation_model, kb_id_hierarchi
         return f"An error occurred: {str(e)}"
     return sorted_results
 
-def get_response(fbedrock_client, foundation_model, query, region='us-west-2'):
+def build_nova_request_body(query, cache=False):
+    """
+    Native Bedrock InvokeModel body for Amazon Nova models.
+
+    With cache=True and a PromptText query, a cache point follows the static prompt prefix.
+    """
     system = [{
         "text": "You are a helpful AI assistant."
     }]
 
+    if cache and isinstance(query, PromptText):
+        content = [{"text": query.static_prefix}, {"cachePoint": {"type": "default"}}, {"text": query.dynamic_suffix}]
+    else:
+        content = [{"text": query}]
     messages = [{
         "role": "user",
-        "content": [{"text": query}]
+        "content": content
     }]
 
     inference_config = {
@@ -240,12 +270,18 @@ def get_response(fbedrock_client, foundation_model, query, region='us-west-2'):
         "topK": 50
     }
 
-    request_body = {
+    return {
         "messages": messages,
         "system": system,
         "inferenceConfig": inference_config
     }
 
+def parse_nova_response_body(response_body):
+    return response_body['output']['message']['content'][0]['text']
+
+def get_response(fbedrock_client, foundation_model, query, region='us-west-2'):
+    request_body = build_nova_request_body(query, cache=supports_prompt_cache(foundation_model))
+
     response = fbedrock_client.invoke_model(
         modelId=foundation_model,
         body=json.dumps(request_body),
@@ -254,7 +290,8 @@ def get_response(fbedrock_client, foundation_model, query, region='us-west-2'):
     )
     
     response_body = json.loads(response['body'].read())
-    output_text = response_body['output']['message']['content'][0]['text']
+    output_text = parse_nova_response_body(response_body)
+    record_prompt_usage(foundation_model, response_body.get('usage'))
 
     return output_text
 
@@ -265,46 +302,40 @@ def do_batch_assess():
     for response_file in reponse_files:
         print(response_file)
   
-def send_prompt_to_agent(client, agent_id,agent_alias_id, prompt):
-
-    # Initialize the Bedrock Agent Runtime client with a specific region
-    #client = boto3.client('bedrock-agent-runtime', region_name='us-west-2')  # Change to your region
+def stream_agent_response(client, agent_id, agent_alias_id, prompt, session_id=None, on_trace=None):
+    """
+    Yield a Bedrock Agent's answer chunk by chunk.
 
-    # Define the agent ID and alias ID
-    #agent_id = 'WYNNZUBAH3'
-    #agent_alias_id = 'JIFVQV4MZK'  # You need to provide the correct alias ID
-    #prompt = "What are the benefits of using generative AI in manufacturing?"
+    Args:
+        session_id (str): Agent session to continue (see AgentSessionPool); a new one if None
+        on_trace (callable): Called with each trace event (enables agent tracing, see AgentTrace)
+    """
+    session_id = session_id or 'session-' + str(uuid.uuid4())
+    response = client.invoke_agent(
+        agentId=agent_id,
+        agentAliasId=agent_alias_id,
+        sessionId=session_id,
+        inputText=prompt,
+        enableTrace=on_trace is not None,
+        streamingConfigurations={"streamFinalResponse": True}
+    )
 
+    for event in response['completion']:
+        if 'chunk' in event:
+            # The chunk is plain text, not JSON
+            if isinstance(on_trace, AgentTrace):
+                on_trace.chunk_received()
+            yield event['chunk']['bytes'].decode('utf-8')
+        elif 'trace' in event and on_trace is not None:
+            on_trace(event['trace'])
+
+def send_prompt_to_agent(client, agent_id,agent_alias_id, prompt, session_id=None, on_trace=None):
+    """Full answer of a Bedrock Agent, or None on error (see stream_agent_response)."""
     try:
-        # Generate a session ID
-        session_id = 'session-' + str(uuid.uuid4())[:8]
-        print(f"Using session ID: {session_id}")
-        
-        # Send the prompt to the Bedrock Agent
-        response = client.invoke_agent(
-            agentId=agent_id,
-            agentAliasId=agent_alias_id,
-            sessionId=session_id,
-            inputText=prompt
-        )
-        
-        # Handle the streaming response
-        event_stream = response['completion']
-        
-        print("\nAgent response:")
-        full_response = ""
-        
-        # Process each event in the stream
-        for event in event_stream:
-            # Check if the event contains a chunk
-            if 'chunk' in event:
-                # The chunk is plain text, not JSON
-                chunk_text = event['chunk']['bytes'].decode('utf-8')
-                full_response += chunk_text
-                print(chunk_text, end='', flush=True)  # Print incrementally
-        
-        print("\n\n--- End of response ---")
-        return full_response
+        chunks = []
+        for chunk in stream_agent_response(client, agent_id, agent_alias_id, prompt, session_id, on_trace):
+            chunks.append(chunk)
+        return "".join(chunks)
     except Exception as e:
         print(f"Error: {str(e)}")
         import traceback
@@ -333,19 +364,24 @@ def write_prompt_to_audit_file(prompt_data, filename="audit.txt"):
     with open(filename, "w", encoding="utf-8") as file:
         file.write(prompt_data)
 
-def get_response_openai(openai_client, model_id, prompt_data):
-    response = openai_client.chat.completions.create(
-        model=model_id, #"gpt-4",
-        messages=[
+def build_openai_request_body(model_id, prompt_data):
+    """Chat Completions request body, shared by the real-time call and the OpenAI Batch API."""
+    return {
+        "model": model_id, #"gpt-4",
+        "messages": [
             {"role": "user", "content": prompt_data}
         ],
-        temperature=0.0,
-        top_p=1.0,
-        max_tokens=500,
-        frequency_penalty=0.0,
-        presence_penalty=0.0
-    )
+        "temperature": 0.0,
+        "top_p": 1.0,
+        "max_tokens": 500,
+        "frequency_penalty": 0.0,
+        "presence_penalty": 0.0
+    }
+
+def get_response_openai(openai_client, model_id, prompt_data):
+    response = openai_client.chat.completions.create(**build_openai_request_body(model_id, prompt_data))
     output_text = response.choices[0].message.content
+    record_prompt_usage(model_id, getattr(response, "usage", None))
     return output_text
 
 def get_response_agent_(fbedrock_client, foundation_model, query, region='us-west-2'):
@@ -389,15 +425,27 @@ def get_response_agent_(fbedrock_client, foundation_model, query, region='us-wes
 
     return output_text
 
-def get_response_claude(fbedrock_client, foundation_model, query, region='us-west-2'):
+def build_claude_request_body(query, cache=False):
+    """
+    Native Bedrock InvokeModel body for Anthropic Claude models.
+
+    With cache=True and a PromptText query, the static prompt prefix is marked with cache_control.
+    """
     system = "You are a helpful AI assistant."
 
+    if cache and isinstance(query, PromptText):
+        content = [
+            {"type": "text", "text": query.static_prefix, "cache_control": {"type": "ephemeral"}},
+            {"type": "text", "text": query.dynamic_suffix}
+        ]
+    else:
+        content = query
     messages = [{
         "role": "user",
-        "content": query
+        "content": content
     }]
 
-    request_body = {
+    return {
         "anthropic_version": "bedrock-2023-05-31",
         "max_tokens": 2000,
         "messages": messages,
@@ -407,6 +455,12 @@ def get_response_claude(fbedrock_client, foundation_model, query, region='us-wes
         "top_k": 50
     }
 
+def parse_claude_response_body(response_body):
+    return response_body['content'][0]['text']
+
+def get_response_claude(fbedrock_client, foundation_model, query, region='us-west-2'):
+    request_body = build_claude_request_body(query, cache=supports_prompt_cache(foundation_model))
+
     response = fbedrock_client.invoke_model(
         modelId=foundation_model,
         body=json.dumps(request_body),
@@ -415,116 +469,191 @@ def get_response_claude(fbedrock_client, foundation_model, query, region='us-wes
     )
     
     response_body = json.loads(response['body'].read())
-    output_text = response_body['content'][0]['text']
+    output_text = parse_claude_response_body(response_body)
+    record_prompt_usage(foundation_model, response_body.get('usage'))
 
     return output_text
 
-def answer_query(user_input, chat_handler, bedrock, bedrock_agent_runtime_client,s3_client, openai_client,model_id, kb_id, mode,report_mode=False, tag="wabotpoc", bucket_name="watech-rppilot-bronze",object_key_path="evaluation_data/users/", cohort = "user", batch_mode=False):
+def _report_usage(on_usage, model_id, usage):
+    counts = record_prompt_usage(model_id, usage)
+    if on_usage is not None and counts:
+        on_usage(counts)
 
-    start_time = time.time()
-    cohort_name=str(cohort).strip().lower() 
-    language_map = {
-        "en": "English", "pl": "Polish", "es": "Spanish",
-        # ... (rest of language map)
-    }
-    
+def stream_response(fbedrock_client, foundation_model, query, region='us-west-2', on_usage=None):
+    """
+    Nova: yield the answer text as it is generated (invoke_model_with_response_stream).
+    on_usage is called with the token counts (see record_prompt_usage) when they arrive.
+    """
+    request_body = build_nova_request_body(query, cache=supports_prompt_cache(foundation_model))
+
+    response = fbedrock_client.invoke_model_with_response_stream(
+        modelId=foundation_model,
+        body=json.dumps(request_body),
+        contentType='application/json',
+        accept='application/json'
+    )
+
+    for event in response['body']:
+        chunk = json.loads(event['chunk']['bytes']) if 'chunk' in event else {}
+        if 'contentBlockDelta' in chunk:
+            yield chunk['contentBlockDelta']['delta'].get('text', '')
+        elif 'metadata' in chunk:
+            _report_usage(on_usage, foundation_model, chunk['metadata'].get('usage'))
+
+def stream_response_claude(fbedrock_client, foundation_model, query, region='us-west-2', on_usage=None):
+    """Claude: yield the answer text as it is generated (invoke_model_with_response_stream)."""
+    request_body = build_claude_request_body(query, cache=supports_prompt_cache(foundation_model))
+
+    response = fbedrock_client.invoke_model_with_response_stream(
+        modelId=foundation_model,
+        body=json.dumps(request_body),
+        contentType='application/json',
+        accept='application/json'
+    )
+
+    for event in response['body']:
+        chunk = json.loads(event['chunk']['bytes']) if 'chunk' in event else {}
+        if chunk.get('type') == 'content_block_delta':
+            yield chunk['delta'].get('text', '')
+        elif chunk.get('type') == 'message_start':
+            # message_start carries a placeholder output_tokens (1); the real count comes with message_delta.
+            usage = chunk['message'].get('usage') or {}
+            _report_usage(on_usage, foundation_model, {k: v for k, v in usage.items() if k != 'output_tokens'})
+        elif chunk.get('type') == 'message_delta':
+            # Output tokens arrive at the end of the message.
+            usage = chunk.get('usage') or {}
+            _report_usage(on_usage, foundation_model, {'output_tokens': usage.get('output_tokens', 0)})
+
+def stream_response_openai(openai_client, model_id, prompt_data, on_usage=None):
+    """OpenAI: yield the answer text as it is generated."""
+    stream = openai_client.chat.completions.create(
+        **build_openai_request_body(model_id, prompt_data),
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+        if getattr(chunk, "usage", None):
+            _report_usage(on_usage, model_id, chunk.usage)
+
+def stream_model_response(bedrock, bedrock_agent_runtime_client, openai_client, model_id, prompt_data, user_query, agent_session_id=None, on_usage=None):
+    """
+    Streaming counterpart of call_model: yields text chunks as the model produces them.
+    on_usage receives token counts from models that report them (not agents).
+    """
+    if model_id.find("nova")!=-1:
+        yield from stream_response(bedrock, model_id, prompt_data, on_usage=on_usage)
+    elif model_id.find("claude")!=-1:
+        yield from stream_response_claude(bedrock, model_id, prompt_data, on_usage=on_usage)
+    elif model_id.find("gpt")!=-1:
+        yield from stream_response_openai(openai_client, model_id, prompt_data, on_usage=on_usage)
+    else:
+        agent_id = "WYNNZUBAH3"
+        agent_alias_id = "JIFVQV4MZK"
+        yield from stream_agent_response(bedrock_agent_runtime_client, agent_id, agent_alias_id, user_query, agent_session_id)
+
+def get_answer_context(user_input, bedrock_agent_runtime_client, model_id, kb_id, mode, with_results=False):
+    """
+    Network half of prompt assembly: fetch the context for the selected mode.
+
+    With with_results=True, returns (context, retrieval_results) where
+    retrieval_results is the raw get_context output (None for modes without a KB).
+    """
     userQuery = user_input
 
     context="NONE"
+    retrieval_results = None
     if mode == "Website-Agencies":
         context = load_csv_to_variable("AgencyList.csv")[['Website','Parent Domain','Domain']]
         context.reset_index(drop=True)
     elif mode == "KB-Website":
-        context = get_context(bedrock_agent_runtime_client, model_id, kb_id, userQuery )
-        context = f"""{context} Only return URLS present in this context"""
+        retrieval_results = get_context(bedrock_agent_runtime_client, model_id, kb_id, userQuery )
+        context = f"""{retrieval_results} Only return URLS present in this context"""
     elif mode == "KB-Legal Assistant":
-        context = get_context(bedrock_agent_runtime_client, model_id, kb_id, userQuery )
+        retrieval_results = get_context(bedrock_agent_runtime_client, model_id, kb_id, userQuery )
+        context = retrieval_results
         #context = f"""{context} Only return URLS present in this context"""
-    elif mode == "KB-Website":
-        context = get_context(bedrock_agent_runtime_client, model_id, kb_id, userQuery )
-        context = f"""{context} Only return URLS present in this context"""
 
-    if batch_mode:
-        chat_history = "NONE" #chat_handler.get_conversation_string()
-    else:
-        chat_history= chat_handler.get_conversation_string()
+    if with_results:
+        return context, retrieval_results
+    return context
+
+def assemble_answer_prompt(user_input, context, chat_history, mode, language_code=None):
+    """
+    CPU half of prompt assembly: language detection and prompt formatting.
+    Returns a PromptText (see prompts.py).
+
+    Takes only plain data, so it can run in a process pool. Pass language_code when
+    the caller has already detected it (e.g. with detect_languages over a batch).
+    """
+    language_map = {
+        "en": "English", "pl": "Polish", "es": "Spanish",
+        # ... (rest of language map)
+    }
     
-    detected_language_code = detect(userQuery)    
+    userQuery = user_input
+
+    detected_language_code = language_code or detect_language(userQuery)
     detected_language_name = language_map.get(detected_language_code, "Unknown")
     #detected_language_name = 'English'
  
-    if mode == "KB-Legal Assistant":
-        prompt_data = f""" You are a responsible, transparent, and equitable AI assistant designed to help Washington state residents understand 
-        and navigate the 2025 Washington Session Laws. Your responses must be accurate, accessible, and aligned with Washington State’s Executive Order 24-01 on Artificial Intelligence, including its principles of fairness, privacy, accountability, and public benefit.
-        Your role is to:
-        •	Provide clear, plain-language explanations of legal provisions from the 2025 Washington Session Laws.
-        •	Help users understand how specific laws may apply to their situation, without offering legal advice.
-        •	Ensure that your responses are inclusive, culturally sensitive, and accessible to people of all backgrounds, including those 
-            with limited English proficiency or disabilities.
-        •	Flag and explain any limitations or uncertainties in the information you provide.
-        •	Always disclose when content is AI-generated and encourage users to verify critical information with official or human legal sources.
-        •   If you can't find and answer from the RAG content, say "I don't know."
-        * Where possible provide helpful url links with the response.
-        You must:
-        •	Avoid generating or reinforcing bias, discrimination, or stereotypes.
-        •	Never make decisions or recommendations that could impact a person’s rights, benefits, or legal standing.
-        •	Be transparent about your sources and limitations.
-        •	Support human oversight and encourage users to consult legal professionals for complex or high-risk issues.
-        You are grounded in the following principles:
-        •	Equity and Inclusion: Prioritize equitable outcomes and avoid harm to vulnerable communities.
-        •	Transparency and Explainability: Clearly explain how you arrived at your answers and what sources were used.
-        •	Privacy and Security: Do not collect or store personal data. Do not process sensitive information unless explicitly permitted and necessary.
-        •	Accountability: Your outputs must be auditable, and you must defer to human judgment in all high-risk or ambiguous scenarios.
-        You may provide legal advice, but must emphasize thar you are not a lawyer and all decisions should be guided by a qualified human lawyer. 
-        You are a public service tool designed to increase understanding of Washington state laws and support informed civic engagement.
-
-        The response should be in {detected_language_name}.
-
-        Conversation History (for reference only; do not use as a source of truth):
-        {chat_history}
-
-        Context (retrieved from official sources; translate to English if needed):
-        {context}
-
-        User Question:
-        {userQuery}
-
-        Answer:
-        """
+    # Static instructions first and per-request parts last, so providers can cache the prefix.
+    prompt_data = get_prompt_template(mode).render(
+        detected_language_name=detected_language_name,
+        chat_history=chat_history,
+        context=context,
+        userQuery=userQuery
+    )
 
+    return prompt_data
+
+def build_answer_prompt(user_input, chat_handler, bedrock_agent_runtime_client, model_id, kb_id, mode, batch_mode=False):
+    """Retrieve context for the selected mode and assemble the full answer prompt used by answer_query."""
+    context = get_answer_context(user_input, bedrock_agent_runtime_client, model_id, kb_id, mode)
+
+    if batch_mode:
+        chat_history = "NONE" #chat_handler.get_conversation_string()
     else:
-        prompt_data = f"""
-        You are a knowledgeable and trustworthy virtual assistant for Washington State residents.
-        Your role is to provide accurate, up-to-date information and direct links to official Washington State government services, forms, and resources.
+        chat_history= chat_handler.get_conversation_string()
 
-        The response should be in {detected_language_name}.
+    return assemble_answer_prompt(user_input, context, chat_history, mode)
 
-        Instructions:
-        - Provide clear, step-by-step, and actionable answers that are understandable by someone with a 5th-grade reading level.
-        - Use a respectful, formal tone
-        - Always provide a helpful response, even if the question is vague—do not ask the user to rephrase.
-        - If no reliable or official answer is available, say so clearly and suggest how the user can get help (e.g., contact info or live chat).
-        - Include direct URLs to official Washington State websites, forms, or service pages whenever possible.
-        - Only include URLs that are valid, relevant, and lead directly to the service or form—not to generic landing pages.
-        - Never repeat the same URL in a response.
-        - When appropriate, offer the option to connect with a human representative, including phone numbers, email, or live chat links.
-        - Use a confident, friendly, and reassuring tone that reflects official guidance.
-        - End each response with a helpful follow-up question to guide the user to their next step.
+_circuit_breakers = CircuitBreakerRegistry()
 
-        Resident Expectation:
-        "I need to have confidence in the chatbot helping me go through the steps... link me to the right places because once I start googling, I don't know if I'm in the right place... I want it to link me in the furthest it can take me before doing the process of services like: filing unemployment.”
+def get_model_response(bedrock, bedrock_agent_runtime_client, openai_client, model_id, prompt_data, user_query, allow_fallback=False, with_model=False, agent_session_id=None, on_chunk=None, on_restart=None):
+    """
+    Send a prompt to the provider that serves model_id and return the output text.
 
-        Conversation History (for reference only; do not use as a source of truth):
-        {chat_history}
+    Calls go through a circuit breaker per (provider, model): while a model is
+    failing or very slow, calls to it raise CircuitOpenError at once, or with
+    allow_fallback=True are rerouted to its fallback model (see circuit_breaker).
+    With with_model=True, returns (model id that answered, output text).
 
-        Context (retrieved from official sources; translate to English if needed):
-        {context}
+    When streaming, on_restart() (see AnswerProgress.restart) is called before each
+    attempt, the fallback model's included, and returns the on_chunk for that attempt.
+    """
+    def call(candidate_model_id):
+        stream_to = on_restart() if on_chunk is not None and on_restart is not None else on_chunk
+        return call_model(bedrock, bedrock_agent_runtime_client, openai_client, candidate_model_id, prompt_data, user_query, agent_session_id, stream_to)
 
-        User Question:
-        {userQuery}
+    used_model_id, output_text = _circuit_breakers.call(model_id, call, allow_fallback)
+    if with_model:
+        return used_model_id, output_text
+    return output_text
 
-        Answer:
-        """
+def call_model(bedrock, bedrock_agent_runtime_client, openai_client, model_id, prompt_data, user_query, agent_session_id=None, on_chunk=None):
+    """
+    Dispatch a prompt to the provider that serves model_id, without a circuit breaker.
+    Agents continue agent_session_id (see AgentSessionPool) when it is given.
+    With on_chunk, the answer is streamed and on_chunk is called with each piece as it arrives.
+    """
+    if on_chunk is not None:
+        chunks = []
+        for chunk in stream_model_response(bedrock, bedrock_agent_runtime_client, openai_client, model_id, prompt_data, user_query, agent_session_id):
+            on_chunk(chunk)
+            chunks.append(chunk)
+        return "".join(chunks)
 
     #if model_id == 'us.amazon.nova-pro-v1:0':
     if model_id.find("nova")!=-1:
@@ -539,7 +668,189 @@ def answer_query(user_input, chat_handler, bedrock, bedrock_agent_runtime_client
         agent_id = "WYNNZUBAH3"
         agent_alias_id = "JIFVQV4MZK"
         #send_prompt_to_agent(client, agent_id,agent_alias_id, prompt):
-        output_text= send_prompt_to_agent(bedrock_agent_runtime_client,agent_id, agent_alias_id, userQuery)
+        output_text= send_prompt_to_agent(bedrock_agent_runtime_client,agent_id, agent_alias_id, user_query, agent_session_id)
+    return output_text
+
+_cascade_router = CascadeRouter()
+
+def generate_answer(bedrock, bedrock_agent_runtime_client, openai_client, model_id, prompt_data, user_query, hedge_policy=None, retrieval_results=None, mode=None, allow_fallback=False, agent_session_id=None, on_chunk=None, run_step=None, on_restart=None):
+    """
+    get_model_response, optionally hedged to a secondary model (see hedging.HedgePolicy).
+
+    model_id AUTO_MODEL_ID routes through the model cascade (see cascade.CascadeRouter),
+    which scores answers against retrieval_results; the returned id is then
+    "auto:<model that answered>".
+
+    on_chunk receives the answer as it streams. With on_restart, every model call
+    (each cascade step, a fallback model) starts a new attempt and streams into the
+    on_chunk on_restart returns, so chunks of a replaced or abandoned call are
+    dropped; the cascade's chosen answer is streamed again at the end. Hedged
+    answers race each other, so they are not streamed.
+
+    run_step(fn, model_id), when given, runs each model step (each cascade step
+    separately), e.g. under its own Deadline budget.
+
+    Returns:
+        tuple: (model_id whose answer was used, output text)
+    """
+    if hedge_policy is not None:
+        on_chunk = None
+
+    def call(candidate_model_id):
+        return get_model_response(bedrock, bedrock_agent_runtime_client, openai_client, candidate_model_id, prompt_data, user_query, allow_fallback, with_model=True, agent_session_id=agent_session_id, on_chunk=on_chunk, on_restart=on_restart)
+
+    def answer(candidate_model_id):
+        if hedge_policy is None:
+            return call(candidate_model_id)
+        _, result = hedge_policy.run(call, candidate_model_id)
+        return result
+
+    def step(candidate_model_id):
+        if run_step is None:
+            return answer(candidate_model_id)
+        return run_step(answer, candidate_model_id)
+
+    if model_id == AUTO_MODEL_ID:
+        used_model_id, output_text = _cascade_router.run(step, retrieval_results, mode)
+        if on_chunk is not None and on_restart is not None and output_text:
+            # The escalation may have been abandoned mid-stream; show the answer that was kept.
+            on_restart()(output_text)
+        return f"{AUTO_MODEL_ID}:{used_model_id}", output_text
+    return step(model_id)
+
+def format_answer_output(output_text, model_id, mode, runTime):
+    if runTime is None:
+        return f"{output_text}\n\nModel used: {model_id}\n\nbot type: {mode}\n\n"
+    return f"{output_text}\n\nModel used: {model_id}\n\nbot type: {mode}\n\nTime to run: {runTime}\n\n"
+
+def build_answer_record(userQuery, output_text, runTime, model_id, mode, cohort_name, degraded=None, **extra):
+    """
+    JSON report record for one answer (the layout LLM_Judge_threads reads back); extra fields are appended.
+    runTime None leaves timetorun out, for answers without a per-request latency (bulk inference).
+    """
+    #content= build_json_string(question = userQuery, prompt=prompt_data, response=output_text, timetorun=runTime, model=model_id, bot_type = mode, cohort_tag=cohort_name)
+    if runTime is None:
+        if degraded:
+            extra = dict(degraded=degraded, **extra)
+        return build_json_string(question = userQuery, response=output_text, model=model_id, bot_type = mode, cohort_tag=cohort_name, **extra)
+    if degraded:
+        return build_json_string(question = userQuery, response=output_text, timetorun=runTime, model=model_id, bot_type = mode, cohort_tag=cohort_name, degraded=degraded, **extra)
+    return build_json_string(question = userQuery, response=output_text, timetorun=runTime, model=model_id, bot_type = mode, cohort_tag=cohort_name, **extra)
+
+def get_model_response_within_deadline(deadline, userQuery, chat_handler, bedrock, bedrock_agent_runtime_client, openai_client, model_id, kb_id, mode, batch_mode=False, hedge_policy=None, agent_session_id=None, progress=None):
+    """
+    Retrieval and generation for answer_query under a per-request Deadline.
+
+    Retrieval that overruns its budget falls back to no context; after a slow
+    retrieval or with less than the generation and report budgets left, generation
+    switches to FAST_MODEL_ID; generation that overruns returns None.
+
+    Returns:
+        tuple: (model_id actually used, output text or None)
+    """
+    report_stage(progress, STAGE_RETRIEVING)
+    context, retrieval_results = deadline.run_or_fallback("retrieval", ("NONE", None), get_answer_context, userQuery, bedrock_agent_runtime_client, model_id, kb_id, mode, with_results=True)
+
+    if batch_mode:
+        chat_history = "NONE"
+    else:
+        chat_history = chat_handler.get_conversation_string()
+    report_stage(progress, STAGE_DETECTING_LANGUAGE)
+    prompt_data = assemble_answer_prompt(userQuery, context, chat_history, mode)
+
+    if deadline.prefer_fast_model() and model_id != FAST_MODEL_ID:
+        print(f"Deadline: {deadline.remaining():.1f}s left, switching {model_id} to {FAST_MODEL_ID}")
+        deadline.mark_degraded("fast_model")
+        model_id = FAST_MODEL_ID
+
+    if model_id.find("gpt")!=-1 and openai_client is not None:
+        openai_client = openai_client.with_options(timeout=max(deadline.budget("generation"), 1.0))
+
+    report_stage(progress, STAGE_GENERATING)
+    if model_id == AUTO_MODEL_ID:
+        # Each cascade step runs under its own generation budget, so an escalation that
+        # overruns keeps the first model's answer instead of losing both.
+        def run_step(fn, candidate_model_id):
+            try:
+                return deadline.run("generation", fn, candidate_model_id)
+            except StageTimeout:
+                deadline.mark_degraded(f"generation:{candidate_model_id}")
+                raise
+        try:
+            return generate_answer(bedrock, bedrock_agent_runtime_client, openai_client, model_id, prompt_data, userQuery, hedge_policy, retrieval_results, mode, not batch_mode, agent_session_id, progress and progress.append, run_step, progress and progress.restart)
+        except Exception as e:
+            print(f"Deadline: generation failed ({e}); degrading")
+            deadline.mark_degraded("generation")
+            if progress is not None:
+                progress.restart()
+            return model_id, None
+    used_model_id, output_text = deadline.run_or_fallback("generation", (model_id, None), generate_answer, bedrock, bedrock_agent_runtime_client, openai_client, model_id, prompt_data, userQuery, hedge_policy, retrieval_results, mode, not batch_mode, agent_session_id, progress and progress.append, None, progress and progress.restart)
+    if output_text is None and progress is not None:
+        # The abandoned call keeps streaming in the background; stop showing its chunks.
+        progress.restart()
+    return used_model_id, output_text
+
+def report_stage(progress, stage):
+    """Record a stage transition on an AnswerProgress, if the caller passed one."""
+    if progress is not None:
+        progress.set_stage(stage)
+
+_answer_singleflight = SingleFlight("answer")
+_agent_sessions = AgentSessionPool()
+
+def agent_session_for(chat_handler, model_id, batch_mode=False):
+    """The conversation's Bedrock Agent session when model_id is an agent, else None."""
+    if batch_mode or model_id == AUTO_MODEL_ID or model_provider_name(model_id) != "bedrock-agent":
+        return None
+    return _agent_sessions.session_for(chat_handler.session_id)
+
+def end_agent_session(chat_handler):
+    _agent_sessions.end(chat_handler.session_id)
+
+def answer_query(user_input, chat_handler, bedrock, bedrock_agent_runtime_client,s3_client, openai_client,model_id, kb_id, mode,report_mode=False, tag="wabotpoc", bucket_name="watech-rppilot-bronze",object_key_path="evaluation_data/users/", cohort = "user", batch_mode=False, deadline=None, hedge_policy=None, progress=None):
+    """
+    Answer a question: retrieval, prompt assembly, generation, chat history and report.
+    Pass an AnswerProgress as progress (see progress.submit_with_progress) to follow the
+    stages and the answer as it streams.
+    """
+    start_time = time.time()
+    cohort_name=str(cohort).strip().lower() 
+    userQuery = user_input
+    agent_session_id = agent_session_for(chat_handler, model_id, batch_mode)
+
+    def fetch():
+        if deadline is None:
+            report_stage(progress, STAGE_RETRIEVING)
+            context, retrieval_results = get_answer_context(userQuery, bedrock_agent_runtime_client, model_id, kb_id, mode, with_results=True)
+            chat_history = "NONE" if batch_mode else chat_handler.get_conversation_string()
+            report_stage(progress, STAGE_DETECTING_LANGUAGE)
+            prompt_data = assemble_answer_prompt(userQuery, context, chat_history, mode)
+            report_stage(progress, STAGE_GENERATING)
+            # Batch sweeps measure a specific model, so only interactive requests are rerouted when a model is down.
+            return generate_answer(bedrock, bedrock_agent_runtime_client, openai_client, model_id, prompt_data, userQuery, hedge_policy, retrieval_results, mode, not batch_mode, agent_session_id, progress and progress.append, None, progress and progress.restart)
+        return get_model_response_within_deadline(deadline, userQuery, chat_handler, bedrock, bedrock_agent_runtime_client, openai_client, model_id, kb_id, mode, batch_mode, hedge_policy, agent_session_id, progress)
+
+    # Agent answers also depend on the agent's session memory, so they are never shared.
+    if batch_mode or chat_handler.get_conversation_string() or agent_session_id:
+        model_id, output_text = fetch()
+    else:
+        # Without chat history the answer depends only on the question, model, mode and KB, so identical
+        # questions arriving together share one retrieval + generation. Followers only see the result;
+        # their progress shows that they are waiting for it.
+        key = coalescing_key(userQuery, model_id, mode, kb_id)
+        try:
+            (model_id, output_text), _ = _answer_singleflight.do(
+                key, fetch, timeout=deadline.remaining() if deadline else None,
+                on_follow=lambda: report_stage(progress, STAGE_WAITING_FOR_SHARED)
+            )
+        except CoalescedTimeout:
+            deadline.mark_degraded("coalesced")
+            output_text = None
+
+    if deadline is not None and output_text is None:
+        # Nothing to show or to report; keep the failed turn out of the chat history.
+        return TIMEOUT_MESSAGE
+
     if not batch_mode:
         chat_handler.add_message("human", userQuery)
         chat_handler.add_message("ai", output_text)
@@ -547,15 +858,19 @@ def answer_query(user_input, chat_handler, bedrock, bedrock_agent_runtime_client
     end_time = time.time()
     elapsed_time = end_time - start_time
     runTime = f"Elapsed time: {elapsed_time:.4f} seconds"
-    output_text = f"{output_text}\n\nModel used: {model_id}\n\nbot type: {mode}\n\nTime to run: {runTime}\n\n"
+    output_text = format_answer_output(output_text, model_id, mode, runTime)
     
     if report_mode:
+        report_stage(progress, STAGE_SAVING)
         filename = generate_json_filename(tag)
         #object_key=f"{object_key_path}{filename}_{cohort_name}"
         object_key=f"{object_key_path}{cohort_name}_{filename}"
-        #content= build_json_string(question = userQuery, prompt=prompt_data, response=output_text, timetorun=runTime, model=model_id, bot_type = mode, cohort_tag=cohort_name)
-        content= build_json_string(question = userQuery, response=output_text, timetorun=runTime, model=model_id, bot_type = mode, cohort_tag=cohort_name)
-        s3_client.put_object(Bucket=bucket_name, Key=object_key, Body=content)
+        if deadline is None:
+            content = build_answer_record(userQuery, output_text, runTime, model_id, mode, cohort_name)
+            s3_client.put_object(Bucket=bucket_name, Key=object_key, Body=content)
+        else:
+            content = build_answer_record(userQuery, output_text, runTime, model_id, mode, cohort_name, deadline.degraded)
+            deadline.run_or_fallback("report", None, s3_client.put_object, Bucket=bucket_name, Key=object_key, Body=content)
         
     return output_text
 
@@ -563,179 +878,57 @@ def answer_query(user_input, chat_handler, bedrock, bedrock_agent_runtime_client
 
 
 
-def answer_query_talkie(user_input, chat_handler, bedrock, bedrock_agent_runtime_client,s3_client, openai_client,model_id, kb_id, mode,report_mode=False, tag="wabotpoc", bucket_name="watech-rppilot-bronze",object_key_path="evaluation_data/users/", cohort = "user", batch_mode=False):
-
-    start_time = time.time()
-    cohort_name=str(cohort).strip().lower() 
+def build_talkie_prompt(userQuery, chat_handler, bedrock_agent_runtime_client, model_id, kb_id, mode, batch_mode=False, context=None):
+    """
+    Retrieval, language detection and prompt formatting for the voice bot.
+    Pass context to skip retrieval (e.g. a speculative retrieval result).
+    """
     language_map = {
         "en": "English", "pl": "Polish", "es": "Spanish",
         # ... (rest of language map)
     }
-    
-    userQuery = user_input
-
-    context="NONE"
-    # if mode == "Website-Agencies":
-    #     context = load_csv_to_variable("AgencyList.csv")[['Website','Parent Domain','Domain']]
-    #     context.reset_index(drop=True)
-    # elif mode == "KB-Website":
-    #     context = get_context(bedrock_agent_runtime_client, model_id, kb_id, userQuery )
-    #     context = f"""{context} Only return URLS present in this context"""
-    # elif mode == "KB-Legal Assistant":
-    #     context = get_context(bedrock_agent_runtime_client, model_id, kb_id, userQuery )
-    #     #context = f"""{context} Only return URLS present in this context"""
-    # elif mode == "KB-Website":
-    #     context = get_context(bedrock_agent_runtime_client, model_id, kb_id, userQuery )
-    #     context = f"""{context} Only return URLS present in this context"""
-
-    # with open('techbot.json', 'r') as file:
-    #     context = json.load(file) #FHJ89HX6SK
-    context = get_context(bedrock_agent_runtime_client, model_id, kb_id, userQuery )
 
+    if context is None:
+        context = get_context(bedrock_agent_runtime_client, model_id, kb_id, userQuery )
 
     if batch_mode:
         chat_history = "NONE" #chat_handler.get_conversation_string()
     else:
         chat_history= chat_handler.get_conversation_string()
     
-    detected_language_code = detect(userQuery)    
+    detected_language_code = detect_language(userQuery)    
     detected_language_name = language_map.get(detected_language_code, "Unknown")
-    #detected_language_name = 'English'
  
-    if mode == "KB-Legal Assistant":
-        prompt_data = f""" You are a responsible, transparent, and equitable AI assistant designed to help Washington state residents understand 
-        and navigate the 2025 Washington Session Laws. Your responses must be accurate, accessible, and aligned with Washington State’s Executive Order 24-01 on Artificial Intelligence, including its principles of fairness, privacy, accountability, and public benefit.
-        Your role is to:
-        •	Provide clear, plain-language explanations of legal provisions from the 2025 Washington Session Laws.
-        •	Help users understand how specific laws may apply to their situation, without offering legal advice.
-        •	Ensure that your responses are inclusive, culturally sensitive, and accessible to people of all backgrounds, including those 
-            with limited English proficiency or disabilities.
-        •	Flag and explain any limitations or uncertainties in the information you provide.
-        •	Always disclose when content is AI-generated and encourage users to verify critical information with official or human legal sources.
-        •   If you can't find and answer from the RAG content, say "I don't know."
-        * Where possible provide helpful url links with the response.
-        You must:
-        •	Avoid generating or reinforcing bias, discrimination, or stereotypes.
-        •	Never make decisions or recommendations that could impact a person’s rights, benefits, or legal standing.
-        •	Be transparent about your sources and limitations.
-        •	Support human oversight and encourage users to consult legal professionals for complex or high-risk issues.
-        You are grounded in the following principles:
-        •	Equity and Inclusion: Prioritize equitable outcomes and avoid harm to vulnerable communities.
-        •	Transparency and Explainability: Clearly explain how you arrived at your answers and what sources were used.
-        •	Privacy and Security: Do not collect or store personal data. Do not process sensitive information unless explicitly permitted and necessary.
-        •	Accountability: Your outputs must be auditable, and you must defer to human judgment in all high-risk or ambiguous scenarios.
-        You may provide legal advice, but must emphasize thar you are not a lawyer and all decisions should be guided by a qualified human lawyer. 
-        You are a public service tool designed to increase understanding of Washington state laws and support informed civic engagement.
-
-        The response should be in {detected_language_name}.
-
-        Conversation History (for reference only; do not use as a source of truth):
-        {chat_history}
-
-        Context (retrieved from official sources; translate to English if needed):
-        {context}
-
-        User Question:
-        {userQuery}
-
-        Answer:
-        """
+    return get_prompt_template(mode, talkie=True).render(
+        detected_language_name=detected_language_name,
+        chat_history=chat_history,
+        context=context,
+        userQuery=userQuery
+    )
 
-    else:
-        prompt_data = f"""
-        You are a helpful assistant for Washington State residents. Your job is to help users find and understand government services using the data provided in the `context` AND actively retrieving and incorporating information from the URLs referenced in the context.
-
-        The `context` contains structured information about services from Washington State government agencies. Each service includes fields such as:
-        - Link Title
-        - Service Summary
-        - Link URL
-        - Category
-        - Sub Category
-        - Agency
-        - Audience
-        - Action
-        - Life event
-        - Time to accomplish
-        - Authenticated/Unauthenticated
-        - Eligibility requirements
-
-        Instructions:
-        1. When a user asks a question, identify their intent (e.g., apply, renew, report, find, get help).
-        2. Search the `context` for services that match the user's intent, keywords, or categories.
-        3. For EACH relevant service found:
-            a. Access and analyze the webpage at the provided Link URL
-            b. Extract relevant information such as:
-                - Detailed service descriptions
-                - Step-by-step procedures
-                - Required documents and forms
-                - Fees and payment methods
-                - Processing times
-                - Contact information
-                - Office locations and hours
-                - Eligibility criteria
-                - FAQs and common issues
-            c. Combine this web-sourced information with the context data
-            d. Verify the information is current and consistent
-        4. Return up to 3 relevant services with:
-            - Title and summary from context
-            - Direct link
-            - Relevant tags
-            - Comprehensive details from both context AND webpage analysis
-        5. If webpage access fails, note this in the response and rely on context data only
-        6. If no match is found, politely say so and suggest they try rephrasing.
-
-        Language:
-        - Always respond in the same language the user is using. If the user speaks Spanish, respond in Spanish. If the user speaks English, respond in English. Match the tone and formality of the user's language.
-
-        Rules:
-        - Actively retrieve and analyze information from official URLs in the context
-        - Verify information currency and note any discrepancies
-        - Integrate web-sourced details with context data
-        - Cite specific sources for key information
-        - Maintain accuracy while synthesizing multiple information sources
-        - Do not use any outside knowledge unless it comes from the `context` or from the official URLs listed in the `context`
-        - Be friendly, clear, and concise in your responses
-        - Always respond as if you are speaking to a resident of Washington State
-        - Do not speculate or invent information.
-        - Verify information currency and note any discrepancies.
-
-        At the end of your response, include a short, plain-language summary labeled **"XXYZ:"** that only refers to the text returned for the answer to the question but helps the resident understand what to do next or what the key takeaway is.
-
-        Example format:
-        ---
-        **Apply for unemployment benefits**  
-        You can apply for unemployment benefits and submit weekly claims.  
-        🔗 https://secure.esd.wa.gov/home/  
-        🏷️ Category: Work | Audience: Individuals | Agency: Department of Employment Security
-
-        Details from context and webpage analysis:
-        - Application methods: Online portal, phone application available
-        - Required documents: 
-        * Social Security card
-        * Driver's license or state ID
-        * Employment history (18 months)
-        * Bank information for direct deposit
-        - Current processing time: 1-3 business days
-        - Support options:
-        * Phone: 800-318-6022 (Mon-Fri, 8am-4pm)
-        * Online chat available
-        - Weekly claim requirements
-        - Current benefit calculator tool available
-
-        **XXYZ:** Apply online with required documents ready. Expect 1-3 days processing. Call 800-318-6022 for help.
-        ---
-
-        Conversation History (for reference only; do not use as a source of truth):
-        {chat_history}
-
-        Context:
-        {context}
-
-        User Question:
-        {userQuery}
-
-        Answer:
-        """
+def finish_streamed_answer(userQuery, output_text, start_time, chat_handler, s3_client, model_id, mode, report_mode, tag, bucket_name, object_key_path, cohort_name, batch_mode):
+    """Chat history and report write once a streamed (or voice bot) answer is complete."""
+    if not batch_mode:
+        chat_handler.add_message("human", userQuery)
+        chat_handler.add_message("ai", output_text)
+
+    end_time = time.time()
+    elapsed_time = end_time - start_time
+    runTime = f"Elapsed time: {elapsed_time:.4f} seconds"
+    
+    if report_mode:
+        filename = generate_json_filename(tag)
+        object_key=f"{object_key_path}{cohort_name}_{filename}"
+        content= build_json_string(question = userQuery, response=output_text, timetorun=runTime, model=model_id, bot_type = mode, cohort_tag=cohort_name)
+        s3_client.put_object(Bucket=bucket_name, Key=object_key, Body=content)
+
+def answer_query_talkie(user_input, chat_handler, bedrock, bedrock_agent_runtime_client,s3_client, openai_client,model_id, kb_id, mode,report_mode=False, tag="wabotpoc", bucket_name="watech-rppilot-bronze",object_key_path="evaluation_data/users/", cohort = "user", batch_mode=False, context=None):
+
+    start_time = time.time()
+    cohort_name=str(cohort).strip().lower() 
+    userQuery = user_input
+
+    prompt_data = build_talkie_prompt(userQuery, chat_handler, bedrock_agent_runtime_client, model_id, kb_id, mode, batch_mode, context)
 
     #if model_id == 'us.amazon.nova-pro-v1:0':
     if model_id.find("nova")!=-1:
@@ -750,26 +943,153 @@ def answer_query_talkie(user_input, chat_handler, bedrock, bedrock_agent_runtime
         agent_id = "WYNNZUBAH3"
         agent_alias_id = "JIFVQV4MZK"
         #send_prompt_to_agent(client, agent_id,agent_alias_id, prompt):
-        output_text= send_prompt_to_agent(bedrock_agent_runtime_client,agent_id, agent_alias_id, userQuery)
-    if not batch_mode:
-        chat_handler.add_message("human", userQuery)
-        chat_handler.add_message("ai", output_text)
+        output_text= send_prompt_to_agent(bedrock_agent_runtime_client,agent_id, agent_alias_id, userQuery, agent_session_for(chat_handler, model_id, batch_mode))
 
-    end_time = time.time()
-    elapsed_time = end_time - start_time
-    runTime = f"Elapsed time: {elapsed_time:.4f} seconds"
-    #output_text = f"{output_text}\n\nModel used: {model_id}\n\nbot type: {mode}\n\nTime to run: {runTime}\n\n"
-    
-    if report_mode:
-        filename = generate_json_filename(tag)
-        #object_key=f"{object_key_path}{filename}_{cohort_name}"
-        object_key=f"{object_key_path}{cohort_name}_{filename}"
-        #content= build_json_string(question = userQuery, prompt=prompt_data, response=output_text, timetorun=runTime, model=model_id, bot_type = mode, cohort_tag=cohort_name)
-        content= build_json_string(question = userQuery, response=output_text, timetorun=runTime, model=model_id, bot_type = mode, cohort_tag=cohort_name)
-        s3_client.put_object(Bucket=bucket_name, Key=object_key, Body=content)
-        
+    finish_streamed_answer(userQuery, output_text, start_time, chat_handler, s3_client, model_id, mode, report_mode, tag, bucket_name, object_key_path, cohort_name, batch_mode)
     return output_text
 
+def answer_query_talkie_stream(user_input, chat_handler, bedrock, bedrock_agent_runtime_client,s3_client, openai_client,model_id, kb_id, mode,report_mode=False, tag="wabotpoc", bucket_name="watech-rppilot-bronze",object_key_path="evaluation_data/users/", cohort = "user", batch_mode=False, context=None):
+    """
+    Streaming version of answer_query_talkie: yields the answer in chunks as the model
+    generates it, so speech can start before the answer is complete. Chat history and
+    the report are written once the stream is exhausted.
+    """
+    start_time = time.time()
+    cohort_name=str(cohort).strip().lower() 
+    userQuery = user_input
+
+    prompt_data = build_talkie_prompt(userQuery, chat_handler, bedrock_agent_runtime_client, model_id, kb_id, mode, batch_mode, context)
+
+    chunks = []
+    agent_session_id = agent_session_for(chat_handler, model_id, batch_mode)
+    for chunk in stream_model_response(bedrock, bedrock_agent_runtime_client, openai_client, model_id, prompt_data, userQuery, agent_session_id):
+        chunks.append(chunk)
+        yield chunk
+
+    finish_streamed_answer(userQuery, "".join(chunks), start_time, chat_handler, s3_client, model_id, mode, report_mode, tag, bucket_name, object_key_path, cohort_name, batch_mode)
+
+
+def answer_query_agent_stream(user_input, chat_handler, bedrock_agent_runtime_client, s3_client, model_id, mode, report_mode=False, tag="wabotpoc", bucket_name="watech-rppilot-bronze",object_key_path="evaluation_data/users/", cohort = "user", trace=None):
+    """
+    Ask the Bedrock Agent in the conversation's agent session and yield its answer
+    as it streams (e.g. into st.write_stream). Pass an AgentTrace as trace to time
+    the agent's orchestration steps. Chat history and the report are written once
+    the stream is exhausted; errors from invoke_agent propagate to the caller
+    (nothing is written for a failed turn).
+    """
+    start_time = time.time()
+    cohort_name=str(cohort).strip().lower() 
+    userQuery = user_input
+
+    agent_id = "WYNNZUBAH3"
+    agent_alias_id = "JIFVQV4MZK"
+    session_id = _agent_sessions.session_for(chat_handler.session_id)
+
+    chunks = []
+    for chunk in stream_agent_response(bedrock_agent_runtime_client, agent_id, agent_alias_id, userQuery, session_id, trace):
+        chunks.append(chunk)
+        yield chunk
+
+    finish_streamed_answer(userQuery, "".join(chunks), start_time, chat_handler, s3_client, model_id, mode, report_mode, tag, bucket_name, object_key_path, cohort_name, False)
+
+_compare_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="compare")
+
+def write_report_records(s3_client, records, bucket_name="watech-rppilot-bronze"):
+    """Write a batch of (object key, JSON record) report entries in parallel, one object each."""
+    def put(entry):
+        object_key, content = entry
+        try:
+            s3_client.put_object(Bucket=bucket_name, Key=object_key, Body=content)
+        except Exception as e:
+            print(f"Report write failed for {object_key}: {str(e)}")
+    list(_compare_pool.map(put, records))
+
+def compare_models(user_input, model_ids, chat_handler, bedrock, bedrock_agent_runtime_client, s3_client, openai_client, kb_id, mode, report_mode=False, tag="wabotpoc", bucket_name="watech-rppilot-bronze",object_key_path="evaluation_data/users/", cohort = "user", model_progress=None, progress=None):
+    """
+    Ask several models the same question at once, for side-by-side comparison.
+
+    Retrieval and prompt assembly run once and every model gets the same prompt;
+    the models then stream concurrently, so the comparison takes about as long as
+    the slowest model. model_ids are concrete models (not AUTO_MODEL_ID). Calls go
+    through the circuit breakers without fallback, so a failing model shows its
+    error rather than another model's answer. With report_mode, the records of all
+    models are written together once the last one has finished.
+
+    Args:
+        model_progress (dict): model id -> AnswerProgress receiving that model's streamed answer
+        progress (AnswerProgress): Stages of the comparison as a whole
+
+    Returns:
+        list: One dict per model, in model_ids order: model_id, output_text, error,
+              latency_seconds, first_chunk_seconds, input_tokens, output_tokens
+    """
+    cohort_name=str(cohort).strip().lower() 
+    userQuery = user_input
+    model_progress = model_progress or {}
+
+    report_stage(progress, STAGE_RETRIEVING)
+    context = get_answer_context(userQuery, bedrock_agent_runtime_client, model_ids[0], kb_id, mode)
+    report_stage(progress, STAGE_DETECTING_LANGUAGE)
+    prompt_data = assemble_answer_prompt(userQuery, context, chat_handler.get_conversation_string(), mode)
+    report_stage(progress, STAGE_GENERATING)
+
+    def run_model(model_id):
+        model_prog = model_progress.get(model_id)
+        report_stage(model_prog, STAGE_GENERATING)
+        usage = {}
+        first_chunk = []
+        start_time = time.monotonic()
+
+        def on_usage(counts):
+            # Claude reports usage twice (message start and end); the later counts are cumulative.
+            for key, value in counts.items():
+                usage[key] = max(usage.get(key, 0), value)
+
+        def call(candidate_model_id):
+            chunks = []
+            for chunk in stream_model_response(bedrock, bedrock_agent_runtime_client, openai_client, candidate_model_id, prompt_data, userQuery, agent_session_for(chat_handler, candidate_model_id), on_usage):
+                if not first_chunk:
+                    first_chunk.append(time.monotonic() - start_time)
+                if model_prog is not None:
+                    model_prog.append(chunk)
+                chunks.append(chunk)
+            return "".join(chunks)
+
+        output_text, error = None, None
+        try:
+            _, output_text = _circuit_breakers.call(model_id, call, False)
+        except Exception as e:
+            error = str(e)
+        result = {
+            "model_id": model_id,
+            "output_text": output_text,
+            "error": error,
+            "latency_seconds": time.monotonic() - start_time,
+            "first_chunk_seconds": first_chunk[0] if first_chunk else None,
+            "input_tokens": usage.get("input_tokens"),
+            "output_tokens": usage.get("output_tokens"),
+        }
+        if model_prog is not None:
+            model_prog.finish(result)
+        return result
+
+    results = list(_compare_pool.map(run_model, model_ids))
+
+    if report_mode:
+        report_stage(progress, STAGE_SAVING)
+        comparison_id = str(uuid.uuid4())
+        records = []
+        for result in results:
+            if result["output_text"] is None:
+                continue
+            runTime = f"Elapsed time: {result['latency_seconds']:.4f} seconds"
+            filename = generate_json_filename(tag)
+            content = build_answer_record(userQuery, format_answer_output(result["output_text"], result["model_id"], mode, runTime), runTime, result["model_id"], mode, cohort_name,
+                                          comparison_id=comparison_id, first_chunk_seconds=result["first_chunk_seconds"], input_tokens=result["input_tokens"], output_tokens=result["output_tokens"])
+            records.append((f"{object_key_path}{cohort_name}_{filename}", content))
+        write_report_records(s3_client, records, bucket_name)
+
+    return results
 
 def answer_query_txt(user_input, chat_handler, bedrock, bedrock_agent_runtime_client, s3_client, model_id, kb_id, mode,
                  report_mode=False, tag="wabotpoc", bucket_name="watech-rppilot-bronze",
@@ -796,7 +1116,7 @@ def answer_query_txt(user_input, chat_handler, bedrock, bedrock_agent_runtime_cl
 
     chat_history = "NONE" if batch_mode else chat_handler.get_conversation_string()
 
-    detected_language_code = detect(userQuery)
+    detected_language_code = detect_language(userQuery)
     detected_language_name = language_map.get(detected_language_code, "Unknown")
 
     # Load prompt template from external file
@@ -932,13 +1252,21 @@ def answer_query_txt(user_input, chat_handler, bedrock, bedrock_agent_runtime_cl
         
 #     return output_text
 
-def assess_answer_query(user_query, response, response_model, bedrock, bedrock_agent_runtime_client,s3_client,openai_client, model_id, batch_mode=False): #,report_mode=False, tag="wabotpoc", bucket_name="watech-rppilot-bronze",object_key_path="evaluation_data/users/", cohort = "user", batch_mode=False):
+def assess_answer_query(user_query, response, response_model, bedrock, bedrock_agent_runtime_client,s3_client,openai_client, model_id, batch_mode=False, judge_cache=None): #,report_mode=False, tag="wabotpoc", bucket_name="watech-rppilot-bronze",object_key_path="evaluation_data/users/", cohort = "user", batch_mode=False):
 
     start_time = time.time()
     if batch_mode:
         report_style="Return the answer as a .json readable object"
     else:
         report_style="Return the answer in readable report."
+
+    # The report style changes the judge output format, so it is part of the prompt version.
+    prompt_version = f"{JUDGE_PROMPT_VERSION}:{'json' if batch_mode else 'report'}"
+    cache_key = None
+    cached_output = None
+    if judge_cache is not None:
+        cache_key = judge_cache_key(user_query, response, model_id, prompt_version)
+        cached_output = judge_cache.get(cache_key)
     #cohort_name=str(cohort).strip().lower() 
     # language_map = {
     #     "en": "English", "pl": "Polish", "es": "Spanish",
@@ -993,7 +1321,9 @@ def assess_answer_query(user_query, response, response_model, bedrock, bedrock_a
         """
 
     #if model_id == 'us.amazon.nova-pro-v1:0':
-    if model_id.find("nova")!=-1:
+    if cached_output is not None:
+        output_text = cached_output
+    elif model_id.find("nova")!=-1:
         output_text = get_response(bedrock, model_id, prompt_data)
     elif model_id.find("claude")!=-1:
         output_text = get_response_claude(bedrock, model_id, prompt_data)
@@ -1006,6 +1336,9 @@ def assess_answer_query(user_query, response, response_model, bedrock, bedrock_a
         agent_alias_id = "JIFVQV4MZK"
         #send_prompt_to_agent(client, agent_id,agent_alias_id, prompt):
         output_text= send_prompt_to_agent(bedrock_agent_runtime_client,agent_id, agent_alias_id, user_query)
+
+    if cache_key is not None and cached_output is None and output_text is not None:
+        judge_cache.put(cache_key, output_text, judge_model=model_id, prompt_version=prompt_version)
     # if not batch_mode:
     #     chat_handler.add_message("human", userQuery)
     #     chat_handler.add_message("ai", output_text)
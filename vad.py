@@ -0,0 +1,91 @@
+"""
+Energy-based voice activity detection for the voice bot.
+
+The browser recorder stops only after `pause_threshold` seconds of silence, so
+every clip ends with that much silence and often starts with noise. Before
+speech recognition, trim_and_normalize cuts the clip to the speech it contains
+(plus a little padding) and peak-normalizes it, so the STT backend gets a
+shorter, consistently leveled clip.
+
+Frames are classified by their RMS energy against an adaptive threshold: the
+clip's noise floor (a low percentile of frame energies) plus a margin. This
+needs only numpy; it is the energy half of what WebRTC VAD does, without its
+spectral model, which is enough for trimming silence at the ends of a clip.
+
+If no frame clears the threshold (e.g. speech recorded around -55 dBFS, below
+min_threshold_db), the clip is passed on untrimmed rather than rejected, so the
+STT backend still gets to try it.
+
+    vad_input_seconds / vad_output_seconds   clip length before and after trimming
+"""
+
+import numpy as np
+
+from metrics import metrics as default_metrics
+
+SAMPLE_RATE = 16000
+
+
+def _to_float(pcm):
+    return np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32768.0
+
+
+def frame_energies_db(samples, sample_rate=SAMPLE_RATE, frame_ms=30):
+    """RMS energy of consecutive frames in dBFS."""
+    frame = int(sample_rate * frame_ms / 1000)
+    count = len(samples) // frame
+    if count == 0:
+        return np.empty(0), frame
+    frames = samples[:count * frame].reshape(count, frame)
+    rms = np.sqrt(np.mean(frames ** 2, axis=1))
+    return 20 * np.log10(rms + 1e-10), frame
+
+
+def speech_threshold_db(energies, margin_db=10.0, min_threshold_db=-50.0, headroom_db=20.0):
+    """
+    Speech/silence threshold for a clip: noise floor plus margin, but at least headroom_db
+    below the loudest frame (a clip with no silence has a "noise floor" made of quiet
+    speech) and never below min_threshold_db.
+    """
+    noise_floor = np.percentile(energies, 10)
+    return max(min(noise_floor + margin_db, energies.max() - headroom_db), min_threshold_db)
+
+
+def trim_and_normalize(pcm, sample_rate=SAMPLE_RATE, frame_ms=30, padding_ms=200, target_peak_db=-3.0,
+                       max_gain_db=20.0, registry=None, **threshold_kwargs):
+    """
+    Trim leading and trailing non-speech and peak-normalize 16-bit mono PCM.
+
+    Args:
+        pcm (bytes): 16-bit little-endian mono PCM
+        padding_ms (int): Audio kept before the first and after the last speech frame
+        target_peak_db (float): Peak level after normalization, in dBFS
+        max_gain_db (float): Upper bound on the gain, so near-silent clips are not blown up into noise
+
+    Returns:
+        bytes: Trimmed, normalized PCM; the input unchanged if no frame was classified as speech
+    """
+    registry = registry or default_metrics
+    samples = _to_float(pcm)
+    energies, frame = frame_energies_db(samples, sample_rate, frame_ms)
+    if not energies.size:
+        return pcm
+
+    speech = np.flatnonzero(energies > speech_threshold_db(energies, **threshold_kwargs))
+    registry.observe("vad_input_seconds", len(samples) / sample_rate)
+    if not speech.size:
+        # Too quiet to tell speech from silence; let the recognizer decide.
+        registry.observe("vad_output_seconds", len(samples) / sample_rate)
+        return pcm
+
+    padding = int(padding_ms / frame_ms)
+    start = max(0, speech[0] - padding) * frame
+    end = min(len(energies), speech[-1] + 1 + padding) * frame
+    trimmed = samples[start:end]
+
+    peak = np.abs(trimmed).max()
+    gain = min(10 ** (target_peak_db / 20) / peak, 10 ** (max_gain_db / 20)) if peak > 0 else 1.0
+    output = np.clip(trimmed * gain, -1.0, 32767 / 32768)
+    registry.observe("vad_output_seconds", len(output) / sample_rate)
+    return (output * 32768).astype("<i2").tobytes()
+